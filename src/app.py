@@ -1,10 +1,15 @@
+import catalog
+import files
 import json
+import multiprocessing
 import os
 import parameter
+import parameter_schema
 import pastaq
 import pipeline
 import platform
 import resources
+import sweep
 import sys
 import time
 import webbrowser
@@ -12,7 +17,7 @@ from PyQt5.QtCore import QSize, Qt, QTimer
 from PyQt5.QtGui import QIcon, QKeySequence, QPalette, QColor, QPixmap
 from PyQt5.QtWidgets import QMessageBox, QMainWindow, QVBoxLayout, QLabel, QSplashScreen
 from PyQt5.QtWidgets import QPushButton, QFileDialog, QApplication, QHBoxLayout
-from PyQt5.QtWidgets import QWidget, QAction, QLineEdit, QFormLayout, QFrame, QDesktopWidget
+from PyQt5.QtWidgets import QWidget, QAction, QLineEdit, QFormLayout, QFrame, QDesktopWidget, QCheckBox, QSpinBox
 from configparser import ConfigParser
 from pathlib import Path
 from time import time, sleep
@@ -103,7 +108,14 @@ class MainWindow(QMainWindow):
 
         # Run button
         self.init_run()
-        layout.addWidget(self.run_btn)
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(self.run_btn)
+        run_layout.addWidget(self.parameters_container.estimate_label)
+        run_layout.addWidget(QLabel('Workers'))
+        run_layout.addWidget(self.workers_box)
+        run_layout.addWidget(self.isolated_check)
+        run_layout.addWidget(self.cache_check)
+        layout.addLayout(run_layout)
 
         container = QWidget()
         container.setLayout(layout)
@@ -206,17 +218,49 @@ class MainWindow(QMainWindow):
         self.run_btn.clicked.connect(self.run_pipeline)
         self.run_btn.setEnabled(False)
         self.parameters_container.set_run_btn(self.run_btn)
+        self.parameters_container.sweep_btn.clicked.connect(self.run_sweep)
+
+        self.isolated_check = QCheckBox('Run in separate process')
+        self.isolated_check.setToolTip(
+            'Run the pipeline in its own process, so cancelling frees its cores and memory immediately')
+        self.isolated_check.setChecked(True)
+        self.isolated_check.toggled.connect(self.set_isolated)
+
+        self.cache_check = QCheckBox('Reuse cached stages')
+        self.cache_check.setToolTip(
+            'Only rerun the stages whose input files or parameters changed since the last run')
+        self.cache_check.setChecked(True)
+        self.cache_check.toggled.connect(self.set_cache)
+
+        self.workers_box = QSpinBox()
+        self.workers_box.setRange(0, 256)
+        self.workers_box.setSpecialValueText('Auto')
+        self.workers_box.setToolTip('Number of pipeline stages running at the same time (Auto: one per core)')
+        self.workers_box.valueChanged.connect(self.set_workers)
 
     def set_project_name(self):
-        self.parameters_container.parameters['project_name'] = self.project_name_ui.text()
-        self.parameters_container.set_saved(False)
+        if self.parameters_container.parameter_model.set('project_name', self.project_name_ui.text()):
+            self.parameters_container.set_saved(False)
 
     def set_project_description(self):
-        self.parameters_container.parameters['project_description'] = self.project_description_ui.text()
-        self.parameters_container.set_saved(False)
+        if self.parameters_container.parameter_model.set('project_description', self.project_description_ui.text()):
+            self.parameters_container.set_saved(False)
+
+    def set_isolated(self, isolated):
+        if self.parameters_container.parameter_model.set('pipeline_isolated', isolated):
+            self.parameters_container.set_saved(False)
+
+    def set_cache(self, cache):
+        if self.parameters_container.parameter_model.set('pipeline_cache', cache):
+            self.parameters_container.set_saved(False)
+
+    def set_workers(self, workers):
+        if self.parameters_container.parameter_model.set('pipeline_workers', workers):
+            self.parameters_container.set_saved(False)
 
     def set_params_path(self):
-        self.parameters_container.parameters['params_path'] = self.parameters_container.get_file_processor.params[1]
+        self.parameters_container.parameter_model.set('params_path',
+                                                      self.parameters_container.get_file_processor.params[1])
         self.parameters_container.set_saved(False)
 
     # Menu action that resets all parameters to default value.
@@ -278,134 +322,20 @@ class MainWindow(QMainWindow):
         if 'params_path' in self.parameters_container.parameters:
             self.parameters_container.set_params_path(self.parameters_container.parameters['params_path'])
 
-    # Updating the parameters for the instrument section
-    def update_inst(self, params):
-        self.parameters_container.inst_type.setCurrentText(params['instrument_type'])
-        self.parameters_container.res_ms1.setValue(params['resolution_ms1'])
-        self.parameters_container.res_ms2.setValue(params['resolution_msn'])
-        self.parameters_container.reference_mz.setValue(params['reference_mz'])
-        self.parameters_container.avg_fwhm_rt.setValue(params['avg_fwhm_rt'])
-
-    def update_raw(self, params):
-        self.parameters_container.min_mz.setValue(params['min_mz'])
-        self.parameters_container.max_mz.setValue(params['max_mz'])
-        self.parameters_container.min_rt.setValue(params['min_rt'])
-        self.parameters_container.max_rt.setValue(params['max_rt'])
-        self.parameters_container.polarity.setCurrentText(params['polarity'])
-
-    def update_resamp(self, params):
-        self.parameters_container.num_samples_mz.setValue(params['num_samples_mz'])
-        self.parameters_container.num_samples_rt.setValue(params['num_samples_rt'])
-        self.parameters_container.smoothing_coefficient_mz.setValue(params['smoothing_coefficient_mz'])
-        self.parameters_container.smoothing_coefficient_rt.setValue(params['smoothing_coefficient_rt'])
-        self.parameters_container.max_peaks.setValue(params['max_peaks'])
-        self.parameters_container.feature_detection_charge_state_min.setValue(
-            min(params['feature_detection_charge_states']))
-        self.parameters_container.feature_detection_charge_state_max.setValue(
-            max(params['feature_detection_charge_states']))
-
-    def update_warp(self, params):
-        self.parameters_container.warp2d_slack.setValue(params['warp2d_slack'])
-        self.parameters_container.warp2d_window_size.setValue(params['warp2d_window_size'])
-        self.parameters_container.warp2d_num_points.setValue(params['warp2d_num_points'])
-        self.parameters_container.warp2d_rt_expand_factor.setValue(params['warp2d_rt_expand_factor'])
-        self.parameters_container.warp2d_peaks_per_window.setValue(params['warp2d_peaks_per_window'])
-
-    def update_meta(self, params):
-        self.parameters_container.metamatch_fraction.setValue(params['metamatch_fraction'])
-        self.parameters_container.metamatch_n_sig_mz.setValue(params['metamatch_n_sig_mz'])
-        self.parameters_container.metamatch_n_sig_rt.setValue(params['metamatch_n_sig_rt'])
-
-    def update_ident(self, params):
-        if params['ident_max_rank_only']:
-            self.parameters_container.ident_max_rank_only.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.ident_max_rank_only.setCheckState(Qt.Unchecked)
-        if params['ident_require_threshold']:
-            self.parameters_container.ident_require_threshold.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.ident_require_threshold.setCheckState(Qt.Unchecked)
-        if params['ident_ignore_decoy']:
-            self.parameters_container.ident_ignore_decoy.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.ident_ignore_decoy.setCheckState(Qt.Unchecked)
-        self.parameters_container.link_n_sig_mz.setValue(params['link_n_sig_mz'])
-        self.parameters_container.link_n_sig_rt.setValue(params['link_n_sig_rt'])
-        self.parameters_container.similarity_num_peaks.setValue(params['similarity_num_peaks'])
-
-    def update_qual(self, params):
-        self.parameters_container.qc_plot_palette.setCurrentText(params['qc_plot_palette'])
-        self.parameters_container.qc_plot_extension.setCurrentText(params['qc_plot_extension'])
-        if params['qc_plot_fill_alpha'] == 'dynamic':
-            self.parameters_container.qc_plot_fill_alpha.setValue(0.0)
-        else:
-            self.parameters_container.qc_plot_fill_alpha.setValue(params['qc_plot_fill_alpha'])
-        self.parameters_container.qc_plot_line_alpha.setValue(params['qc_plot_line_alpha'])
-        self.parameters_container.qc_plot_scatter_alpha.setValue(params['qc_plot_scatter_alpha'])
-        self.parameters_container.qc_plot_scatter_size.setValue(params['qc_plot_scatter_size'])
-        self.parameters_container.qc_plot_min_dynamic_alpha.setValue(params['qc_plot_min_dynamic_alpha'])
-        if params['qc_plot_per_file']:
-            self.parameters_container.qc_plot_per_file.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.qc_plot_per_file.setCheckState(Qt.Unchecked)
-        self.parameters_container.qc_plot_line_style.setCurrentText(params['qc_plot_line_style'])
-        self.parameters_container.qc_plot_dpi.setValue(params['qc_plot_dpi'])
-        self.parameters_container.qc_plot_font_family.setCurrentText(params['qc_plot_font_family'])
-        self.parameters_container.qc_plot_font_size.setValue(params['qc_plot_font_size'])
-        self.parameters_container.qc_plot_fig_size_x.setValue(params['qc_plot_fig_size_x'])
-        self.parameters_container.qc_plot_fig_size_y.setValue(params['qc_plot_fig_size_y'])
-        if params['qc_plot_fig_legend']:
-            self.parameters_container.qc_plot_fig_legend.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.qc_plot_fig_legend.setCheckState(Qt.Unchecked)
-        self.parameters_container.qc_plot_mz_vs_sigma_mz_max_peaks.setValue(params['qc_plot_mz_vs_sigma_mz_max_peaks'])
-
-    def update_quantt(self, params):
-        self.parameters_container.quant_isotopes.setCurrentText(params['quant_isotopes'])
-        self.parameters_container.quant_features.setCurrentText(params['quant_features'])
-        if params['quant_features_charge_state_filter']:
-            self.parameters_container.quant_features_charge_state_filter.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.quant_features_charge_state_filter.setCheckState(Qt.Unchecked)
-        self.parameters_container.quant_ident_linkage.setCurrentText(params['quant_ident_linkage'])
-        if params['quant_consensus']:
-            self.parameters_container.quant_consensus.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.quant_consensus.setCheckState(Qt.Unchecked)
-        self.parameters_container.quant_consensus_min_ident.setValue(params['quant_consensus_min_ident'])
-        if params['quant_save_all_annotations']:
-            self.parameters_container.quant_save_all_annotations.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.quant_save_all_annotations.setCheckState(Qt.Unchecked)
-        self.parameters_container.quant_proteins_min_peptides.setValue(params['quant_proteins_min_peptides'])
-        if params['quant_proteins_remove_subset_proteins']:
-            self.parameters_container.quant_proteins_remove_subset_proteins.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.quant_proteins_remove_subset_proteins.setCheckState(Qt.Unchecked)
-        if params['quant_proteins_ignore_ambiguous_peptides']:
-            self.parameters_container.quant_proteins_ignore_ambiguous_peptides.setCheckState(Qt.Checked)
-        else:
-            self.parameters_container.quant_proteins_ignore_ambiguous_peptides.setCheckState(Qt.Unchecked)
-        self.parameters_container.quant_proteins_quant_type.setCurrentText(params['quant_proteins_quant_type'])
-
     def update_ui(self, default=False):
         # Project metadata.
         self.update_meta_project()
         if default:
             params = self.default_param
+            self.parameters_container.reset_parameters(params)
         else:
             params = self.parameters_container.parameters
 
-        self.parameters_container.update_allowed = False
-        self.update_inst(params)
-        self.update_raw(params)
-        self.update_resamp(params)
-        self.update_warp(params)
-        self.update_meta(params)
-        self.update_ident(params)
-        self.update_qual(params)
-        self.update_quantt(params)
-        self.parameters_container.update_allowed = True
+        self.isolated_check.setChecked(params.get('pipeline_isolated', True))
+        self.cache_check.setChecked(params.get('pipeline_cache', True))
+        self.workers_box.setValue(params.get('pipeline_workers', 0))
+        # the pages of the parameters tab that are built show the parameters
+        self.parameters_container.show_parameters()
 
     # Creates a new project at the specified folder
     def new_project(self):
@@ -424,6 +354,7 @@ class MainWindow(QMainWindow):
     # Enables the features of the UI once a project is created
     def prepare_new_project(self, dir_path):
         self.project_path = os.path.join(dir_path, 'parameters.json')
+        self.parameters_container.set_catalog(self.get_catalog_path())
         self.parameters_container.parameters = pastaq.default_parameters('orbitrap', 10)
         self.save_project_btn.setEnabled(True)
         self.save_project_as_btn.setEnabled(True)
@@ -443,16 +374,20 @@ class MainWindow(QMainWindow):
         if len(file_path) > 0:
             os.chdir(os.path.dirname(file_path))
             tmp = json.loads(open(file_path).read())
-            # TODO: Validate parameters
             self.prepare_open_project(tmp, file_path)
             self.prepare_paths_tab()
             self.update_ui()
             self.parameters_container.set_saved(True)
+            errors = self.parameters_container.validate()
+            if errors:
+                files.popup_window('Invalid parameters', QMessageBox.Warning,
+                                   'Fix these parameters before running the pipeline:\n\n' + '\n'.join(errors))
 
     # Enables the features of the UI once a project is opened
     def prepare_open_project(self, tmp, file_path):
         self.parameters_container.parameters = tmp
         self.project_path = file_path
+        self.parameters_container.set_catalog(self.get_catalog_path())
         self.save_project_btn.setEnabled(True)
         self.save_project_as_btn.setEnabled(True)
         self.parameters_container.check_run_btn()
@@ -463,6 +398,18 @@ class MainWindow(QMainWindow):
             self.parameters_container.update_input_files(self.parameters_container.parameters['input_files'])
         if 'params_path' in self.parameters_container.parameters:
             self.parameters_container.load_params(self.parameters_container.parameters['params_path'])
+        self.parameters_container.load_identification_settings(
+            self.parameters_container.parameters.get('ident_workers', 0),
+            self.parameters_container.parameters.get('ident_conversions', 0),
+            self.parameters_container.parameters.get('ident_converter', files.CONVERTERS[0]),
+            self.parameters_container.parameters.get('ident_all_or_nothing', True),
+            self.parameters_container.parameters.get('ident_batched', False),
+            self.parameters_container.parameters.get('ident_shard_spectra', 0))
+
+    # the file catalog is stored next to parameters.json
+    def get_catalog_path(self):
+        project_dir = os.path.dirname(self.project_path)
+        return os.path.join(project_dir, catalog.CATALOG_FILE) if project_dir else None
 
     # creates config path
     def get_config_path(self):
@@ -511,9 +458,15 @@ class MainWindow(QMainWindow):
     # Stores the project in a json file
     def save_json(self):
         with open(self.project_path, 'w') as json_file:
-            params_values = self.parameters_container.parameters
+            params_values = parameter_schema.complete(self.parameters_container.parameters)
             params_values['input_files'] = self.parameters_container.input_files
             params_values['params_path'] = self.file_processor.params[1]
+            params_values['ident_workers'] = self.file_processor.workers
+            params_values['ident_conversions'] = self.file_processor.conversions
+            params_values['ident_converter'] = self.file_processor.converter
+            params_values['ident_all_or_nothing'] = self.file_processor.all_or_nothing
+            params_values['ident_batched'] = self.file_processor.batched
+            params_values['ident_shard_spectra'] = self.file_processor.shard_spectra
             json.dump(params_values, json_file)
 
     # Stores the paths in a config file
@@ -553,6 +506,9 @@ class MainWindow(QMainWindow):
                 event.ignore()
             else:
                 event.accept()
+        # the catalog refresh has to stop before the window is gone
+        if event.isAccepted():
+            self.parameters_container.close_catalog()
 
     # Saves the project to a new directory
     def save_project_as(self):
@@ -563,6 +519,7 @@ class MainWindow(QMainWindow):
         )
         if len(path) > 0:
             self.project_path = os.path.join(path, 'parameters.json')
+            self.parameters_container.set_catalog(self.get_catalog_path())
             self.update_ui()
             self.save_project()
             self.parameters_container.set_saved(True)
@@ -579,12 +536,15 @@ class MainWindow(QMainWindow):
 
     # Creates the pipeline runner thread and modal
     def init_pipeline(self):
+        estimate = self.parameters_container.estimate()
         pipe = pipeline.PipelineLogDialog(
             parent=self,
-            params=self.parameters_container.parameters,
+            params=parameter_schema.complete(self.parameters_container.parameters),
             input_files=self.parameters_container.input_files,
             output_dir=os.path.dirname(self.project_path),
-            file_processor=self.parameters_container.get_file_processor())
+            file_processor=self.parameters_container.get_file_processor(),
+            changed_params=self.parameters_container.parameter_model.take_dirty(),
+            prediction=estimate.to_dict() if estimate else None)
         return pipe
 
     def restore_run(self):
@@ -593,10 +553,45 @@ class MainWindow(QMainWindow):
         self.parameters_container.check_run_btn()
         self.project_variables_container.setEnabled(True)
         self.parameters_container.setEnabled(True)
+        # the run may have been recorded, the estimates follow it
+        self.parameters_container.load_calibration(os.path.dirname(self.project_path))
+
+    # Runs variants of the parameters side by side and compares their results
+    # the stages the variants have in common run once, the project itself is left as it is
+    def run_sweep(self):
+        errors = self.parameters_container.validate()
+        if errors:
+            files.popup_window('Invalid parameters', QMessageBox.Warning, '\n'.join(errors))
+            return
+        params = parameter_schema.complete(self.parameters_container.parameters)
+        sweep_dialog = sweep.SweepDialog(params, parent=self)
+        if not sweep_dialog.exec():
+            return
+        self.prepare_run()
+
+        estimate = self.parameters_container.estimate()
+        pipeline_log_dialog = pipeline.PipelineLogDialog(
+            parent=self,
+            params=params,
+            input_files=self.parameters_container.input_files,
+            output_dir=os.path.dirname(self.project_path),
+            file_processor=self.parameters_container.get_file_processor(),
+            prediction=estimate.to_dict() if estimate else None,
+            variants=sweep_dialog.variants)
+        finished = pipeline_log_dialog.exec()
+        self.restore_run()
+        # the log dialog also finishes when the sweep failed, which leaves nothing to compare
+        if finished and pipeline_log_dialog.pipeline_thread.succeeded:
+            sweep.SweepResultsDialog(os.path.dirname(self.project_path), sweep_dialog.variants, parent=self).exec()
 
     # Runs the PASTAQ pipeline with the input files and parameters.
     # This creates a new thread for the pipeline that runs in parallel to the GUI thread.
     def run_pipeline(self):
+        # parameters that are certain to fail the pipeline stop it before anything runs
+        errors = self.parameters_container.validate()
+        if errors:
+            files.popup_window('Invalid parameters', QMessageBox.Warning, '\n'.join(errors))
+            return
         self.prepare_run()
 
         # Open modal with log progress and cancel button and run pipeline
@@ -630,6 +625,11 @@ class SplashScreen(QSplashScreen):
 
 
 def main():
+    # the frozen executable also serves as the worker processes of the pipeline
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 2 and sys.argv[1] == pipeline.WORKER_FLAG:
+        sys.exit(pipeline.run_job(sys.argv[2]))
+
     global app
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(':/icons/pastaq.png'))
@@ -0,0 +1,326 @@
+import collections
+import contextlib
+import files
+import json
+import os
+import rawscan
+import sqlite3
+import threading
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QThread, QTimer, pyqtSignal
+
+
+# Catalog of the input files of a project, stored next to its parameters.json
+CATALOG_FILE = 'catalog.sqlite'
+CATALOG_SCHEMA = '''CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    present INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    metadata TEXT
+)'''
+
+# Changes in watched folders are collected for this many milliseconds before their files are looked at again
+WATCH_DELAY = 500
+
+
+class FileEntry:
+    """
+    What the catalog knows about a file, as it was when the file was last looked at.
+    The hash and metadata are only valid for the size and modification time they were computed for.
+
+    Arguments:
+    - whether the file exists, None until the file was looked at
+    - size in bytes
+    - modification time in nanoseconds
+    - sha256 of the content
+    - details of the file, like the number of spectra of a .mgf or the range of the data of a raw file
+    """
+    def __init__(self, present, size=None, mtime_ns=None, hash=None, metadata=None):
+        self.present = present
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.hash = hash
+        self.metadata = metadata or {}
+
+    # entry of the file as it is now, keeps the hash and metadata if the file did not change
+    # stat is None for a file that does not exist
+    def update(self, stat):
+        if stat is None:
+            return self if self.present is False else FileEntry(False)
+        if self.present and stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns:
+            return self
+        return FileEntry(True, stat.st_size, stat.st_mtime_ns)
+
+
+# stat of a file, None if it does not exist
+def stat_file(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat if os.path.isfile(path) else None
+
+
+# stats of the files of a directory, from a single listing of the directory
+# names are looked up as they are, a file not found in the listing is looked at directly,
+# which covers file systems that ignore case
+def stat_directory(directory, paths):
+    if len(paths) == 1:
+        return {paths[0]: stat_file(paths[0])}
+    try:
+        with os.scandir(directory or '.') as entries:
+            listing = {entry.name: entry for entry in entries}
+    except OSError:
+        listing = {}
+    stats = {}
+    for path in paths:
+        entry = listing.get(os.path.basename(path))
+        try:
+            stats[path] = entry.stat() if entry and entry.is_file() else stat_file(path)
+        except OSError:
+            stats[path] = None
+    return stats
+
+
+# Details of a file that are cheap compared to hashing it
+# raw files are only scanned by FileCatalog.update_metadata, which scans them side by side
+def read_metadata(path):
+    metadata = {'format': os.path.splitext(path)[1].lower().lstrip('.')}
+    if metadata['format'] == 'mgf':
+        metadata['spectra'] = files.scan_mgf(path).spectra
+    return metadata
+
+
+class FileCatalog:
+    """
+    Size, modification time, content hash and metadata of the input files of a project.
+    The GUI only reads the entries kept in memory, a CatalogRefresher brings them up to date in
+    the background and stores the changed ones in a SQLite file, so files that did not change
+    are not hashed again when the project is opened later.
+
+    Arguments:
+    - path of the SQLite file, None to keep the catalog in memory only
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.changed = set()
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute(CATALOG_SCHEMA)
+        return connection
+
+    def load(self):
+        try:
+            with contextlib.closing(self.connect()) as connection:
+                rows = connection.execute('SELECT path, present, size, mtime_ns, hash, metadata FROM files').fetchall()
+        except sqlite3.Error as e:
+            print('File catalog {} could not be read: {}'.format(self.path, e))
+            return
+        for path, present, size, mtime_ns, hash, metadata in rows:
+            entry = FileEntry(None if present is None else bool(present), size, mtime_ns, hash,
+                              json.loads(metadata or '{}'))
+            self.entries[path] = entry
+            # the identification cache hashes the .mgf files again unless it knows them
+            if hash:
+                files.file_hashes[(os.path.abspath(path), size, mtime_ns)] = hash
+
+    # writes the entries that changed since the last save in a single transaction
+    def save(self):
+        with self.lock:
+            changed = {path: self.entries[path] for path in self.changed if path in self.entries}
+            self.changed = set()
+        if not self.path or not changed:
+            return
+        try:
+            with contextlib.closing(self.connect()) as connection, connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                    [(path, entry.present, entry.size, entry.mtime_ns, entry.hash, json.dumps(entry.metadata))
+                     for path, entry in changed.items()])
+        except sqlite3.Error as e:
+            print('File catalog {} could not be written: {}'.format(self.path, e))
+
+    def get(self, path):
+        with self.lock:
+            return self.entries.get(path)
+
+    def put(self, path, entry):
+        with self.lock:
+            if self.entries.get(path) is not entry:
+                self.entries[path] = entry
+                self.changed.add(path)
+
+    # whether the file exists, None while the catalog did not look at it yet
+    def exists(self, path):
+        entry = self.get(path)
+        return entry.present if entry else None
+
+    # content hash of the file, None until the catalog hashed it
+    def hash(self, path):
+        entry = self.get(path)
+        return entry.hash if entry else None
+
+    # looks at every file again with one listing per directory, returns whether any of them changed
+    def update_stats(self, paths):
+        directories = collections.defaultdict(list)
+        for path in paths:
+            directories[os.path.dirname(path)].append(path)
+        changed = False
+        for directory, directory_paths in directories.items():
+            for path, stat in stat_directory(directory, directory_paths).items():
+                entry = self.get(path) or FileEntry(None)
+                new_entry = entry.update(stat)
+                if new_entry is not entry:
+                    self.put(path, new_entry)
+                    changed = True
+        return changed
+
+    # range of the data of a raw file, None until its headers were scanned
+    def bounds(self, path):
+        entry = self.get(path)
+        return rawscan.data_bounds(entry.metadata) if entry else None
+
+    # scans the headers of the raw files that were not scanned yet side by side, which is quick
+    # compared to hashing them, so the range of their data is known early
+    def update_metadata(self, paths, stop=lambda: False):
+        entries = {path: self.get(path) for path in paths
+                   if os.path.splitext(path)[1].lower().lstrip('.') in rawscan.FORMATS}
+        entries = {path: entry for path, entry in entries.items()
+                   if entry and entry.present and 'spectra' not in entry.metadata}
+        if not entries or stop():
+            return False
+        changed = False
+        for path, scan in rawscan.scan_raws(list(entries)).items():
+            entry = entries[path]
+            # a file that changed during the scan is scanned again with its next entry
+            if self.get(path) is not entry:
+                continue
+            self.put(path, FileEntry(True, entry.size, entry.mtime_ns, entry.hash,
+                                     dict(entry.metadata, format=scan.format, **scan.metadata())))
+            changed = True
+        return changed
+
+    # hashes the files whose content is not known yet, stop is checked between files
+    def update_hashes(self, paths, stop=lambda: False):
+        changed = False
+        for path in paths:
+            if stop():
+                break
+            entry = self.get(path)
+            if not entry or not entry.present or entry.hash:
+                continue
+            try:
+                hash = files.file_hash(path)
+                metadata = entry.metadata or read_metadata(path)
+            except OSError:
+                continue
+            self.put(path, FileEntry(True, entry.size, entry.mtime_ns, hash, metadata))
+            changed = True
+        return changed
+
+
+class CatalogRefresher(QThread):
+    """
+    Brings the catalog up to date with the files on disk in the background.
+    Missing files are known after a quick pass over all files, the headers of new raw files
+    are scanned next and the slow hashing of new and changed files comes last.
+    A refresh requested while one runs starts another pass.
+
+    Arguments:
+    - file catalog
+    """
+    refreshed = pyqtSignal()
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.pending = {}
+        self.active = False
+        self.again = False
+        self.lock = threading.Lock()
+
+    # starts a pass over the given files, or another one after the running pass
+    def refresh(self, paths):
+        with self.lock:
+            self.pending.update(dict.fromkeys(paths))
+            if self.active:
+                self.again = True
+                return
+            self.active = True
+        # the thread may still be returning from its last pass
+        self.wait()
+        self.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                paths = list(self.pending)
+                self.pending = {}
+                self.again = False
+            if self.catalog.update_stats(paths):
+                self.refreshed.emit()
+            if self.catalog.update_metadata(paths, self.isInterruptionRequested):
+                self.refreshed.emit()
+            if self.catalog.update_hashes(paths, self.isInterruptionRequested):
+                self.refreshed.emit()
+            self.catalog.save()
+            with self.lock:
+                if not self.again or self.isInterruptionRequested():
+                    self.active = False
+                    return
+
+    # lets the running pass finish the file it is at
+    def stop(self):
+        self.requestInterruption()
+        self.wait()
+
+
+class CatalogWatcher(QObject):
+    """
+    Watches the directories of the input files, so the catalog hears about files that are
+    added, removed or renamed. Watching directories instead of files keeps the number of
+    watches small, changes are collected for a moment and then reported as the files to look at.
+    """
+    changed = pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self.directories = {}
+        self.pending = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(WATCH_DELAY)
+        self.timer.timeout.connect(self.report)
+
+    # watches the directories of the given files instead of the ones before
+    def watch(self, paths):
+        directories = collections.defaultdict(list)
+        for path in paths:
+            directories[os.path.dirname(path)].append(path)
+        watched = set(self.watcher.directories())
+        gone = [directory for directory in watched if directory not in directories]
+        if gone:
+            self.watcher.removePaths(gone)
+        # directories that do not exist can not be watched, they are tried again with the next files
+        new = [directory for directory in directories if directory not in watched and os.path.isdir(directory)]
+        if new:
+            self.watcher.addPaths(new)
+        self.directories = directories
+
+    def directory_changed(self, directory):
+        self.pending.add(directory)
+        self.timer.start()
+
+    def report(self):
+        paths = [path for directory in self.pending for path in self.directories.get(directory, [])]
+        self.pending = set()
+        if paths:
+            self.changed.emit(paths)
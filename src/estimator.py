@@ -0,0 +1,219 @@
+import datetime
+import json
+import math
+import os
+import statistics
+
+
+# Range of the data where the parameters do not limit it: m/z and retention time of a typical DDA run
+ASSUMED_BOUNDS = (300.0, 2000.0, 0.0, 7200.0)
+
+# Model of the resources of a stage task on a raw file, before it is calibrated with past runs
+# memory of a worker process before it loads anything
+WORKER_MEMORY = 200 * 1024 ** 2
+# memory and intermediate files per byte of raw file, the scans are held and written as doubles
+RAW_MEMORY = 1.0
+RAW_DISK = 1.0
+# the resampled grid and its smoothed copy, as doubles
+GRID_BYTES = 16
+# points of the grid per detected peak
+GRID_POINTS_PER_PEAK = 2000
+# memory per peak and disk per peak for the peaks, warped peaks and features files
+PEAK_MEMORY = 500
+PEAK_DISK = 600
+# seconds per byte of raw file, per point of the grid and per peak
+RAW_SECONDS = 2e-8
+GRID_SECONDS = 1e-7
+PEAK_SECONDS = 2e-5
+
+# The automatic number of samples per peak width stays within these, more samples do not improve the fit
+MIN_SAMPLES = 1
+MAX_SAMPLES = 10
+# Parameters the automatic number of samples depends on
+SAMPLING_PARAMS = ['instrument_type', 'resolution_ms1', 'reference_mz', 'avg_fwhm_rt', 'min_mz', 'max_mz', 'min_rt',
+                   'max_rt', 'num_samples_auto', 'grid_memory_budget']
+
+# Past runs of the project are recorded in this file in the output directory
+RUNS_FILE = 'run_history.json'
+RUNS_KEPT = 50
+# The calibration follows the most recent runs, so it adapts when the machine changes
+CALIBRATION_RUNS = 10
+QUANTITIES = ['memory', 'disk', 'time']
+
+
+# Points of the grid along m/z, pastaq places num_samples_mz points per peak width
+# and the width of a peak grows with its m/z in a way that depends on the instrument
+def mz_points(params, low, high):
+    resolution = params['resolution_ms1']
+    reference = params['reference_mz']
+    instrument = params['instrument_type'].lower()
+    if instrument == 'orbitrap':
+        widths = 2 * resolution * math.sqrt(reference) * (1 / math.sqrt(low) - 1 / math.sqrt(high))
+    elif instrument in ('ft-icr', 'fticr'):
+        widths = resolution * reference * (1 / low - 1 / high)
+    elif instrument == 'tof':
+        widths = resolution * math.log(high / low)
+    else:
+        widths = resolution * (high - low) / reference
+    return int(params['num_samples_mz'] * widths) + 1
+
+
+# Points of the grid along retention time, num_samples_rt per chromatographic peak width
+def rt_points(params, low, high):
+    return int(params['num_samples_rt'] * (high - low) / params['avg_fwhm_rt']) + 1
+
+
+# Points of the grid along m/z and retention time of a file with its data within the bounds
+# the grid only covers the part of the data within the window of the parameters
+def grid_size(params, bounds=ASSUMED_BOUNDS):
+    min_mz, max_mz = max(params['min_mz'], bounds[0]), min(params['max_mz'], bounds[1])
+    min_rt, max_rt = max(params['min_rt'], bounds[2]), min(params['max_rt'], bounds[3])
+    if min_mz >= max_mz or min_rt >= max_rt:
+        return 0, 0
+    return mz_points(params, min_mz, max_mz), rt_points(params, min_rt, max_rt)
+
+
+# Memory of the resampled grid of a file in bytes
+def grid_memory(params, bounds=ASSUMED_BOUNDS):
+    mz, rt = grid_size(params, bounds)
+    return mz * rt * GRID_BYTES
+
+
+# Most samples per peak width, the same in m/z and retention time, for which the grid of a file
+# within the bounds fits in the memory, the fewest samples if even those do not fit
+def tune_samples(params, memory, bounds=ASSUMED_BOUNDS):
+    samples = MIN_SAMPLES
+    while samples < MAX_SAMPLES and grid_memory(
+            dict(params, num_samples_mz=samples + 1, num_samples_rt=samples + 1), bounds) <= memory:
+        samples += 1
+    return samples
+
+
+# Stage workers of a run, automatically one per core and file but only as many as fit in memory
+def stage_workers(requested, files, task_memory=None, available=None):
+    if requested > 0:
+        return requested
+    workers = min(os.cpu_count() or 1, files)
+    if task_memory and available:
+        workers = min(workers, int(available // task_memory))
+    return max(1, workers)
+
+
+class Estimate:
+    """
+    Resources a run of the pipeline needs, from the resources of the stage tasks on each raw file.
+    The tasks of several files run side by side on the stage workers, so the peak memory is that of
+    the largest tasks running at once and the wall time is the work shared by the workers.
+
+    Arguments:
+    - points of the grid of each file, along m/z and retention time
+    - memory of the largest task on each file, in bytes
+    - intermediate files of the run, in bytes
+    - seconds of work on each file
+    - number of stage workers
+    """
+    def __init__(self, grids, memories, disk, seconds, workers=1):
+        self.grids = grids
+        self.memories = memories
+        self.disk = disk
+        self.seconds = seconds
+        self.workers = workers
+
+    @property
+    def task_memory(self):
+        return max(self.memories, default=0)
+
+    @property
+    def memory(self):
+        return sum(sorted(self.memories, reverse=True)[:max(1, self.workers)])
+
+    @property
+    def time(self):
+        return max(sum(self.seconds) / max(1, self.workers), max(self.seconds, default=0))
+
+    # the estimate corrected by the factors of a calibration
+    def scaled(self, factors):
+        return Estimate(self.grids, [memory * factors['memory'] for memory in self.memories],
+                        self.disk * factors['disk'], [seconds * factors['time'] for seconds in self.seconds],
+                        self.workers)
+
+    # what a run is compared with once it finished, the memory of a single task is what can be measured
+    def prediction(self):
+        return {'memory': self.task_memory, 'disk': self.disk, 'time': self.time}
+
+    def to_dict(self):
+        return {'grids': self.grids, 'memories': self.memories, 'disk': self.disk, 'seconds': self.seconds,
+                'workers': self.workers}
+
+    @staticmethod
+    def from_dict(values):
+        return Estimate([tuple(grid) for grid in values['grids']], values['memories'], values['disk'],
+                        values['seconds'], values.get('workers', 1))
+
+
+# Uncalibrated estimate of a run over raw files of the given sizes in bytes
+# bounds holds the range of the data of each file, the assumed range where it is not known
+def estimate(params, sizes, workers=1, bounds=None):
+    bounds = bounds or [ASSUMED_BOUNDS] * len(sizes)
+    grids, memories, seconds, disk = [], [], [], 0
+    for size, file_bounds in zip(sizes, bounds):
+        mz, rt = grid_size(params, file_bounds or ASSUMED_BOUNDS)
+        points = mz * rt
+        peaks = min(params['max_peaks'], points // GRID_POINTS_PER_PEAK)
+        grids.append((mz, rt))
+        memories.append(WORKER_MEMORY + size * RAW_MEMORY + points * GRID_BYTES + peaks * PEAK_MEMORY)
+        seconds.append(size * RAW_SECONDS + points * GRID_SECONDS + peaks * PEAK_SECONDS)
+        disk += size * RAW_DISK + peaks * PEAK_DISK
+    return Estimate(grids, memories, disk, seconds, workers)
+
+
+# Runs recorded in the output directory, oldest first
+def read_runs(output_dir):
+    try:
+        with open(os.path.join(output_dir, RUNS_FILE)) as runs_file:
+            runs = json.load(runs_file)
+    except (OSError, ValueError):
+        return []
+    return runs if isinstance(runs, list) else []
+
+
+# Records what a run was estimated to need and what it actually used, None where it was not measured
+def record_run(output_dir, predicted, observed):
+    runs = read_runs(output_dir)[-(RUNS_KEPT - 1):]
+    runs.append({'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'predicted': predicted, 'observed': observed})
+    try:
+        with open(os.path.join(output_dir, RUNS_FILE), 'w') as runs_file:
+            json.dump(runs, runs_file, indent=1)
+    except OSError as e:
+        print('Run history could not be written: {}'.format(e))
+
+
+class Calibration:
+    """
+    Corrects the model to what past runs of the project actually used on this machine.
+    Each factor is the median ratio of the measured to the estimated value over the recent runs,
+    so a single unusual run does not throw it off. Without runs the model is used as it is.
+
+    Arguments:
+    - recorded runs, oldest first
+    """
+    def __init__(self, runs=()):
+        runs = list(runs)[-CALIBRATION_RUNS:]
+        self.runs = len(runs)
+        self.factors = {}
+        for quantity in QUANTITIES:
+            ratios = []
+            for run in runs:
+                try:
+                    ratios.append(run['observed'][quantity] / run['predicted'][quantity])
+                except (KeyError, TypeError, ZeroDivisionError):
+                    continue
+            self.factors[quantity] = statistics.median(ratios) if ratios else 1.0
+
+    @staticmethod
+    def load(output_dir):
+        return Calibration(read_runs(output_dir) if output_dir else [])
+
+    def apply(self, estimate):
+        return estimate.scaled(self.factors)
@@ -0,0 +1,167 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QEvent, QModelIndex, QRect
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+
+# Columns of the input files table, the key of the input file each one shows
+COLUMNS = [
+    ('Raw File (mzXML/mzML)', 'raw_path'),
+    ('Identification file (mgf/mzID)', 'ident_path'),
+    ('Group', 'group'),
+    ('Reference', 'reference'),
+]
+REFERENCE_COLUMN = 3
+MISSING = '(missing) '
+
+
+class InputFilesModel(QAbstractTableModel):
+    """
+    Table model over the list of input files of the project, the list itself holds the data.
+    Adding, removing or changing rows only signals the rows concerned, so the view
+    only does work for them no matter how many files the project has.
+
+    Arguments:
+    - list of input files
+    - file catalog, to mark the files that are missing
+    """
+    def __init__(self, input_files, file_catalog, parent=None):
+        super().__init__(parent)
+        self.input_files = input_files
+        self.file_catalog = file_catalog
+        self.bold = QFont()
+        self.bold.setBold(True)
+        # whether the view shows each path as missing, so only the rows that change are signalled
+        self.shown_missing = self.missing_paths(input_files)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.input_files)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section][0]
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == REFERENCE_COLUMN:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    # whether the file of a path cell is missing, files the catalog did not look at yet are not
+    def missing(self, index):
+        path = self.input_files[index.row()].get(COLUMNS[index.column()][1])
+        return index.column() < 2 and path is not None and self.file_catalog.exists(path) is False
+
+    # whether each path of the rows is missing, by path
+    def missing_paths(self, input_files):
+        return {path: self.file_catalog.exists(path) is False for input_file in input_files
+                for path in (input_file.get(key) for _, key in COLUMNS[:2]) if path is not None}
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self.input_files[index.row()].get(COLUMNS[index.column()][1])
+        if index.column() == REFERENCE_COLUMN:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if value else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole:
+            if value is None:
+                return None
+            return MISSING + value if self.missing(index) else value
+        if role == Qt.ToolTipRole:
+            return value
+        if role == Qt.FontRole and self.missing(index):
+            return self.bold
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.column() != REFERENCE_COLUMN or role != Qt.CheckStateRole:
+            return False
+        self.input_files[index.row()]['reference'] = value == Qt.Checked
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    # replaces all files, for when a project is opened
+    def set_files(self, input_files):
+        self.beginResetModel()
+        self.input_files = input_files
+        self.shown_missing = self.missing_paths(input_files)
+        self.endResetModel()
+
+    def append_files(self, new_files):
+        if not new_files:
+            return
+        first = len(self.input_files)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_files) - 1)
+        self.input_files.extend(new_files)
+        self.shown_missing.update(self.missing_paths(new_files))
+        self.endInsertRows()
+
+    # removes the rows, each run of consecutive rows at once starting from the end
+    def remove_rows(self, rows):
+        rows = sorted(set(rows))
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.input_files[first:last + 1]
+            self.endRemoveRows()
+
+    # the files of the rows were changed in place
+    def update_rows(self, rows):
+        for row in rows:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    # the catalog learned which files are missing, only the rows with a path that appeared or went missing change
+    def update_missing(self):
+        missing = self.missing_paths(self.input_files)
+        changed = {path for path, state in missing.items() if self.shown_missing.get(path, False) != state}
+        self.shown_missing = missing
+        for row, input_file in enumerate(self.input_files):
+            if input_file.get('raw_path') in changed or input_file.get('ident_path') in changed:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, 1))
+
+
+class InputFileDelegate(QStyledItemDelegate):
+    """
+    Paints the reference checkbox in the middle of its cell and toggles it on click or space,
+    so the table needs no widget per row.
+    """
+    # rectangle of the checkbox, centered in the cell
+    @staticmethod
+    def check_rect(option):
+        style = QApplication.style()
+        size = style.subElementRect(QStyle.SE_CheckBoxIndicator, QStyleOptionButton(), None).size()
+        return QRect(option.rect.center().x() - size.width() // 2, option.rect.center().y() - size.height() // 2,
+                     size.width(), size.height())
+
+    def paint(self, painter, option, index):
+        if index.column() != REFERENCE_COLUMN:
+            return super().paint(painter, option, index)
+        style = QApplication.style()
+        # background and selection without the checkbox at its default place
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+        checkbox = QStyleOptionButton()
+        checkbox.rect = self.check_rect(option)
+        checkbox.state = QStyle.State_Enabled
+        checkbox.state |= QStyle.State_On if index.data(Qt.CheckStateRole) == Qt.Checked else QStyle.State_Off
+        style.drawControl(QStyle.CE_CheckBox, checkbox, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if index.column() != REFERENCE_COLUMN:
+            return super().editorEvent(event, model, option, index)
+        if event.type() == QEvent.MouseButtonRelease:
+            if event.button() != Qt.LeftButton or not self.check_rect(option).contains(event.pos()):
+                return False
+        elif event.type() == QEvent.MouseButtonDblClick:
+            return True
+        elif not (event.type() == QEvent.KeyPress and event.key() in (Qt.Key_Space, Qt.Key_Select)):
+            return False
+        checked = index.data(Qt.CheckStateRole) == Qt.Checked
+        return model.setData(index, Qt.Unchecked if checked else Qt.Checked, Qt.CheckStateRole)
@@ -1,13 +1,29 @@
 import buttons
+import collections
+import ctypes
+import hashlib
+import mmap
+import multiprocessing
 import inspect
 import os
+import platform
+import re
+import shutil
+import signal
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 from PyQt5 import QtGui
-from PyQt5.QtCore import Qt, QEvent
+from PyQt5.QtCore import Qt, QEvent, QStandardPaths, QThread, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox, QVBoxLayout, QDialogButtonBox
 from PyQt5.QtWidgets import QPushButton, QFileDialog, QDialog, QLabel,  QListWidget
-from PyQt5.QtWidgets import QWidget, QLineEdit, QFormLayout, QAction
+from PyQt5.QtWidgets import QWidget, QLineEdit, QFormLayout, QAction, QApplication, QProgressDialog
 from pathlib import Path
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
 
 
 # creates a popup
@@ -21,19 +37,746 @@ def popup_window(status, icon, text):
     return  # return is necessary regardless of sonarqube
 
 
+# Memory of an MSFragger instance when it is not estimated from its files
+MSFRAGGER_HEAP = 32 * 1024 ** 3
+# Estimate of the memory MSFragger needs: a base, the fragment index of the protein database,
+# which is many times the size of the database, and the spectra of the file it searches
+MSFRAGGER_MIN_HEAP = 4 * 1024 ** 3
+MSFRAGGER_BASE_HEAP = 2 * 1024 ** 3
+MSFRAGGER_HEAP_PER_DATABASE_BYTE = 400
+MSFRAGGER_HEAP_PER_MGF_BYTE = 4
+# Part of the free memory all MSFragger instances together may use
+MSFRAGGER_MEMORY_FRACTION = 0.8
+
+
+# Size in bytes as text
+def format_size(size):
+    if size < 1024 ** 3:
+        return '{:.0f} MB'.format(size / 1024 ** 2)
+    return '{:.1f} GB'.format(size / 1024 ** 3)
+
+
+# Free physical memory in bytes, None when it can not be determined
+def available_memory():
+    if platform.system() == 'Windows':
+        return windows_available_memory()
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# Free physical memory on Windows through GlobalMemoryStatusEx
+def windows_available_memory():
+    class MemoryStatus(ctypes.Structure):
+        _fields_ = [
+            ('dwLength', ctypes.c_ulong),
+            ('dwMemoryLoad', ctypes.c_ulong),
+            ('ullTotalPhys', ctypes.c_ulonglong),
+            ('ullAvailPhys', ctypes.c_ulonglong),
+            ('ullTotalPageFile', ctypes.c_ulonglong),
+            ('ullAvailPageFile', ctypes.c_ulonglong),
+            ('ullTotalVirtual', ctypes.c_ulonglong),
+            ('ullAvailVirtual', ctypes.c_ulonglong),
+            ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+        ]
+
+    status = MemoryStatus()
+    status.dwLength = ctypes.sizeof(MemoryStatus)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return None
+    return status.ullAvailPhys
+
+
+# Identifications of earlier runs are stored in this directory of the cache directory of the user,
+# the install directory may be read only and is temporary in a frozen build
+IDENT_CACHE_DIR = os.path.join('PASTAQ-GUI', 'identification_cache')
+# Bytes read at once when hashing a file
+HASH_CHUNK_SIZE = 1024 ** 2
+# Hashes of files by path, size and modification time, so unchanged files are read only once
+file_hashes = {}
+
+
+# Options that start a process in its own process group, so that it can be killed together with its children
+def process_group_options():
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+# Kills a process started with process_group_options and everything it started
+def kill_process_tree(process):
+    if process.poll() is not None:
+        return
+    if sys.platform == 'win32':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Directory of the identifications of earlier runs
+def ident_cache_dir():
+    cache = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation) or tempfile.gettempdir()
+    return os.path.join(cache, IDENT_CACHE_DIR)
+
+
+# sha256 of the content of a file
+def file_hash(path):
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if signature not in file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        file_hashes[signature] = digest.hexdigest()
+    return file_hashes[signature]
+
+
+# Copies a file so that the destination is never seen half written
+def copy_file(source, destination):
+    tmp_file, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), suffix='.tmp')
+    os.close(tmp_file)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+# Last element of a .pepXML, MSFragger is done with a file once it is written
+PEPXML_END = b'</msms_pipeline_analysis>'
+# Seconds between checks for .pepXML files a running MSFragger finished
+PEPXML_POLL_INTERVAL = 1
+
+
+# Whether a .pepXML is completely written
+def pepxml_complete(pep):
+    try:
+        with open(pep, 'rb') as pep_file:
+            pep_file.seek(0, os.SEEK_END)
+            pep_file.seek(max(0, pep_file.tell() - 1024))
+            return pep_file.read().rstrip().endswith(PEPXML_END)
+    except OSError:
+        return False
+
+
+class ConversionQueue:
+    """
+    Converts the .pepXML files MSFragger produces to .mzID on a pool of threads.
+    idconvert is single threaded and mostly waits on the disk, so conversions run alongside the searches.
+
+    Arguments:
+    - function converting the .pepXML of a .mgf, returning the .mzID path or False
+    - number of conversions running at the same time
+    """
+    def __init__(self, convert, workers):
+        self.convert = convert
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    # Starts the conversion of the .pepXML of a .mgf, once per file
+    def submit(self, mgf):
+        if mgf not in self.futures:
+            self.futures[mgf] = self.pool.submit(self.convert, mgf)
+        return self.futures[mgf]
+
+    # Starts the conversions of the files whose .pepXML was completely written since the given time
+    def submit_finished(self, mgfs, since):
+        for mgf in mgfs:
+            pep = FileProcessor.make_pep_path(mgf)
+            if mgf not in self.futures and os.path.exists(pep) and os.path.getmtime(pep) >= since \
+                    and pepxml_complete(pep):
+                self.submit(mgf)
+
+    # Drops the conversions that have not started yet
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+# Charge of a spectrum, like 2+, 3- or 2
+MGF_CHARGE = re.compile(rb'(\d+)\s*([+-]?)')
+# Files scanned side by side when identification files are added
+MGF_SCAN_WORKERS = 8
+
+
+class MGFIndex:
+    """
+    Index and summary of a .mgf file, built by a single pass over the file.
+    The offsets of the BEGIN IONS lines allow reading or splitting spectra without parsing the whole file.
+
+    Arguments:
+    - .mgf path
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []
+        self.unterminated = 0
+        self.charges = collections.Counter()
+        self.min_rt = None
+        self.max_rt = None
+        self.error = None
+
+    @property
+    def spectra(self):
+        return len(self.offsets)
+
+    def scan(self):
+        try:
+            with open(self.path, 'rb') as mgf:
+                if os.fstat(mgf.fileno()).st_size == 0:
+                    return self
+                with mmap.mmap(mgf.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.read(data)
+        except OSError as e:
+            self.error = str(e)
+        return self
+
+    # jumps from block to block with find, which is much faster than looking at every line
+    def read(self, data):
+        begin = data.find(b'BEGIN IONS')
+        while begin >= 0:
+            self.offsets.append(begin)
+            next_begin = data.find(b'BEGIN IONS', begin + 1)
+            block_end = next_begin if next_begin >= 0 else len(data)
+            end = data.find(b'END IONS', begin, block_end)
+            if end < 0:
+                self.unterminated += 1
+                end = block_end
+            self.read_charge(self.read_value(data, b'\nCHARGE=', begin, end))
+            self.read_rt(self.read_value(data, b'\nRTINSECONDS=', begin, end))
+            begin = next_begin
+
+    # value of a spectrum detail line within a block, None if it is not there
+    @staticmethod
+    def read_value(data, key, begin, end):
+        start = data.find(key, begin, end)
+        if start < 0:
+            return None
+        start += len(key)
+        stop = data.find(b'\n', start, end)
+        return data[start:stop if stop >= 0 else end].strip()
+
+    def read_charge(self, value):
+        charge = MGF_CHARGE.match(value) if value else None
+        if charge:
+            self.charges[int(charge.group(1)) * (-1 if charge.group(2) == b'-' else 1)] += 1
+
+    def read_rt(self, value):
+        try:
+            rt = float(value.split(b'-')[0])
+        except (AttributeError, ValueError):
+            return
+        self.min_rt = rt if self.min_rt is None else min(self.min_rt, rt)
+        self.max_rt = rt if self.max_rt is None else max(self.max_rt, rt)
+
+    # reason to not search the file, None if it looks fine
+    # polarity is the polarity of the project, 'positive', 'negative' or 'both'
+    def problem(self, polarity='both'):
+        if self.error:
+            return 'can not be read ({})'.format(self.error)
+        if not self.offsets:
+            return 'contains no spectra'
+        if self.unterminated:
+            return 'is truncated ({} spectra without END IONS)'.format(self.unterminated)
+        positive = sum(count for charge, count in self.charges.items() if charge > 0)
+        negative = sum(count for charge, count in self.charges.items() if charge < 0)
+        if polarity in ('positive', '+') and negative and not positive:
+            return 'only has negative precursor charges'
+        if polarity in ('negative', '-') and positive and not negative:
+            return 'only has positive precursor charges'
+        return None
+
+    def describe(self):
+        text = '{} spectra'.format(self.spectra)
+        total = sum(self.charges.values())
+        if total:
+            text += ', charge ' + ' '.join('{}{}: {:.0f}%'.format(abs(charge), '-' if charge < 0 else '+',
+                                                                 100 * count / total)
+                                           for charge, count in sorted(self.charges.items()))
+        if self.min_rt is not None:
+            text += ', RT {:.1f}-{:.1f} s'.format(self.min_rt, self.max_rt)
+        return text
+
+
+# Builds the index of a .mgf, runs in a worker process
+def scan_mgf(path):
+    return MGFIndex(path).scan()
+
+
+# Scans several .mgf files side by side, returns their index by path
+def scan_mgfs(paths):
+    paths = list(dict.fromkeys(paths))
+    if len(paths) < 2:
+        return {path: scan_mgf(path) for path in paths}
+    workers = min(len(paths), os.cpu_count() or 1, MGF_SCAN_WORKERS)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return dict(zip(paths, pool.map(scan_mgf, paths)))
+
+
+# Spectrum details that give MSFragger the scan number of a spectrum
+MGF_SCANS = b'\nSCANS='
+MGF_TITLE_SCAN = re.compile(rb'\nTITLE=[^\n]*\.\d+\.\d+\.\d')
+# Name of a shard of a .mgf, from the name of the .mgf and the number of the shard
+SHARD_NAME = '{}_shard{}'
+
+
+# Splits a .mgf into shards with the same number of spectra next to it, returns the paths of the shards
+def split_mgf(index, shards):
+    stem, extension = os.path.splitext(index.path)
+    size = -(-index.spectra // shards)
+    paths = []
+    try:
+        with open(index.path, 'rb') as mgf, mmap.mmap(mgf.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # global settings before the first spectrum apply to every shard
+            header = data[:index.offsets[0]]
+            for first in range(0, index.spectra, size):
+                paths.append(SHARD_NAME.format(stem, len(paths) + 1) + extension)
+                with open(paths[-1], 'wb') as shard:
+                    shard.write(header)
+                    for position in range(first, min(first + size, index.spectra)):
+                        shard.write(shard_spectrum(data, index, position))
+    except OSError:
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+    return paths
+
+
+# Spectrum of a .mgf as it goes into a shard
+# spectra only known by their position get it as SCANS, so their scan numbers stay the same in the shard
+def shard_spectrum(data, index, position):
+    begin = index.offsets[position]
+    end = index.offsets[position + 1] if position + 1 < index.spectra else len(data)
+    spectrum = data[begin:end]
+    line_end = spectrum.find(b'\n') + 1
+    if not line_end or MGF_SCANS in spectrum or MGF_TITLE_SCAN.search(spectrum):
+        return spectrum
+    return spectrum[:line_end] + b'SCANS=%d\n' % (position + 1) + spectrum[line_end:]
+
+
+PEPXML_QUERY = '<spectrum_query'
+PEPXML_RUN_END = '</msms_run_summary>'
+PEPXML_INDEX = re.compile(r'\bindex="\d+"')
+
+
+# Merges the .pepXML files of the shards of a .mgf into a single .pepXML, as if the .mgf was searched at once
+# the header comes from the first shard, the spectrum queries of all shards are numbered again
+# returns the number of spectrum queries
+def merge_pepxml(shard_peps, pep, name):
+    queries = 0
+    with open(pep, 'w') as out:
+        for number, shard_pep in enumerate(shard_peps):
+            shard_name = SHARD_NAME.format(name, number + 1)
+            in_queries = False
+            with open(shard_pep) as shard:
+                for line in shard:
+                    if PEPXML_RUN_END in line:
+                        break
+                    if PEPXML_QUERY in line:
+                        in_queries = True
+                        queries += 1
+                        line = PEPXML_INDEX.sub('index="{}"'.format(queries), line.replace(shard_name, name), 1)
+                    elif not in_queries:
+                        if number:
+                            continue
+                        line = line.replace(shard_name, name)
+                    out.write(line)
+                else:
+                    raise ValueError('{} is incomplete'.format(shard_pep))
+        out.write(PEPXML_RUN_END + '\n' + PEPXML_END.decode() + '\n')
+    return queries
+
+
+# Mass of a proton, to get m/z from the neutral masses in a .pepXML
+PROTON_MASS = 1.00727646677
+# Monoisotopic residue masses, to get the mass delta of modifications MSFragger only reports the total mass of
+RESIDUE_MASSES = {
+    'G': 57.02146, 'A': 71.03711, 'S': 87.03203, 'P': 97.05276, 'V': 99.06841, 'T': 101.04768, 'C': 103.00919,
+    'L': 113.08406, 'I': 113.08406, 'N': 114.04293, 'D': 115.02694, 'Q': 128.05858, 'K': 128.09496,
+    'E': 129.04259, 'M': 131.04049, 'H': 137.05891, 'F': 147.06841, 'U': 150.95364, 'R': 156.10111,
+    'Y': 163.06333, 'W': 186.07931, 'O': 237.14773,
+}
+# Mass of the peptide termini, to get the mass delta of terminal modifications
+NTERM_MASS = 1.007825
+CTERM_MASS = 17.00274
+# Proteins MSFragger marks as decoys unless the search parameters say otherwise
+DECOY_PREFIX = 'rev_'
+
+
+# Ways of converting .pepXML to .mzID
+CONVERTERS = ['idconvert', 'built-in']
+
+
+# Name of an element without its namespace
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class PepXMLConverter:
+    """
+    Converts the .pepXML MSFragger writes to the .mzID pastaq reads, without idconvert.
+    The .pepXML is parsed incrementally and the matches are written to a spill file as they are read,
+    so memory only grows with the number of distinct peptides and proteins, not with the number of matches.
+    The spill file is appended to the .mzID once the sequences it refers to are written.
+
+    Arguments:
+    - .pepXML path
+    - .mzID path
+    """
+    def __init__(self, pep, mzid):
+        self.pep = pep
+        self.mzid = mzid
+        self.decoy_prefix = DECOY_PREFIX
+        self.database = ''
+        self.proteins = {}
+        self.peptides = {}
+        self.evidence = {}
+        self.matches = 0
+
+    # converts the file, returns the number of spectrum matches
+    def convert(self):
+        directory = os.path.dirname(os.path.abspath(self.mzid))
+        with tempfile.TemporaryFile('w+', dir=directory) as spill:
+            self.read(spill)
+            spill.seek(0)
+            tmp_file, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(tmp_file, 'w', encoding='utf-8') as out:
+                    self.write(out, spill)
+                os.replace(tmp_path, self.mzid)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        return self.matches
+
+    def read(self, spill):
+        run_summary = None
+        for event, elem in ElementTree.iterparse(self.pep, events=('start', 'end')):
+            tag = local_name(elem.tag)
+            if event == 'start':
+                if tag == 'msms_run_summary':
+                    run_summary = elem
+                continue
+            if tag == 'search_database':
+                self.database = elem.get('local_path', '')
+            elif tag == 'parameter' and elem.get('name') == 'decoy_prefix':
+                self.decoy_prefix = elem.get('value') or DECOY_PREFIX
+            elif tag == 'spectrum_query':
+                self.read_query(elem, spill)
+                # drops the queries that have been converted
+                if run_summary is not None:
+                    run_summary.clear()
+
+    # writes the matches of a spectrum to the spill file
+    def read_query(self, query, spill):
+        hits = [elem for elem in query.iter() if local_name(elem.tag) == 'search_hit']
+        if not hits:
+            return
+        charge = int(query.get('assumed_charge', 1))
+        experimental_mz = (float(query.get('precursor_neutral_mass', 0)) + charge * PROTON_MASS) / charge
+        scan = query.get('start_scan', query.get('index', '0'))
+        self.matches += 1
+        spill.write('<SpectrumIdentificationResult id={} spectrumID={} spectraData_ref="SD_1">\n'.format(
+            quoteattr('SIR_{}'.format(self.matches)), quoteattr('scan={}'.format(scan))))
+        for i, hit in enumerate(hits, 1):
+            peptide = self.read_peptide(hit)
+            calculated_mz = (float(hit.get('calc_neutral_pep_mass', 0)) + charge * PROTON_MASS) / charge
+            spill.write('<SpectrumIdentificationItem id={} chargeState="{}" experimentalMassToCharge="{:.6f}" '
+                        'calculatedMassToCharge="{:.6f}" peptide_ref={} rank="{}" passThreshold="true">\n'.format(
+                            quoteattr('SII_{}_{}'.format(self.matches, i)), charge, experimental_mz, calculated_mz,
+                            quoteattr(peptide), hit.get('hit_rank', i)))
+            for protein in self.read_proteins(hit):
+                spill.write('<PeptideEvidenceRef peptideEvidence_ref={}/>\n'.format(
+                    quoteattr(self.read_evidence(peptide, protein))))
+            for elem in hit:
+                if local_name(elem.tag) == 'search_score':
+                    spill.write('<userParam name={} value={}/>\n'.format(
+                        quoteattr(elem.get('name', '')), quoteattr(elem.get('value', ''))))
+            spill.write('</SpectrumIdentificationItem>\n')
+        spill.write('<cvParam cvRef="PSI-MS" accession="MS:1000894" name="retention time" value={} '
+                    'unitCvRef="UO" unitAccession="UO:0000010" unitName="second"/>\n'.format(
+                        quoteattr(query.get('retention_time_sec', '0'))))
+        spill.write('<cvParam cvRef="PSI-MS" accession="MS:1000796" name="spectrum title" value={}/>\n'.format(
+            quoteattr(query.get('spectrum', ''))))
+        spill.write('</SpectrumIdentificationResult>\n')
+
+    # id of the peptide of a search hit, including its modifications
+    def read_peptide(self, hit):
+        sequence = hit.get('peptide', '')
+        modifications = []
+        for info in hit:
+            if local_name(info.tag) != 'modification_info':
+                continue
+            if info.get('mod_nterm_mass'):
+                modifications.append((0, '', float(info.get('mod_nterm_mass')) - NTERM_MASS))
+            if info.get('mod_cterm_mass'):
+                modifications.append((len(sequence) + 1, '', float(info.get('mod_cterm_mass')) - CTERM_MASS))
+            for mod in info:
+                if local_name(mod.tag) != 'mod_aminoacid_mass':
+                    continue
+                position = int(mod.get('position'))
+                residue = sequence[position - 1] if 0 < position <= len(sequence) else ''
+                # newer MSFragger versions write the mass delta, older ones only the modified residue mass
+                delta = mod.get('variable') or mod.get('static') or mod.get('variablemod') or mod.get('staticmod')
+                if delta is None:
+                    delta = float(mod.get('mass')) - RESIDUE_MASSES.get(residue, 0)
+                modifications.append((position, residue, float(delta)))
+        key = sequence + ''.join('[{}{}:{:.4f}]'.format(position, residue, delta)
+                                 for position, residue, delta in modifications)
+        if key not in self.peptides:
+            self.peptides[key] = (sequence, modifications)
+        return key
+
+    # proteins a search hit matches
+    def read_proteins(self, hit):
+        proteins = [(hit.get('protein', ''), hit.get('protein_descr', ''))]
+        for elem in hit:
+            if local_name(elem.tag) == 'alternative_protein':
+                proteins.append((elem.get('protein', ''), elem.get('protein_descr', '')))
+        for accession, description in proteins:
+            if accession not in self.proteins:
+                self.proteins[accession] = description
+        return [accession for accession, _ in proteins]
+
+    # id of the evidence of a peptide in a protein
+    def read_evidence(self, peptide, protein):
+        key = (peptide, protein)
+        if key not in self.evidence:
+            self.evidence[key] = 'PE_{}'.format(len(self.evidence) + 1)
+        return self.evidence[key]
+
+    def write(self, out, spill):
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write('<MzIdentML id="PASTAQ-GUI" version="1.1.0" xmlns="http://psidev.info/psi/pi/mzIdentML/1.1">\n')
+        out.write('<cvList>\n'
+                  '<cv id="PSI-MS" fullName="PSI-MS" uri="https://raw.githubusercontent.com/HUPO-PSI/psi-ms-CV/'
+                  'master/psi-ms.obo"/>\n'
+                  '<cv id="UNIMOD" fullName="UNIMOD" uri="http://www.unimod.org/obo/unimod.obo"/>\n'
+                  '<cv id="UO" fullName="UNIT-ONTOLOGY" uri="https://raw.githubusercontent.com/bio-ontology-research-'
+                  'group/unit-ontology/master/unit.obo"/>\n'
+                  '</cvList>\n')
+        self.write_sequences(out)
+        out.write('<AnalysisCollection>\n'
+                  '<SpectrumIdentification id="SI_1" spectrumIdentificationProtocol_ref="SIP_1" '
+                  'spectrumIdentificationList_ref="SIL_1">\n'
+                  '<InputSpectra spectraData_ref="SD_1"/>\n'
+                  '<SearchDatabaseRef searchDatabase_ref="SDB_1"/>\n'
+                  '</SpectrumIdentification>\n'
+                  '</AnalysisCollection>\n')
+        out.write('<DataCollection>\n<Inputs>\n')
+        out.write('<SearchDatabase id="SDB_1" location={}>\n<DatabaseName>\n'
+                  '<userParam name={}/>\n</DatabaseName>\n</SearchDatabase>\n'.format(
+                      quoteattr(self.database), quoteattr(os.path.basename(self.database))))
+        out.write('<SpectraData id="SD_1" location={}>\n<SpectrumIDFormat>\n'
+                  '<cvParam cvRef="PSI-MS" accession="MS:1000774" name="multiple peak list nativeID format"/>\n'
+                  '</SpectrumIDFormat>\n</SpectraData>\n'.format(quoteattr(self.pep)))
+        out.write('</Inputs>\n<AnalysisData>\n<SpectrumIdentificationList id="SIL_1">\n')
+        shutil.copyfileobj(spill, out)
+        out.write('</SpectrumIdentificationList>\n</AnalysisData>\n</DataCollection>\n</MzIdentML>\n')
+
+    def write_sequences(self, out):
+        out.write('<SequenceCollection>\n')
+        accessions = {}
+        for i, (accession, description) in enumerate(self.proteins.items(), 1):
+            accessions[accession] = 'DBSeq_{}'.format(i)
+            out.write('<DBSequence id={} accession={} searchDatabase_ref="SDB_1">\n'.format(
+                quoteattr(accessions[accession]), quoteattr(accession)))
+            out.write('<cvParam cvRef="PSI-MS" accession="MS:1001088" name="protein description" value={}/>\n'
+                      '</DBSequence>\n'.format(quoteattr(description)))
+        for key, (sequence, modifications) in self.peptides.items():
+            out.write('<Peptide id={}>\n<PeptideSequence>{}</PeptideSequence>\n'.format(
+                quoteattr(key), escape(sequence)))
+            for position, residue, delta in modifications:
+                residues = ' residues="{}"'.format(residue) if residue else ''
+                out.write('<Modification location="{}" monoisotopicMassDelta="{:.6f}"{}>\n'
+                          '<cvParam cvRef="PSI-MS" accession="MS:1001460" name="unknown modification"/>\n'
+                          '</Modification>\n'.format(position, delta, residues))
+            out.write('</Peptide>\n')
+        for (peptide, protein), evidence in self.evidence.items():
+            decoy = 'true' if protein.startswith(self.decoy_prefix) else 'false'
+            out.write('<PeptideEvidence id={} dBSequence_ref={} peptide_ref={} isDecoy="{}"/>\n'.format(
+                quoteattr(evidence), quoteattr(accessions[protein]), quoteattr(peptide), decoy))
+        out.write('</SequenceCollection>\n')
+
+
+# MSFragger reports the file it searches like '001. sample.mgf 2.3 s' and its progress like '[progress: 12/40 (30%)'
+MSFRAGGER_FILE = re.compile(r'^\s*\d+\.\s+(\S+?\.mgf)\b', re.IGNORECASE)
+MSFRAGGER_PROGRESS = re.compile(r'\[progress: \d+/\d+ \((\d+)%\)')
+# Last lines of output kept to report why a process failed
+OUTPUT_TAIL_LINES = 20
+
+
+class MSFraggerProgress:
+    """
+    Follows the output of an MSFragger run and reports the search progress of each of its files.
+    MSFragger searches in several passes, so the progress of a file can start over.
+
+    Arguments:
+    - files searched in the run
+    - function called with a file and its progress in percent
+    """
+    def __init__(self, mgfs, report):
+        self.files = {os.path.basename(mgf): mgf for mgf in mgfs}
+        self.current = mgfs[0] if len(mgfs) == 1 else None
+        self.report = report
+        self.percent = None
+
+    # returns whether the line only reported progress
+    def parse(self, line):
+        match = MSFRAGGER_FILE.match(line)
+        if match and os.path.basename(match.group(1)) in self.files:
+            self.current = self.files[os.path.basename(match.group(1))]
+            self.percent = None
+        match = MSFRAGGER_PROGRESS.search(line)
+        if not match:
+            return False
+        percent = int(match.group(1))
+        if self.current and percent != self.percent:
+            self.percent = percent
+            self.report(self.current, percent)
+        return line.lstrip().startswith('[progress')
+
+
+# Extensions of the files found in folders
+RAW_EXTENSIONS = ('.mzml', '.mzxml')
+IDENT_EXTENSIONS = ('.mzid', '.mzidentml', '.mgf')
+# Files found in folders are handed over in batches of this size or after this many seconds
+SCAN_BATCH_SIZE = 200
+SCAN_BATCH_INTERVAL = 0.25
+
+
+# Walks the folders and their subfolders, yields batches of the files with the given extensions
+# together with the number of folders scanned so far; linked folders are not followed, so there are no cycles
+def scan_folders(folders, extensions, stop=lambda: False):
+    pending = list(reversed(folders))
+    batch = []
+    scanned = 0
+    last = time.monotonic()
+    while pending and not stop():
+        folder = pending.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        scanned += 1
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    batch.append(entry.path)
+            except OSError:
+                continue
+        pending.extend(reversed(subfolders))
+        if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last >= SCAN_BATCH_INTERVAL:
+            yield batch, scanned
+            batch = []
+            last = time.monotonic()
+    yield batch, scanned
+
+
+class FolderScanner(QThread):
+    """
+    Looks for input files in folders and all their subfolders in the background.
+    The files are handed over in batches while the scan goes on, so they show up right away.
+
+    Arguments:
+    - folders
+    - extensions of the files to look for
+    """
+    found = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, folders, extensions, parent=None):
+        super().__init__(parent)
+        self.folders = folders
+        self.extensions = extensions
+
+    def run(self):
+        total = 0
+        for batch, scanned in scan_folders(self.folders, self.extensions, self.isInterruptionRequested):
+            total += len(batch)
+            if batch:
+                self.found.emit(batch)
+            self.progress.emit(scanned, total)
+
+
+class MGFScanner(QThread):
+    """
+    Scans .mgf files in the background (see scan_mgfs), large files take a while to read.
+
+    Arguments:
+    - .mgf paths
+    """
+    scanned = pyqtSignal(dict)
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+
+    def run(self):
+        self.scanned.emit(scan_mgfs(self.paths))
+
+
+class ScanProgress(QProgressDialog):
+    """
+    Shows how far a folder scan got, canceling it stops the scan.
+    The files found until then are kept.
+
+    Arguments:
+    - folder scanner
+    """
+    def __init__(self, scanner, parent=None):
+        super().__init__('Scanning folders', 'Cancel', 0, 0, parent)
+        self.setWindowTitle('PASTAQ: DDA Pipeline - Add folder')
+        self.setWindowModality(Qt.WindowModal)
+        self.setMinimumDuration(500)
+        self.canceled.connect(scanner.requestInterruption)
+        scanner.progress.connect(self.update_progress)
+        scanner.finished.connect(self.reset)
+
+    def update_progress(self, scanned, found):
+        self.setLabelText('Scanning folders: {} folders, {} files found'.format(scanned, found))
+
+
 class EditFileDialog(QDialog):
     """
     This is the modal that shows up when editing an already added .mzML file.
     It allows for adding .mzID files as well as setting a group for the measurement.
+    Added .mgf files are scanned in the background and rejected if they can not be searched,
+    the files can only be confirmed once the scans are done.
     Attributes:
     - the sorting function for the files
     - the updating function
+    - the polarity of the project, to reject .mgf files of the other polarity
     """
     group = ''
     mzid_paths = []
+    folder_scanner = None
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, polarity='both'):
         super().__init__(parent)
+        self.polarity = polarity
+        self.mgf_indexes = {}
+        # .mgf files being scanned and the scanners scanning them
+        self.scanning = set()
+        self.mgf_scanners = []
 
         self.setWindowTitle('PASTAQ: DDA Pipeline - Add files')
         # Edit parameters
@@ -99,6 +842,7 @@ class EditFileDialog(QDialog):
         buttons = QDialogButtonBox(dialog_buttons)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
+        self.ok_button = buttons.button(QDialogButtonBox.Ok)
         return buttons
 
     # Enables drag and drop event
@@ -121,20 +865,76 @@ class EditFileDialog(QDialog):
         self.files_list.clear()
         i = 0
         for file in files:
+            if file in self.mgf_indexes:
+                file = '{} ({})'.format(file, self.mgf_indexes[file].describe())
+            elif file in self.scanning:
+                file = '{} (scanning...)'.format(file)
             self.files_list.insertItem(i, file)
             i += 1
 
+    # Scans the added .mgf files in the background and keeps the files that can be searched
+    # the files are listed right away, the ones that can not be searched are rejected once they are scanned
+    def set_files(self, files):
+        mgfs = [file for file in files if file.lower().endswith('.mgf')]
+        new_mgfs = [mgf for mgf in mgfs if mgf not in self.mgf_indexes and mgf not in self.scanning]
+        if new_mgfs:
+            self.scanning.update(new_mgfs)
+            scanner = MGFScanner(new_mgfs, self)
+            scanner.scanned.connect(self.mgfs_scanned)
+            self.mgf_scanners.append(scanner)
+            scanner.start()
+        rejected = []
+        for mgf in mgfs:
+            problem = self.mgf_indexes[mgf].problem(self.polarity) if mgf in self.mgf_indexes else None
+            if problem:
+                rejected.append('{} {}'.format(os.path.basename(mgf), problem))
+        if rejected:
+            popup_window('Error', QMessageBox.Warning, 'Rejected .mgf files:\n' + '\n'.join(rejected))
+            files = [file for file in files if file not in mgfs or file not in self.mgf_indexes or
+                     not self.mgf_indexes[file].problem(self.polarity)]
+        self.update_files(files)
+        self.mzid_paths = files
+        self.ok_button.setEnabled(not self.scanning)
+
+    def mgfs_scanned(self, indexes):
+        self.mgf_indexes.update(indexes)
+        self.scanning.difference_update(indexes)
+        self.set_files(self.mzid_paths)
+
     # When a file is dropped on the UI
+    # dropped folders are scanned in the background, the files found there are added as they come in
     def dropEvent(self, event):
         self.feedback_drop()
         files = [u.toLocalFile() for u in event.mimeData().urls()]
         listing = []
+        folders = []
         for file in files:
-            if file.lower().endswith('.mzid') or file.lower().endswith('.mzidentmL') or file.lower().endswith('.mgf'):
+            if os.path.isdir(file):
+                folders.append(file)
+            elif file.lower().endswith(IDENT_EXTENSIONS):
                 listing.append(file)
-        if len(listing) > 0:
-            self.update_files(listing)
-            self.mzid_paths = listing
+        if len(listing) > 0 or folders:
+            self.set_files(listing)
+        if folders:
+            self.scan_folders(folders)
+
+    def scan_folders(self, folders):
+        self.folder_scanner = FolderScanner(folders, IDENT_EXTENSIONS, self)
+        self.folder_scanner.found.connect(self.add_files)
+        self.scan_progress = ScanProgress(self.folder_scanner, self)
+        self.folder_scanner.start()
+
+    def add_files(self, files):
+        self.set_files(self.mzid_paths + [file for file in files if file not in self.mzid_paths])
+
+    # a folder scan that is still running stops with the dialog, .mgf scans are finished
+    def done(self, result):
+        if self.folder_scanner:
+            self.folder_scanner.requestInterruption()
+            self.folder_scanner.wait()
+        for scanner in self.mgf_scanners:
+            scanner.wait()
+        super().done(result)
 
     def set_group(self):
         self.group = self.group_box.text()
@@ -148,8 +948,7 @@ class EditFileDialog(QDialog):
             filter='Identification files (*.mzID *.mzIdentML *.mgf)'
         )
         if len(file_paths) > 0:
-            self.update_files(file_paths)
-            self.mzid_paths = file_paths
+            self.set_files(file_paths)
 
 
 # class for drag and drop field (aesthetics)
@@ -173,11 +972,39 @@ class FileProcessor:
     """
     This class is responsible for the automatic conversion of .mgf files to .mzID files.
     It requires paths to idconvert and MSFragger executable and parameters file to do the conversion.
+    Several files can be identified side by side, up to the number of workers (0 is automatic),
+    or all of them in a single MSFragger run when batched.
+    The .pepXML to .mzID conversions can run on a separate queue (see ConversionQueue).
+    Identifications are cached by the content of the .mgf, the .params file, the database and the MSFragger jar,
+    and by the converter.
     """
     ms_jar = [False, '']
     id_file = [False, '']
     params = [False, '']
     saved = True
+    workers = 0
+    all_or_nothing = True
+    batched = False
+    conversions = 0
+    converter = CONVERTERS[0]
+    # searches running side by side and the memory each of them may use
+    searches = 1
+    search_memory = None
+    # .mgf files with more spectra are split into shards that are searched side by side, 0 to never split
+    shard_spectra = 0
+    # directory of the identification cache, the one of the user by default (see ident_cache_dir)
+    cache_dir = None
+    # called with a .mgf and its search progress in percent
+    progress = None
+    # errors are shown in popups unless the processor runs in the background
+    interactive = True
+    # set by cancel, no further processes are started until it is cleared
+    cancelled = False
+
+    def __init__(self):
+        # MSFragger and idconvert processes that are running, so that a cancel can kill them
+        self.processes = set()
+        self.process_lock = threading.Lock()
 
     def get_saved(self):
         return self.saved
@@ -185,6 +1012,152 @@ class FileProcessor:
     def set_saved(self, bool):
         self.saved = bool
 
+    def set_workers(self, workers):
+        self.workers = workers
+        self.saved = False
+
+    def set_all_or_nothing(self, bool):
+        self.all_or_nothing = bool
+        self.saved = False
+
+    def set_batched(self, bool):
+        self.batched = bool
+        self.saved = False
+
+    def set_conversions(self, conversions):
+        self.conversions = conversions
+        self.saved = False
+
+    def set_converter(self, converter):
+        self.converter = converter
+        self.saved = False
+
+    def set_shard_spectra(self, spectra):
+        self.shard_spectra = spectra
+        self.saved = False
+
+    # number of identifications that run at the same time for the given number of files
+    # automatically bounded by the number of cores and by the memory each MSFragger instance needs
+    def get_workers(self, pending, heap=MSFRAGGER_HEAP):
+        workers = self.workers
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+            memory = available_memory()
+            if memory:
+                workers = min(workers, int(memory * MSFRAGGER_MEMORY_FRACTION // heap))
+        return max(1, min(workers, pending))
+
+    # divides the free memory and the cores between the given number of searches running side by side
+    def share(self, searches):
+        self.searches = max(1, searches)
+        memory = available_memory()
+        self.search_memory = int(memory * MSFRAGGER_MEMORY_FRACTION / self.searches) if memory else None
+
+    # settings of the .params file, which has key = value lines and # comments
+    def read_params(self):
+        settings = {}
+        try:
+            with open(self.params[1]) as params_file:
+                for line in params_file:
+                    key, separator, value = line.split('#', 1)[0].partition('=')
+                    if separator:
+                        settings[key.strip()] = value.strip()
+        except OSError:
+            pass
+        return settings
+
+    # path of the protein database named in the .params file, None if it can not be found
+    def find_database(self, settings):
+        database = settings.get('database_name')
+        if not database:
+            return None
+        ms, _ = self.get_ms()
+        for directory in ['', os.path.dirname(self.params[1]), ms]:
+            path = os.path.join(directory, database)
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        return None
+
+    # size of the protein database and of the largest of the given files
+    def search_sizes(self, mgfs, settings):
+        database = self.find_database(settings)
+        database_size = os.path.getsize(database) if database else 0
+        mgf_size = max([os.path.getsize(mgf) for mgf in mgfs if os.path.isfile(mgf)] + [0])
+        return database_size, mgf_size
+
+    # memory MSFragger needs to search the given files, which it searches one after the other
+    def estimate_heap(self, mgfs, settings=None):
+        if settings is None:
+            settings = self.read_params()
+        database_size, mgf_size = self.search_sizes(mgfs, settings)
+        heap = MSFRAGGER_BASE_HEAP + database_size * MSFRAGGER_HEAP_PER_DATABASE_BYTE \
+            + mgf_size * MSFRAGGER_HEAP_PER_MGF_BYTE
+        return max(MSFRAGGER_MIN_HEAP, heap)
+
+    # memory one of the searches running side by side may use, None if it is not known
+    def memory_share(self):
+        if self.search_memory is not None:
+            return self.search_memory
+        memory = available_memory()
+        return int(memory * MSFRAGGER_MEMORY_FRACTION / self.searches) if memory else None
+
+    # heap and number of threads of an MSFragger run, within its share of the machine
+    # the shards of a file that are searched side by side share the machine of the file
+    def plan_search(self, mgfs, settings, shards=1):
+        heap = self.estimate_heap(mgfs, settings)
+        memory = self.memory_share()
+        if memory:
+            heap = min(heap, max(MSFRAGGER_MIN_HEAP, memory // shards))
+        threads = max(1, (os.cpu_count() or 1) // (self.searches * shards))
+        try:
+            # 0 lets MSFragger use all cores
+            if int(settings.get('num_threads', 0)) > 0:
+                threads = min(threads, int(settings['num_threads']))
+        except ValueError:
+            pass
+        return heap, threads
+
+    # copy of the .params file with the number of threads of a run and the full path of the database
+    # without calibration the mass calibration and parameter optimization of MSFragger are turned off
+    # the original is read first, so no copy is left behind when it can not be read
+    def derive_params(self, settings, threads, calibrate=True):
+        with open(self.params[1]) as original:
+            lines = original.readlines()
+        database = self.find_database(settings)
+        replace = {'num_threads': str(threads)}
+        if not calibrate:
+            replace['calibrate_mass'] = '0'
+        if database:
+            replace['database_name'] = database
+        derived_file, derived_path = tempfile.mkstemp(prefix='msfragger_', suffix='.params')
+        try:
+            with os.fdopen(derived_file, 'w') as derived:
+                for line in lines:
+                    key = line.split('#', 1)[0].partition('=')[0].strip()
+                    if key in replace:
+                        line = '{} = {}\n'.format(key, replace.pop(key))
+                    derived.write(line)
+                for key, value in replace.items():
+                    derived.write('\n{} = {}\n'.format(key, value))
+        except OSError:
+            os.unlink(derived_path)
+            raise
+        return derived_path
+
+    # number of conversions that run at the same time for the given number of files, one per core when automatic
+    def get_conversions(self, pending):
+        conversions = self.conversions
+        if conversions <= 0:
+            conversions = os.cpu_count() or 1
+        return max(1, min(conversions, pending))
+
+    # reports a failure to the user, in the log when running in the background
+    def error(self, text, icon=QMessageBox.Critical):
+        if self.interactive:
+            popup_window('Error', icon, text)
+        else:
+            print('ERROR:', text)
+
     # checks path
     def check_path(self, path):
         if not path or not Path(path).is_file():
@@ -267,29 +1240,88 @@ class FileProcessor:
     def make_mzid_path(mzid):
         return mzid.replace('.mgf', '.mzID')
 
-    # msfragger process
-    def execute_msfragger(self, mgf):
+    # runs a process and streams its output line by line into the log
+    # only the last lines are kept in memory, as the output of the completed process
+    # the process runs in its own process group and is killed with everything it started on cancel
+    def run_process(self, command, label, cwd=None, parse=None):
+        tail = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        with self.process_lock:
+            if self.cancelled:
+                return subprocess.CompletedProcess(command, -signal.SIGTERM, 'cancelled')
+            process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                       errors='replace', **process_group_options())
+            self.processes.add(process)
+        try:
+            with process:
+                for line in process.stdout:
+                    line = line.rstrip()
+                    if not line:
+                        continue
+                    tail.append(line)
+                    if not (parse and parse(line)):
+                        print('[{}] {}'.format(label, line))
+        finally:
+            with self.process_lock:
+                self.processes.discard(process)
+        return subprocess.CompletedProcess(command, process.returncode, '\n'.join(tail))
+
+    # kills the running processes and keeps new ones from starting, which frees their cores and memory
+    def cancel(self):
+        with self.process_lock:
+            self.cancelled = True
+            processes = list(self.processes)
+        for process in processes:
+            kill_process_tree(process)
+
+    # progress lines of MSFragger are reported to the progress function instead of the log
+    def msfragger_progress(self, mgfs):
+        if not self.progress:
+            return None
+        return MSFraggerProgress(mgfs, self.progress).parse
+
+    # msfragger process, several files are searched in one run
+    # shards is the number of shards of the same file searched side by side
+    # calibrate is False for shards, which would each be calibrated on their own part of the spectra
+    def execute_msfragger(self, *mgfs, shards=1, calibrate=True):
         ms, ms_jar = self.get_ms()
-        params = self.params[1]
+        label = 'MSFragger'
+        if len(mgfs) == 1:
+            label += ' ' + os.path.basename(mgfs[0])
+
+        # heap and threads follow from the files, the database and the free memory
+        settings = self.read_params()
+        heap, threads = self.plan_search(mgfs, settings, shards)
+        try:
+            params = self.derive_params(settings, threads, calibrate)
+        except OSError:
+            params = None
+        database_size, mgf_size = self.search_sizes(mgfs, settings)
+        memory = available_memory()
+        print('[{}] heap {}, {} threads (database {}, largest .mgf {}, free memory {}, parallel searches {})'.format(
+            label, format_size(heap), threads, format_size(database_size), format_size(mgf_size),
+            format_size(memory) if memory else 'unknown', self.searches * shards))
 
         # try/exception process failure
         try:
-            msfragger = subprocess.run(
-                ['java', '-Xmx32g', '-jar', ms_jar, params, mgf],
+            msfragger = self.run_process(
+                ['java', '-Xmx{}m'.format(heap // 1024 ** 2), '-jar', ms_jar, params or self.params[1], *mgfs],
+                label,
                 cwd=ms,
-                capture_output=True
+                parse=self.msfragger_progress(mgfs)
             )
-        except subprocess.SubprocessError:
-            popup_window('Error', QMessageBox.Critical, 'MSFragger failure')
+        except (OSError, subprocess.SubprocessError):
+            self.error('MSFragger failure')
             return False
+        finally:
+            if params:
+                os.unlink(params)
 
         # try/exception output failure
         try:
             msfragger.check_returncode()
         except subprocess.CalledProcessError:
-            # print(subprocess.CalledProcessError.output) error in terminal
-            # popup window if there was an error
-            popup_window('Error', QMessageBox.Critical, 'MSFragger failure')
+            # popup window with the last output if there was an error
+            self.error('MSFragger failure\n{}'.format(msfragger.stdout))
             return False
         return True
 
@@ -298,30 +1330,40 @@ class FileProcessor:
         id_file = self.id_file[1]
 
         try:
-            idconvert = subprocess.run([id_file, pep, '-o', os.path.dirname(mgf)], capture_output=True)
-        except subprocess.SubprocessError:
-            popup_window('Error', QMessageBox.Critical, 'idconvert failure')
+            idconvert = self.run_process([id_file, pep, '-o', os.path.dirname(mgf)],
+                                         'idconvert {}'.format(os.path.basename(pep)))
+        except (OSError, subprocess.SubprocessError):
+            self.error('idconvert failure')
             return False
 
         # check if idconvert was successful
         try:
             idconvert.check_returncode()
         except subprocess.CalledProcessError:
-            # print(subprocess.CalledProcessError.output) error in terminal
-            popup_window('Error', QMessageBox.Critical, 'idconvert failure')
+            self.error('idconvert failure\n{}'.format(idconvert.stdout))
+            return False
+        return True
+
+    # built-in conversion, runs wherever idconvert is not available
+    def execute_pepxml_converter(self, pep, mgf):
+        try:
+            matches = PepXMLConverter(pep, self.make_mzid_path(mgf)).convert()
+        except (OSError, ElementTree.ParseError) as e:
+            self.error('.pepXML conversion failure\n{}'.format(e))
             return False
+        print('[convert {}] {} spectra with matches'.format(os.path.basename(pep), matches))
         return True
 
     # check all the paths needed for identification
     def check(self):
         if not self.ms_jar[0]:
-            popup_window('Error', QMessageBox.Warning, 'MSFragger path is not valid')
+            self.error('MSFragger path is not valid', QMessageBox.Warning)
             return False
-        if not self.id_file[0]:
-            popup_window('Error', QMessageBox.Warning, 'idconvert path is not valid')
+        if not self.id_file[0] and self.converter == 'idconvert':
+            self.error('idconvert path is not valid', QMessageBox.Warning)
             return False
         if not self.params[0]:
-            popup_window('Error', QMessageBox.Warning, '.params path is not valid')
+            self.error('.params path is not valid', QMessageBox.Warning)
             return False
         return True
 
@@ -329,28 +1371,141 @@ class FileProcessor:
         os.unlink(pep)
 
     # automatic identification process
-    def process(self, mgf):
-        # check if an .mzid is already in same directory with same name as the mgf
-        if os.path.exists(self.make_mzid_path(mgf)):
-            return self.make_mzid_path(mgf)
-
+    # with a conversion queue the conversion is only started and its future is returned,
+    # so the thread can start the next search right away
+    def process(self, mgf, queue=None):
         if not self.check():
             return False
 
+        # check if the same .mgf was identified with the same MSFragger and parameters before
+        mzid = self.lookup(mgf)
+        if mzid:
+            return mzid
+
         # execute MSFragger
-        if not self.execute_msfragger(mgf):
+        if not self.search(mgf):
             return False
 
+        if queue:
+            return queue.submit(mgf)
+        return self.convert(mgf)
+
+    # index of the .mgf when it has enough spectra to be split into shards, None otherwise
+    def shard_index(self, mgf):
+        if self.shard_spectra <= 0:
+            return None
+        index = scan_mgf(mgf)
+        if index.problem() or index.spectra <= self.shard_spectra:
+            return None
+        return index
+
+    # number of shards searched at the same time, bounded by the cores and the memory of the search
+    def get_shard_workers(self, shards):
+        workers = min(len(shards), max(1, (os.cpu_count() or 1) // self.searches))
+        memory = self.memory_share()
+        if memory:
+            workers = min(workers, max(1, memory // self.estimate_heap(shards[:1])))
+        return workers
+
+    # MSFragger search of a single .mgf, split into shards searched side by side when it has many spectra
+    def search(self, mgf):
+        index = self.shard_index(mgf)
+        if index is None:
+            return self.execute_msfragger(mgf)
+        return self.search_shards(mgf, index)
+
+    # the .pepXML of the shards are merged into the .pepXML of the .mgf, so the conversion does not change
+    # calibration is off for the shards, so every shard is searched with the same tolerances
+    def search_shards(self, mgf, index):
+        label = 'MSFragger ' + os.path.basename(mgf)
+        shards = []
+        try:
+            shards = split_mgf(index, -(-index.spectra // self.shard_spectra))
+            workers = self.get_shard_workers(shards)
+            print('[{}] {} spectra split into {} shards, {} searched side by side'.format(
+                label, index.spectra, len(shards), workers))
+            if self.read_params().get('calibrate_mass', '0') != '0':
+                print('[{}] mass calibration and parameter optimization are off for the shards'.format(label))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                searches = [pool.submit(self.execute_msfragger, shard, shards=workers, calibrate=False)
+                            for shard in shards]
+                if not all(search.result() for search in searches):
+                    return False
+            name = os.path.splitext(os.path.basename(mgf))[0]
+            queries = merge_pepxml([self.make_pep_path(shard) for shard in shards], self.make_pep_path(mgf), name)
+            print('[{}] merged {} spectrum queries of {} shards'.format(label, queries, len(shards)))
+            return True
+        except (OSError, ValueError) as e:
+            self.error('MSFragger shard failure\n{}'.format(e))
+            return False
+        finally:
+            for shard in shards:
+                for path in [shard, self.make_pep_path(shard)]:
+                    if os.path.exists(path):
+                        os.unlink(path)
+
+    # identification of several files with a single MSFragger run
+    # the protein database is digested and indexed once instead of once per file
+    # returns the .mzID path for each .mgf, False for the ones that failed
+    # with a conversion queue each file is converted as soon as MSFragger wrote its .pepXML
+    def process_batch(self, mgfs, queue=None):
+        mzids = dict.fromkeys(mgfs, False)
+        if not self.check():
+            return mzids
+
+        pending = []
+        for mgf in mzids:
+            mzids[mgf] = self.lookup(mgf)
+            if not mzids[mgf]:
+                pending.append(mgf)
+        if not pending:
+            return mzids
+        if queue:
+            return self.process_batch_queued(pending, queue, mzids)
+
+        if not self.execute_msfragger(*pending):
+            mzids.update((mgf, False) for mgf in pending)
+            return mzids
+
+        # MSFragger writes the .pepXML of each file next to it
+        for mgf in pending:
+            mzids[mgf] = self.convert(mgf)
+        return mzids
+
+    # batched identification where conversions overlap with the search of the remaining files
+    def process_batch_queued(self, pending, queue, mzids):
+        # older .pepXML files next to the .mgf files are left over from earlier runs
+        start = time.time() - PEPXML_POLL_INTERVAL
+        with ThreadPoolExecutor(max_workers=1) as search:
+            msfragger = search.submit(self.execute_msfragger, *pending)
+            while not wait([msfragger], timeout=PEPXML_POLL_INTERVAL).done:
+                queue.submit_finished(pending, start)
+        queue.submit_finished(pending, start)
+
+        # files MSFragger finished before it failed are still converted
+        if msfragger.result():
+            futures = {mgf: queue.submit(mgf) for mgf in pending}
+        else:
+            futures = {mgf: queue.futures[mgf] for mgf in pending if mgf in queue.futures}
+        for mgf in pending:
+            mzids[mgf] = futures[mgf].result() if mgf in futures else False
+        return mzids
+
+    # conversion of the .pepXML MSFragger made for the .mgf to .mzID
+    def convert(self, mgf):
         # .pepXML should exist at this point
         pep = self.make_pep_path(mgf)
 
         # check if path exists just to be sure
         if not os.path.exists(pep):
-            popup_window('Error', QMessageBox.Critical, '.pepXML does not exist')
+            self.error('.pepXML does not exist')
             return False
 
-        # idconvert
-        if not self.execute_idconvert(pep, mgf):
+        # idconvert or the built-in converter
+        if self.converter == 'idconvert':
+            if not self.execute_idconvert(pep, mgf):
+                return False
+        elif not self.execute_pepxml_converter(pep, mgf):
             return False
 
         # delete intermediary .pepXML
@@ -359,6 +1514,48 @@ class FileProcessor:
         mzid = self.make_mzid_path(mgf)
         # check if the .mzid file exists
         if not os.path.exists(mzid):
-            popup_window('Error', QMessageBox.Critical, '.mzid does not exist')
+            self.error('.mzid does not exist')
             return False
+        self.store(mgf, mzid)
         return mzid
+
+    # key of the identification of a .mgf in the cache, None if one of the files can not be read
+    # the identification depends on the .mgf, the parameters, the database they name, MSFragger and the converter
+    def cache_key(self, mgf):
+        database = self.find_database(self.read_params())
+        try:
+            hashes = [file_hash(path) for path in (mgf, self.params[1], self.ms_jar[1])]
+            hashes.append(file_hash(database) if database else 'no database')
+        except OSError:
+            return None
+        hashes.append(self.converter)
+        return hashlib.sha256(' '.join(hashes).encode()).hexdigest()
+
+    def get_cache_dir(self):
+        return self.cache_dir or ident_cache_dir()
+
+    def make_cache_path(self, key):
+        return os.path.join(self.get_cache_dir(), key + '.mzID')
+
+    # cached identification of a .mgf, copied to where a new identification would be written
+    def lookup(self, mgf):
+        key = self.cache_key(mgf)
+        if not key:
+            return False
+        mzid = self.make_mzid_path(mgf)
+        try:
+            copy_file(self.make_cache_path(key), mzid)
+        except OSError:
+            return False
+        return mzid
+
+    # adds a new identification to the cache, failing to do so only costs a search next time
+    def store(self, mgf, mzid):
+        key = self.cache_key(mgf)
+        if not key:
+            return
+        try:
+            os.makedirs(self.get_cache_dir(), exist_ok=True)
+            copy_file(mzid, self.make_cache_path(key))
+        except OSError:
+            pass
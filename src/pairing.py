@@ -0,0 +1,103 @@
+import collections
+import os
+import re
+
+
+# Naming rules for pairing raw and identification files whose stems are not the same
+# each rule is a regular expression that is removed from the lower case stem, in order
+DEFAULT_RULES = [
+    r'[._-](?:interact|percolator|msfragger|fragger|ident|id|psms?|results?)$',
+    r'[._-](?:un)?calibrated$',
+    r'[._-]centroid(?:ed)?$',
+    r'[._-](?:pep|prot)xml$',
+]
+# Separators that count as the same character when comparing stems
+SEPARATORS = re.compile(r'[\s.-]+')
+# Number of file names listed in the summary, the rest is counted
+SUMMARY_NAMES = 10
+
+
+def stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class Pairing:
+    """
+    Pairs raw files with identification files by the stem of their names.
+    Each identification file is indexed once by its stem and by its stem after the naming rules,
+    so all files are paired in linear time. A pair is only made when a name matches exactly
+    one raw file and one identification file, exact stems are tried before the rules.
+
+    Arguments:
+    - raw file paths
+    - identification file paths
+    - naming rules, regular expressions removed from the stems
+    """
+    def __init__(self, raw_paths, ident_paths, rules=None):
+        self.rules = [re.compile(rule) for rule in (DEFAULT_RULES if rules is None else rules)]
+        self.pairs = {}
+        self.ambiguous = {}
+        raw_paths = list(dict.fromkeys(raw_paths))
+        ident_paths = list(dict.fromkeys(ident_paths))
+        for key in [stem, self.normalize]:
+            raw_paths, ident_paths = self.match(raw_paths, ident_paths, key)
+        self.unmatched_raw = [path for path in raw_paths if path not in self.ambiguous]
+        ambiguous_idents = {ident for idents in self.ambiguous.values() for ident in idents}
+        self.unmatched_ident = [path for path in ident_paths if path not in ambiguous_idents]
+
+    # stem in lower case with the same separators and without what the naming rules remove
+    def normalize(self, path):
+        name = stem(path).lower()
+        for rule in self.rules:
+            name = rule.sub('', name)
+        return SEPARATORS.sub('_', name)
+
+    # pairs the files with a unique key, returns the files that are left
+    def match(self, raw_paths, ident_paths, key):
+        raw_index = collections.defaultdict(list)
+        for path in raw_paths:
+            raw_index[key(path)].append(path)
+        ident_index = collections.defaultdict(list)
+        for path in ident_paths:
+            ident_index[key(path)].append(path)
+
+        paired = set()
+        for name, raws in raw_index.items():
+            idents = ident_index.get(name)
+            if not idents:
+                continue
+            if len(raws) == 1 and len(idents) == 1:
+                self.pairs[raws[0]] = idents[0]
+                self.ambiguous.pop(raws[0], None)
+                paired.update([raws[0], idents[0]])
+            else:
+                for raw in raws:
+                    self.ambiguous[raw] = idents
+        return ([path for path in raw_paths if path not in paired],
+                [path for path in ident_paths if path not in paired])
+
+    # names of the files, the ones that do not fit are counted
+    @staticmethod
+    def list_names(paths):
+        names = [os.path.basename(path) for path in paths[:SUMMARY_NAMES]]
+        if len(paths) > SUMMARY_NAMES:
+            names.append('and {} more'.format(len(paths) - SUMMARY_NAMES))
+        return ', '.join(names)
+
+    # summary of the files that could not be paired, None if all of them were
+    def summary(self):
+        lines = []
+        if self.unmatched_raw:
+            lines.append('No identification file for: ' + self.list_names(self.unmatched_raw))
+        if self.unmatched_ident:
+            lines.append('Not paired with a raw file: ' + self.list_names(self.unmatched_ident))
+        for raw, idents in list(self.ambiguous.items())[:SUMMARY_NAMES]:
+            lines.append('Several identification files for {}: {}'.format(os.path.basename(raw),
+                                                                         self.list_names(idents)))
+        if len(self.ambiguous) > SUMMARY_NAMES:
+            lines.append('Several identification files for {} more raw files'.format(
+                len(self.ambiguous) - SUMMARY_NAMES))
+        if not lines:
+            return None
+        return '{} of {} files paired.\n\n{}'.format(
+            len(self.pairs), len(self.pairs) + len(self.unmatched_raw) + len(self.ambiguous), '\n'.join(lines))
@@ -1,15 +1,25 @@
 import buttons
+import catalog
+import datetime
+import estimator
+import file_table
 import files
 import inspect
 import os
+import pairing
+import parameter_model
+import parameter_schema
+import rawscan
+import shutil
+import validation
 import resources
 from PyQt5.QtCore import Qt, QUrl
-from PyQt5.QtGui import QIcon, QKeySequence
+from PyQt5.QtGui import QBrush, QColor, QIcon, QKeySequence
 from PyQt5.QtWidgets import QPushButton, QFileDialog, QScrollArea, QComboBox, QLabel, QHeaderView
-from PyQt5.QtWidgets import QTableWidget, QHeaderView, QHBoxLayout, QGroupBox, QGridLayout
+from PyQt5.QtWidgets import QTableView, QHeaderView, QHBoxLayout, QGroupBox, QGridLayout
 from PyQt5.QtWidgets import QVBoxLayout, QTabWidget, QSpinBox, QAbstractSpinBox, QMessageBox
 from PyQt5.QtWidgets import QWidget, QLineEdit, QDoubleSpinBox, QCheckBox, QStackedWidget, QListWidget
-from pathlib import Path
+from PyQt5.QtWidgets import QFormLayout
 
 global saved
 saved = True
@@ -30,24 +40,28 @@ class ParameterItem(QWidget):
 
         button = buttons.init_button_params(label, tooltip)
 
+        # errors of the value, hidden while it is valid
+        self.error = QLabel()
+        self.error.setStyleSheet('color: red')
+        self.error.setWordWrap(True)
+        self.error.hide()
+
         layout.addWidget(button)
         layout.addWidget(widget)
+        layout.addWidget(self.error)
+
+    def set_error(self, message):
+        self.error.setText(message)
+        self.error.setVisible(bool(message))
 
 
 # Function for dealing with adding multiple identification files at once
-def multiple_id_files(file, new_file, edit_file_dialog):
-    base_name = os.path.basename(file['raw_path'])
-    base_name = os.path.splitext(base_name)
-    stem = base_name[0]
-    for mzid in edit_file_dialog.mzid_paths:
-        base_name = os.path.basename(mzid)
-        base_name = os.path.splitext(base_name)
-        mzid_stem = base_name[0]
-        # compares the stem of the ML file to the one of the ID file for matching
-        if mzid_stem == stem:
-            new_file['ident_path'] = mzid
-            break
-        os.chdir(os.path.dirname(mzid))  # sets directory to last identification file added
+# pairs are made by the pairing engine, which pairs all edited files at once
+def multiple_id_files(file, new_file, edit_file_dialog, pairs=None):
+    if pairs is None:
+        pairs = pairing.Pairing([file['raw_path']], edit_file_dialog.mzid_paths).pairs
+    if file['raw_path'] in pairs:
+        new_file['ident_path'] = pairs[file['raw_path']]
 
 
 # For when a single .mzID file is added
@@ -56,12 +70,49 @@ def single_id_file(path, new_file):
     os.chdir(os.path.dirname(path))  # sets directory to last identification file added
 
 
-def init_check(cell_widget, checkbox):
-    lay_out = QHBoxLayout(cell_widget)
-    lay_out.addWidget(checkbox)
-    lay_out.setAlignment(Qt.AlignCenter)
-    lay_out.setContentsMargins(0, 0, 0, 0)
-    return lay_out
+# Signal of the widget that tells its value changed
+def widget_signal(widget):
+    if isinstance(widget, QComboBox):
+        return widget.currentIndexChanged
+    if isinstance(widget, QCheckBox):
+        return widget.stateChanged
+    return widget.valueChanged
+
+
+# Value of the widget as it is stored in the parameters
+def widget_reader(widget):
+    if isinstance(widget, QComboBox):
+        return widget.currentText
+    if isinstance(widget, QCheckBox):
+        return widget.isChecked
+    return widget.value
+
+
+# Shows the value in the widget
+def write_widget(widget, value):
+    if isinstance(widget, QComboBox):
+        widget.setCurrentText(value)
+    elif isinstance(widget, QCheckBox):
+        widget.setChecked(value)
+    else:
+        widget.setValue(value)
+
+
+# Widget for a field of the parameter schema
+def init_widget(field):
+    if field.kind == 'choice':
+        widget = QComboBox()
+        widget.addItems(field.values)
+    elif field.kind == 'bool':
+        widget = QCheckBox()
+    elif field.kind == 'int':
+        widget = QSpinBox()
+        widget.setRange(*field.values)
+    else:
+        widget = QDoubleSpinBox()
+        widget.setRange(*field.values)
+        widget.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
+    return widget
 
 
 def init_label(text):
@@ -82,14 +133,50 @@ class ParametersWidget(QTabWidget):
     The main component of the GUI it contains the three tabs corresponding to input files,
     input parameters and paths for the conversion executables
     """
-    input_files = []
-    parameters = {}
+    # result of pairing the identification files of the last edit with the raw files
+    pairing = None
+    # identification files found by the running folder scan
+    found_idents = []
     # creates a file processor for processing .mgf files
     file_processor = files.FileProcessor()
+    # what is known about the input files, the project replaces it with one stored next to it
+    file_catalog = catalog.FileCatalog()
+    catalog_refresher = None
+    catalog_watcher = None
+    # the project directory, where its past runs are recorded, and what they say about the estimates
+    output_dir = None
+    calibration = estimator.Calibration()
+    run_btn = None
     placeholder = 'Description of container'
 
     def __init__(self, parent=None):
         super(ParametersWidget, self).__init__(parent)
+        self.parameter_model = parameter_model.ParameterModel(parent=self)
+        self.parameter_model.changed.connect(self.tune_samples)
+        self.parameter_model.changed.connect(self.show_parameters)
+        self.validator = validation.Validator()
+        self.parameter_model.changed.connect(self.validate)
+        # resources a run needs, shown next to the run button
+        self.estimate_label = QLabel()
+        self.estimate_label.hide()
+        self.parameter_model.changed.connect(self.show_estimate)
+        # grid the sampling makes, shown below the sampling parameters
+        self.grid_label = QLabel()
+        self.grid_label.setWordWrap(True)
+        self.parameter_model.changed.connect(self.show_grid)
+        # range of the data of the raw files, shown below the m/z and retention time window
+        self.data_range_label = QLabel()
+        self.data_range_label.setWordWrap(True)
+        self.data_range_btn = QPushButton('Use data range')
+        self.data_range_btn.setToolTip('Sets the m/z and retention time window to the range of the data of the raw '
+                                       'files, so pastaq does not read more than there is')
+        self.data_range_btn.clicked.connect(self.use_data_range)
+        self.data_range = QWidget()
+        data_range_layout = QHBoxLayout(self.data_range)
+        data_range_layout.setContentsMargins(0, 0, 0, 0)
+        data_range_layout.addWidget(self.data_range_label, 1)
+        data_range_layout.addWidget(self.data_range_btn)
+        self.parameter_model.changed.connect(self.show_data_range)
 
         # The tabs that make up the widget
         self.input_files_tab = QWidget()
@@ -101,7 +188,25 @@ class ParametersWidget(QTabWidget):
         self.addTab(self.input_paths_tab, 'Paths')
         self.input_files_tab_ui()
         self.parameters_tab_ui()
-        self.input_paths_tab_ui()
+        self.currentChanged.connect(self.tab_changed)
+
+    # the parameters are held by the parameter model, setting them loads new ones at once
+    @property
+    def parameters(self):
+        return self.parameter_model.values
+
+    @parameters.setter
+    def parameters(self, parameters):
+        self.parameter_model.load(parameters)
+
+    # the input files are held by the model of the input files table
+    @property
+    def input_files(self):
+        return self.input_files_model.input_files
+
+    @input_files.setter
+    def input_files(self, input_files):
+        self.input_files_model.set_files(input_files)
 
     def set_saved(self, bool):
         global saved
@@ -111,38 +216,86 @@ class ParametersWidget(QTabWidget):
     def get_file_processor(self):
         return self.file_processor
 
-    # Table for file input
+    # uses the catalog stored at the given path, which is refreshed in the background
+    # and follows the changes in the directories of the input files
+    # without a path the catalog is only kept in memory and files are looked at when they are added
+    def set_catalog(self, path):
+        self.close_catalog()
+        self.file_catalog = catalog.FileCatalog(path)
+        self.input_files_model.file_catalog = self.file_catalog
+        self.input_files_model.update_missing()
+        self.load_calibration(os.path.dirname(path) if path else None)
+        if not path:
+            return
+        self.catalog_refresher = catalog.CatalogRefresher(self.file_catalog)
+        self.catalog_refresher.refreshed.connect(self.catalog_refreshed)
+        self.catalog_watcher = catalog.CatalogWatcher(self)
+        self.catalog_watcher.changed.connect(self.catalog_refresher.refresh)
+        self.refresh_catalog()
+
+    def close_catalog(self):
+        if self.catalog_watcher:
+            self.catalog_watcher.deleteLater()
+            self.catalog_watcher = None
+        if self.catalog_refresher:
+            self.catalog_refresher.stop()
+            self.catalog_refresher = None
+
+    # paths of the raw and identification files of the project
+    def input_paths(self):
+        paths = []
+        for input_file in self.input_files:
+            paths.append(input_file['raw_path'])
+            if 'ident_path' in input_file:
+                paths.append(input_file['ident_path'])
+        return paths
+
+    # looks at the given files again, all input files by default
+    # without a background refresh the files are looked at right away
+    def refresh_catalog(self, paths=None):
+        if paths is None:
+            paths = self.input_paths()
+        if self.catalog_refresher:
+            self.catalog_refresher.refresh(paths)
+            self.catalog_watcher.watch(self.input_paths())
+        elif self.file_catalog.update_stats(paths):
+            self.show_input_files()
+
+    # the run button stays as it is while the pipeline runs
+    def catalog_refreshed(self):
+        if self.isEnabled():
+            self.show_input_files()
+
+    # Table for file input, a view on the model of the input files
     def init_files_table(self):
-        input_files_table = QTableWidget()
-        input_files_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        input_files_table.setSelectionBehavior(QTableWidget.SelectRows)
-        input_files_table.setRowCount(0)
-        input_files_table.setColumnCount(4)
+        self.input_files_model = file_table.InputFilesModel([], self.file_catalog, self)
+        input_files_table = QTableView()
+        input_files_table.setModel(self.input_files_model)
+        input_files_table.setItemDelegate(file_table.InputFileDelegate(input_files_table))
+        input_files_table.setEditTriggers(QTableView.NoEditTriggers)
+        input_files_table.setSelectionBehavior(QTableView.SelectRows)
         input_files_table.setFocusPolicy(False)
-        column_names = [
-            'Raw File (mzXML/mzML)',
-            'Identification file (mgf/mzID)',
-            'Group',
-            'Reference'
-        ]
-        input_files_table.setHorizontalHeaderLabels(column_names)
+        input_files_table.setWordWrap(False)
         input_files_table.verticalHeader().hide()
-        header = input_files_table.horizontalHeader()
-        header.setSectionResizeMode(QHeaderView.ResizeToContents)
         return input_files_table
 
+    # sizing to the contents would look at every row, so group and reference have fixed widths
     def init_header(self):
         header = self.input_files_table.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.Stretch)
         header.setSectionResizeMode(1, QHeaderView.Stretch)
-        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)
-        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(2, QHeaderView.Interactive)
+        header.setSectionResizeMode(3, QHeaderView.Fixed)
+        header.resizeSection(2, 120)
+        header.resizeSection(3, 90)
+        self.input_files_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
     # Buttons to control the files table
-    def init_control(self, add_button, edit_button, remove_button, remove_all_button):
+    def init_control(self, add_button, add_folder_button, edit_button, remove_button, remove_all_button):
         buttons = QWidget()
         controls_layout = QHBoxLayout()
         controls_layout.addWidget(add_button)
+        controls_layout.addWidget(add_folder_button)
         controls_layout.addWidget(edit_button)
         controls_layout.addWidget(remove_button)
         controls_layout.addWidget(remove_all_button)
@@ -155,6 +308,9 @@ class ParametersWidget(QTabWidget):
 
         # buttons
         add_button = init_button('Add mzXML/mzML', self.add_file, 'Add quantification files (.mzXML or .mzML)')
+        add_folder_button = init_button('Add folder', self.add_folder,
+                                        'Add all quantification files in a folder and its subfolders, '
+                                        'identification files found there are paired with them')
         edit_button = init_button('Add/Edit mgf/mzID and group', self.edit_file,
                                   'Add identification files to the selected quantification files (.mgf or .mzID)')
         remove_button = init_button('Remove', self.remove_file, 'Remove entire row')
@@ -163,10 +319,15 @@ class ParametersWidget(QTabWidget):
         select_all_button.setShortcut(QKeySequence('Ctrl+A'))
 
         # control panel
-        input_file_buttons = self.init_control(add_button, edit_button, remove_button, select_all_button)
+        input_file_buttons = self.init_control(add_button, add_folder_button, edit_button, remove_button,
+                                               select_all_button)
+
+        self.missing_label = QLabel()
+        self.missing_label.hide()
 
         layout = QVBoxLayout()
         layout.addWidget(input_file_buttons)
+        layout.addWidget(self.missing_label)
         layout.addWidget(self.input_files_table)
         self.input_files_tab.setLayout(layout)
 
@@ -277,12 +438,80 @@ class ParametersWidget(QTabWidget):
         self.make_bold(box)
         return box
 
+    # Settings for running several identifications side by side
+    def identification_container(self):
+        box = QGroupBox('Automatic identification')
+        lay_ident = QFormLayout()
+
+        self.ident_workers = QSpinBox()
+        self.ident_workers.setRange(0, 256)
+        self.ident_workers.setSpecialValueText('Auto')
+        self.ident_workers.setValue(self.file_processor.workers)
+        self.ident_workers.valueChanged.connect(self.file_processor.set_workers)
+        tooltip = 'Number of .mgf files identified at the same time (Auto: limited by cores and memory)'
+        lay_ident.addRow(buttons.init_button_params('Parallel identifications', tooltip), self.ident_workers)
+
+        self.ident_conversions = QSpinBox()
+        self.ident_conversions.setRange(0, 256)
+        self.ident_conversions.setSpecialValueText('Auto')
+        self.ident_conversions.setValue(self.file_processor.conversions)
+        self.ident_conversions.valueChanged.connect(self.file_processor.set_conversions)
+        tooltip = 'Number of .pepXML files converted to .mzID at the same time (Auto: one per core)'
+        lay_ident.addRow(buttons.init_button_params('Parallel conversions', tooltip), self.ident_conversions)
+
+        self.ident_converter = QComboBox()
+        self.ident_converter.addItems(files.CONVERTERS)
+        self.ident_converter.setCurrentText(self.file_processor.converter)
+        self.ident_converter.currentTextChanged.connect(self.file_processor.set_converter)
+        tooltip = inspect.cleandoc('''Conversion of the MSFragger .pepXML results to .mzID.
+                          The built-in converter does not need idconvert, so it also works on Linux.''')
+        lay_ident.addRow(buttons.init_button_params('Converter', tooltip), self.ident_converter)
+
+        self.ident_all_or_nothing = QCheckBox()
+        self.ident_all_or_nothing.setChecked(self.file_processor.all_or_nothing)
+        self.ident_all_or_nothing.toggled.connect(self.file_processor.set_all_or_nothing)
+        tooltip = inspect.cleandoc('''Stop the run when the identification of any .mgf file fails.
+                          Otherwise the failed files are quantified without identifications.''')
+        lay_ident.addRow(buttons.init_button_params('Stop on failure', tooltip), self.ident_all_or_nothing)
+
+        self.ident_batched = QCheckBox()
+        self.ident_batched.setChecked(self.file_processor.batched)
+        self.ident_batched.toggled.connect(self.file_processor.set_batched)
+        tooltip = inspect.cleandoc('''Search all .mgf files in a single MSFragger run.
+                          The protein database is only digested and indexed once.''')
+        lay_ident.addRow(buttons.init_button_params('Single MSFragger run', tooltip), self.ident_batched)
+
+        self.ident_shard_spectra = QSpinBox()
+        self.ident_shard_spectra.setRange(0, 100000000)
+        self.ident_shard_spectra.setSingleStep(100000)
+        self.ident_shard_spectra.setSpecialValueText('Off')
+        self.ident_shard_spectra.setValue(self.file_processor.shard_spectra)
+        self.ident_shard_spectra.valueChanged.connect(self.file_processor.set_shard_spectra)
+        tooltip = inspect.cleandoc('''.mgf files with more spectra are split into shards of this many spectra.
+                          The shards are searched side by side with smaller heaps and their results merged.
+                          Mass calibration and parameter optimization are off for the shards,
+                          so their results can differ from a calibrated search of the whole file.''')
+        lay_ident.addRow(buttons.init_button_params('Spectra per shard', tooltip), self.ident_shard_spectra)
+
+        box.setLayout(lay_ident)
+        self.make_bold(box)
+        return box
+
+    # the paths tab is built the first time it is shown
+    def tab_changed(self, index):
+        if self.widget(index) is self.input_paths_tab and not self.paths_built():
+            self.input_paths_tab_ui()
+
+    def paths_built(self):
+        return self.input_paths_tab.widget() is not None
+
     # Adding the paths input to the UI
     def input_paths_tab_ui(self):
         info_box = self.information_container()
         msfragger_box = self.msfragger_container()
         id_box = self.idconvert_container()
         params_box = self.params_container()
+        ident_box = self.identification_container()
 
         widget = QWidget()
         self.input_paths_tab.setWidget(widget)
@@ -293,6 +522,7 @@ class ParametersWidget(QTabWidget):
         layout.addWidget(msfragger_box)
         layout.addWidget(id_box)
         layout.addWidget(params_box)
+        layout.addWidget(ident_box)
         widget.setLayout(layout)
 
     # Adds a file to the GUI
@@ -308,24 +538,72 @@ class ParametersWidget(QTabWidget):
     def add_new_file(self, file_paths):
         if len(file_paths) > 0:
             os.chdir(os.path.dirname(file_paths[0]))
-            input_files = self.input_files
-            current_files = [file['raw_path'] for file in self.input_files]
+            current_files = {file['raw_path'] for file in self.input_files}
+            new_files = []
             for file_path in file_paths:
                 if file_path not in current_files:
-                    input_files.append({'raw_path': file_path, 'reference': False})
-            self.update_input_files(input_files)
+                    current_files.add(file_path)
+                    new_files.append({'raw_path': file_path, 'reference': False})
+            self.input_files_model.append_files(new_files)
+            self.input_files_changed(new_files)
+
+    def add_folder(self):
+        folder = QFileDialog.getExistingDirectory(
+            parent=self,
+            caption='Select folder with input files',
+            directory=os.getcwd(),
+        )
+        if len(folder) > 0:
+            self.scan_folders([folder])
+
+    # Scans the folders in the background, quantification files are added as they are found and
+    # the identification files found are paired with the quantification files without one at the end
+    def scan_folders(self, folders):
+        self.found_idents = []
+        self.folder_scanner = files.FolderScanner(folders, files.RAW_EXTENSIONS + files.IDENT_EXTENSIONS, self)
+        self.folder_scanner.found.connect(self.add_found_files)
+        self.folder_scanner.finished.connect(self.pair_found_files)
+        self.scan_progress = files.ScanProgress(self.folder_scanner, self)
+        self.folder_scanner.start()
+
+    def add_found_files(self, paths):
+        raw_paths = [path for path in paths if path.lower().endswith(files.RAW_EXTENSIONS)]
+        self.found_idents += [path for path in paths if path.lower().endswith(files.IDENT_EXTENSIONS)]
+        self.add_new_file(raw_paths)
+
+    def pair_found_files(self):
+        unpaired = [row for row, file in enumerate(self.input_files) if 'ident_path' not in file]
+        if not self.found_idents or not unpaired:
+            return
+        self.pairing = pairing.Pairing([self.input_files[row]['raw_path'] for row in unpaired], self.found_idents,
+                                       self.parameters.get('pairing_rules'))
+        paired = [row for row in unpaired if self.input_files[row]['raw_path'] in self.pairing.pairs]
+        for row in paired:
+            self.input_files[row]['ident_path'] = self.pairing.pairs[self.input_files[row]['raw_path']]
+        self.found_idents = []
+        self.input_files_model.update_rows(paired)
+        self.input_files_changed([self.input_files[row] for row in paired])
+        summary = self.pairing.summary()
+        if summary:
+            files.popup_window('Pairing', QMessageBox.Information, summary)
 
     # handle the files added to the edit dialog
     def examine_edit_files(self, old_list, edit_file_dialog, indexes):
+        self.pairing = None
+        single = len(indexes) == 1 and len(edit_file_dialog.mzid_paths) == 1
+        if not single and edit_file_dialog.mzid_paths:
+            self.pairing = pairing.Pairing([old_list[i]['raw_path'] for i in indexes], edit_file_dialog.mzid_paths,
+                                           self.parameters.get('pairing_rules'))
+            os.chdir(os.path.dirname(edit_file_dialog.mzid_paths[-1]))  # directory of the last identification file
         new_list = []
         for i, file in enumerate(old_list):
             if i in indexes:
                 new_file = file
                 new_file['group'] = edit_file_dialog.group
-                if len(indexes) == 1 and len(edit_file_dialog.mzid_paths) == 1:
+                if single:
                     single_id_file(edit_file_dialog.mzid_paths[0], new_file)
-                else:
-                    multiple_id_files(file, new_file, edit_file_dialog)
+                elif self.pairing:
+                    multiple_id_files(file, new_file, edit_file_dialog, self.pairing.pairs)
                 new_list += [new_file]
             else:
                 new_list += [file]
@@ -337,11 +615,14 @@ class ParametersWidget(QTabWidget):
         indexes = self.find_selected_files()
         if len(indexes) == 0:
             return
-        edit_file_dialog = files.EditFileDialog()
+        edit_file_dialog = files.EditFileDialog(polarity=self.parameters.get('polarity', 'both'))
         if edit_file_dialog.exec():
-            old_list = self.input_files
-            new_list = self.examine_edit_files(old_list, edit_file_dialog, indexes)
-            self.update_input_files(new_list)
+            self.examine_edit_files(self.input_files, edit_file_dialog, indexes)
+            self.input_files_model.update_rows(indexes)
+            self.input_files_changed([self.input_files[i] for i in indexes])
+            summary = self.pairing.summary() if self.pairing else None
+            if summary:
+                files.popup_window('Pairing', QMessageBox.Information, summary)
 
     def get_saved(self):
         return saved == self.file_processor.get_saved()
@@ -352,96 +633,159 @@ class ParametersWidget(QTabWidget):
     def remove_file(self):
         indexes = self.find_selected_files()
         if len(indexes) > 0:
-            old_list = self.input_files
-            new_list = []
-            for i, file in enumerate(old_list):
-                if i not in indexes:
-                    new_list += [file]
-            self.update_input_files(new_list)
+            self.input_files_model.remove_rows(indexes)
+            self.input_files_changed([])
 
     # Finds the index of the selected files in the UI
     def find_selected_files(self):
-        selected_ranges = self.input_files_table.selectedRanges()
-        indexes = []
-        for sel in selected_ranges:
-            for i in range(sel.topRow(), sel.bottomRow() + 1):
-                indexes += [i]
-        return indexes
+        return sorted(index.row() for index in self.input_files_table.selectionModel().selectedRows())
 
     def set_run_btn(self, run_btn):
         self.run_btn = run_btn
     
-    # Checks whether the run button should be enabled or not
+    # Checks whether the run and sweep buttons should be enabled or not
     def check_run_btn(self):
-        if not self.input_files:
-            self.run_btn.setEnabled(False)
-            return
+        runnable = self.runnable()
+        self.sweep_btn.setEnabled(runnable)
+        if self.run_btn:
+            self.run_btn.setEnabled(runnable)
+
+    # Whether the parameters are valid and all input files exist
+    def runnable(self):
+        if not self.input_files or self.validator.errors:
+            return False
         for _, input_file in enumerate(self.input_files):
-            if not Path(input_file['raw_path']).is_file() or not 'ident_path' in input_file or not Path(input_file['ident_path']).is_file():
-                self.run_btn.setEnabled(False)
-                return
-        self.run_btn.setEnabled(True)
+            if not self.file_catalog.exists(input_file['raw_path']) or not 'ident_path' in input_file or not self.file_catalog.exists(input_file['ident_path']):
+                return False
+        return True
 
-    # Updates the UI in case of a change in the input files
+    # Replaces all input files in the UI
     def update_input_files(self, input_files):
+        self.input_files = input_files
+        self.input_files_changed(self.input_files)
+
+    # After a change in the input files, the changed files are checked for missing ones
+    # files that are missing are marked once the catalog looked at them
+    def input_files_changed(self, changed_files):
         global saved
         saved = False
-        self.input_files = input_files
-        self.input_files_table.setRowCount(len(self.input_files))
-        missing = False
-        for i, input_file in enumerate(self.input_files):
-            text = input_file['raw_path']
-            if not Path(text).is_file():
-                text = '<b>(missing)</b> ' + text
-                missing = True
-            self.input_files_table.setCellWidget(i, 0, QLabel(text))
-            if 'ident_path' in input_file:
-                text = input_file['ident_path']
-                if not Path(text).is_file():
-                    text = '<b>(missing)</b> ' + text
-                    missing = True
-                self.input_files_table.setCellWidget(i, 1, QLabel(text))
-            if 'group' in input_file:
-                text = input_file['group']
-                self.input_files_table.setCellWidget(i, 2, QLabel(text))
-            if 'reference' in input_file:
-                cell_widget = self.make_reference(input_file['reference'])
-                self.input_files_table.setCellWidget(i, 3, cell_widget)
-        if missing:
-            files.popup_window('Warning', QMessageBox.Warning, 'Some input files are missing!')
+        self.show_input_files()
+        paths = [input_file['raw_path'] for input_file in changed_files]
+        paths += [input_file['ident_path'] for input_file in changed_files if 'ident_path' in input_file]
+        self.refresh_catalog(paths)
+
+    # Shows the input files as the catalog knows them now
+    def show_input_files(self):
+        self.input_files_model.update_missing()
+        missing = sum(self.file_catalog.exists(path) is False for path in self.input_paths())
+        self.missing_label.setText('<b>{} input files are missing</b>'.format(missing))
+        self.missing_label.setVisible(missing > 0)
         self.check_run_btn()
-
+        self.show_estimate()
+        self.show_data_range()
+        # the grid follows the range of the data of the raw files once they are scanned
+        self.tune_samples(estimator.SAMPLING_PARAMS)
+        self.show_grid()
+
+    # calibrates the estimates with the runs recorded in the output directory
+    def load_calibration(self, output_dir):
+        self.output_dir = output_dir
+        self.calibration = estimator.Calibration.load(output_dir)
+        self.show_estimate()
+
+    # uncalibrated estimate of the resources of a run, None until the parameters are valid
+    # and the catalog knows the size of every raw file
+    # the automatic number of stage workers is the one the pipeline picks for the free memory
+    def estimate(self):
+        if self.validator.errors or not self.input_files:
+            return None
+        sizes = []
+        for input_file in self.input_files:
+            entry = self.file_catalog.get(input_file['raw_path'])
+            if not entry or not entry.present:
+                return None
+            sizes.append(entry.size)
+        params = parameter_schema.complete(self.parameters)
+        base = estimator.estimate(params, sizes, bounds=self.raw_bounds())
+        task_memory = self.calibration.apply(base).task_memory
+        base.workers = estimator.stage_workers(params.get('pipeline_workers', 0), len(sizes), task_memory,
+                                               files.available_memory())
+        return base
+
+    # Shows the calibrated estimate and warns about the limits of the machine a run would exceed
+    def show_estimate(self, *args):
+        base = self.estimate()
+        if base is None:
+            self.estimate_label.hide()
+            return
+        estimate = self.calibration.apply(base)
+        warnings = []
+        memory = files.available_memory()
+        if memory is not None and estimate.memory > memory:
+            warnings.append('only {} of memory is free'.format(files.format_size(memory)))
+        if self.output_dir and os.path.isdir(self.output_dir):
+            disk = shutil.disk_usage(self.output_dir).free
+            if estimate.disk > disk:
+                warnings.append('only {} of disk space is free'.format(files.format_size(disk)))
+        text = 'Needs about {} of memory, {} of disk space and {}'.format(
+            files.format_size(estimate.memory), files.format_size(estimate.disk),
+            datetime.timedelta(seconds=round(estimate.time)))
+        if warnings:
+            text = '<b>{}, but {}</b>'.format(text, ' and '.join(warnings))
+        self.estimate_label.setText(text)
+        self.estimate_label.setStyleSheet('color: red' if warnings else '')
+        mz, rt = max(estimate.grids, key=lambda grid: grid[0] * grid[1])
+        if self.calibration.runs:
+            calibrated = 'Calibrated with the last {} complete runs of the project.'.format(self.calibration.runs)
+        else:
+            calibrated = 'Not calibrated yet, every complete run of the project makes the estimate more accurate.'
+        self.estimate_label.setToolTip('\n'.join([
+            'Largest grid: {} x {} points (m/z x retention time)'.format(mz, rt),
+            'Stage workers: {}'.format(estimate.workers),
+            calibrated,
+            'The identification of .mgf files is not included.',
+        ]))
+        self.estimate_label.show()
+
+    # the settings are loaded into the file processor, the paths tab shows them once it is built
     def load_params(self, path):
         self.file_processor.load_params_path(path)
-        self.input_params.setText(path)
+        self.show_paths()
+
+    def load_identification_settings(self, workers, conversions, converter, all_or_nothing, batched, shard_spectra):
+        self.file_processor.set_workers(workers)
+        self.file_processor.set_conversions(conversions)
+        self.file_processor.set_converter(converter)
+        self.file_processor.set_all_or_nothing(all_or_nothing)
+        self.file_processor.set_batched(batched)
+        self.file_processor.set_shard_spectra(shard_spectra)
+        self.show_paths()
 
     def load_ms_path(self, path):
         if self.file_processor.load_ms_path(path):
-            self.input_ms.setText(path)
+            self.show_paths()
         else:
             files.popup_window('Error', QMessageBox.Warning, 'Invalid MSFragger path')
 
     def load_id_path(self, path):
         if self.file_processor.load_id_path(path):
-            self.input_id.setText(path)
+            self.show_paths()
         else:
             files.popup_window('Error', QMessageBox.Warning, 'Invalid idconvert path')
 
-    # Enables the reference checkmark box next to each file pair
-    def make_reference(self, reference):
-        cell_widget = QWidget()
-        checkbox = QCheckBox()
-        if reference:
-            checkbox.setCheckState(Qt.Checked)
-        lay_out = init_check(cell_widget, checkbox)
-        cell_widget.setLayout(lay_out)
-        checkbox.stateChanged.connect(self.toggle_reference)
-        return cell_widget
-
-    def toggle_reference(self):
-        for row in range(self.input_files_table.rowCount()):
-            checkbox = self.input_files_table.cellWidget(row, 3).children()[1]
-            self.input_files[row]['reference'] = checkbox.isChecked()
+    # Shows the settings of the file processor in the paths tab
+    def show_paths(self):
+        if not self.paths_built():
+            return
+        self.input_ms.setText(self.file_processor.ms_jar[1])
+        self.input_id.setText(self.file_processor.id_file[1])
+        self.input_params.setText(self.file_processor.params[1])
+        self.ident_workers.setValue(self.file_processor.workers)
+        self.ident_conversions.setValue(self.file_processor.conversions)
+        self.ident_converter.setCurrentText(self.file_processor.converter)
+        self.ident_all_or_nothing.setChecked(self.file_processor.all_or_nothing)
+        self.ident_batched.setChecked(self.file_processor.batched)
+        self.ident_shard_spectra.setValue(self.file_processor.shard_spectra)
 
     # creates a gridlayout and sets the default row stretch
     def get_grid(self):
@@ -452,493 +796,11 @@ class ParametersWidget(QTabWidget):
         grid.setRowStretch(3, 2)
         return grid
 
-    # Section of parameters
-    # This initialises the UI for each parameter, as well as the values it can take
-    def init_inst(self):
-        grid_layout_inst = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_inst.addWidget(label, 0, 0, 1, 3)
-
-        self.inst_type = QComboBox()
-        self.inst_type.addItems(['orbitrap', 'tof', 'ft-icr', 'quadrupole'])
-        self.inst_type.currentIndexChanged.connect(self.update_parameters)
-        tooltip = 'The type of mass analyser used to acquire the data.'
-        grid_layout_inst.addWidget(ParameterItem('Instrument type', tooltip, self.inst_type), 1, 0)
-
-        self.res_ms1 = QSpinBox()
-        self.res_ms1.setRange(-LARGE, LARGE)
-        self.res_ms1.valueChanged.connect(self.update_parameters)
-        tooltip = 'MS1 resolution set on the mass spectrometer at the time of data acquisition.'
-        grid_layout_inst.addWidget(ParameterItem('Resolution MS1', tooltip, self.res_ms1), 1, 1)
-
-        self.res_ms2 = QSpinBox()
-        self.res_ms2.setRange(-LARGE, LARGE)
-        self.res_ms2.valueChanged.connect(self.update_parameters)
-        tooltip = 'MS/MS resolution set on the mass spectrometer at the time of data acquisition.'
-        grid_layout_inst.addWidget(ParameterItem('Resolution MS2', tooltip, self.res_ms2), 1, 2)
-
-        self.reference_mz = QSpinBox()
-        self.reference_mz.setRange(-LARGE, LARGE)
-        self.reference_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Reference m/z at which the resolution is calculated.'
-        grid_layout_inst.addWidget(ParameterItem('Reference m/z', tooltip, self.reference_mz), 2, 0)
-
-        self.avg_fwhm_rt = QSpinBox()
-        self.avg_fwhm_rt.setRange(-LARGE, LARGE)
-        self.avg_fwhm_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Expected full-width half-maximum width of chromatographic peaks.'
-        grid_layout_inst.addWidget(ParameterItem('Avg FWHM RT', tooltip, self.avg_fwhm_rt), 2, 1)
-
-        return grid_layout_inst
-
-    # Section of parameters
-    def init_raw_data(self):
-        grid_layout_raw_data = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_raw_data.addWidget(label, 0, 0, 1, 3)
-
-        self.min_mz = QDoubleSpinBox()
-        self.min_mz.setRange(0, LARGE)
-        self.min_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.min_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Filter minimum m/z value for spectra during raw data reading.'
-        grid_layout_raw_data.addWidget(ParameterItem('Min m/z', tooltip, self.min_mz), 1, 0)
-
-        self.max_mz = QDoubleSpinBox()
-        self.max_mz.setRange(0, LARGE)
-        self.max_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.max_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Filter maximum m/z value for spectra during raw data reading.'
-        grid_layout_raw_data.addWidget(ParameterItem('Max m/z', tooltip, self.max_mz), 1, 1)
-
-        self.polarity = QComboBox()
-        self.polarity.addItems(['positive', 'negative', 'both'])
-        self.polarity.currentIndexChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Filter polarity (Positive '+', negative '-', or any) for spectra during raw data reading.
-                          This should only be modified if the raw data file contains both positive and negative polarity spectra.''')
-        grid_layout_raw_data.addWidget(ParameterItem('Polarity', tooltip, self.polarity), 1, 2)
-
-        self.min_rt = QDoubleSpinBox()
-        self.min_rt.setRange(0, LARGE)
-        self.min_rt.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.min_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Filter minimum retention time value for spectra during raw data reading.'
-        grid_layout_raw_data.addWidget(ParameterItem('Min retention time', tooltip, self.min_rt), 2, 0)
-
-        self.max_rt = QDoubleSpinBox()
-        self.max_rt.setRange(0, LARGE)
-        self.max_rt.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.max_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Filter maximum retention time value for spectra during raw data reading.'
-        grid_layout_raw_data.addWidget(ParameterItem('Max retention time', tooltip, self.max_rt), 2, 1)
-
-        return grid_layout_raw_data
-
-    # Section of parameters
-    def init_resamp(self):
-        grid_layout_resamp = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_resamp.addWidget(label, 0, 0, 1, 3)
-
-        self.num_samples_mz = QSpinBox()
-        self.num_samples_mz.setRange(-LARGE, LARGE)
-        self.num_samples_mz.valueChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Number of sampling points per full-width half-maximum in m/z.
-                          If the memory consumption is too high it can be reduced at
-                          the cost of potentially missing peaks or obtaining less accurate fitting.''')
-        grid_layout_resamp.addWidget(ParameterItem('Number of samples m/z', tooltip, self.num_samples_mz), 1, 0)
-
-        self.num_samples_rt = QSpinBox()
-        self.num_samples_rt.setRange(-LARGE, LARGE)
-        self.num_samples_rt.valueChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Number of sampling points per full-width half-maximum in retention time.
-                          If the memory consumption is too high it can be reduced at the
-                          cost of potentially missing peaks or obtaining less accurate fitting.''')
-        grid_layout_resamp.addWidget(ParameterItem('Number of samples rt', tooltip, self.num_samples_rt), 1, 1)
-
-        self.smoothing_coefficient_mz = QDoubleSpinBox()
-        self.smoothing_coefficient_mz.setRange(-LARGE, LARGE)
-        self.smoothing_coefficient_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.smoothing_coefficient_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Amount of smoothing applied for resampling in the m/z dimension.'
-        grid_layout_resamp.addWidget(
-            ParameterItem('Smoothing coefficient (m/z)', tooltip, self.smoothing_coefficient_mz), 1, 2)
-
-        self.smoothing_coefficient_rt = QDoubleSpinBox()
-        self.smoothing_coefficient_rt.setRange(-LARGE, LARGE)
-        self.smoothing_coefficient_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.smoothing_coefficient_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Amount of smoothing applied for resampling in the retention time dimension.'
-        grid_layout_resamp.addWidget(
-            ParameterItem('Smoothing coefficient (rt)', tooltip, self.smoothing_coefficient_rt), 2, 0)
-
-        self.max_peaks = QSpinBox()
-        self.max_peaks.setRange(-LARGE, LARGE)
-        self.max_peaks.valueChanged.connect(self.update_parameters)
-        tooltip = 'Maximum number of peaks per file being detected at isotope level in decreasing intensity order.'
-        grid_layout_resamp.addWidget(ParameterItem('Max number of peaks', tooltip, self.max_peaks), 3, 0)
-
-        self.feature_detection_charge_state_min = QSpinBox()
-        self.feature_detection_charge_state_min.setRange(1, LARGE)
-        self.feature_detection_charge_state_min.valueChanged.connect(self.update_parameters)
-        tooltip = 'Feature detection charge state min.'
-        grid_layout_resamp.addWidget(
-            ParameterItem('Feature detection min charge', tooltip, self.feature_detection_charge_state_min), 2, 1)
-
-        self.feature_detection_charge_state_max = QSpinBox()
-        self.feature_detection_charge_state_max.setRange(1, LARGE)
-        self.feature_detection_charge_state_max.valueChanged.connect(self.update_parameters)
-        tooltip = 'Feature detection charge state max.'
-        grid_layout_resamp.addWidget(
-            ParameterItem('Feature detection max charge', tooltip, self.feature_detection_charge_state_max), 2, 2)
-
-        return grid_layout_resamp
-
-    # Section of parameters
-    def init_warp(self):
-        grid_layout_warp = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_warp.addWidget(label, 0, 0, 1, 3)
-
-        self.warp2d_slack = QSpinBox()
-        self.warp2d_slack.setRange(-LARGE, LARGE)
-        self.warp2d_slack.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of points allowed to move for each anchor node during retention time alignment.'
-        grid_layout_warp.addWidget(ParameterItem('Slack', tooltip, self.warp2d_slack), 1, 0)
-
-        self.warp2d_window_size = QSpinBox()
-        self.warp2d_window_size.setRange(-LARGE, LARGE)
-        self.warp2d_window_size.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of points between anchor points.'
-        grid_layout_warp.addWidget(ParameterItem('Window Size', tooltip, self.warp2d_window_size), 1, 1)
-
-        self.warp2d_num_points = QSpinBox()
-        self.warp2d_num_points.setRange(-LARGE, LARGE)
-        self.warp2d_num_points.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of points in which the minimum and maximum retention time range will be discretized.'
-        grid_layout_warp.addWidget(ParameterItem('Number of points', tooltip, self.warp2d_num_points), 1, 2)
-
-        self.warp2d_rt_expand_factor = QDoubleSpinBox()
-        self.warp2d_rt_expand_factor.setRange(-LARGE, LARGE)
-        self.warp2d_rt_expand_factor.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.warp2d_rt_expand_factor.valueChanged.connect(self.update_parameters)
-        tooltip = 'Expansion of the retention time range to avoid edge effects at the min/max nodes.'
-        grid_layout_warp.addWidget(ParameterItem('Expand factor rt', tooltip, self.warp2d_rt_expand_factor), 2, 0)
-        self.warp_box.setLayout(grid_layout_warp)
-
-        self.warp2d_peaks_per_window = QSpinBox()
-        self.warp2d_peaks_per_window.setRange(-LARGE, LARGE)
-        self.warp2d_peaks_per_window.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of peaks used for similarity calculation in each alignment window.'
-        grid_layout_warp.addWidget(ParameterItem('Peaks per window', tooltip, self.warp2d_peaks_per_window), 2, 1)
-
-        return grid_layout_warp
-
-    # Section of parameters
-    def init_meta(self):
-        grid_layout_meta = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_meta.addWidget(label, 0, 0, 1, 3)
-
-        self.metamatch_fraction = QDoubleSpinBox()
-        self.metamatch_fraction.setRange(-LARGE, LARGE)
-        self.metamatch_fraction.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.metamatch_fraction.valueChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Minimum percentage of peak presence (value between 0 and 1) in at least
-                one sample group to be included in Metamatch result.
-                For example, if there are 10 samples in group A and 10 in group B,
-                for a fraction value of 0.7, we consider a valid cluster if there are 
-                matched peaks present in at least 7 samples in at least one of the sample group.''')
-        grid_layout_meta.addWidget(ParameterItem('Fraction of samples', tooltip, self.metamatch_fraction), 1, 0)
-
-        self.metamatch_n_sig_mz = QDoubleSpinBox()
-        self.metamatch_n_sig_mz.setRange(-LARGE, LARGE)
-        self.metamatch_n_sig_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.metamatch_n_sig_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of standard deviations to use as tolerance for m/z radius.'
-        grid_layout_meta.addWidget(ParameterItem('Number of sigma (m/z)', tooltip, self.metamatch_n_sig_mz), 1, 1)
-
-        self.metamatch_n_sig_rt = QDoubleSpinBox()
-        self.metamatch_n_sig_rt.setRange(-LARGE, LARGE)
-        self.metamatch_n_sig_rt.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.metamatch_n_sig_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of standard deviations to use as tolerance for retention time radius.'
-        grid_layout_meta.addWidget(ParameterItem('Number of sigma (rt)', tooltip, self.metamatch_n_sig_rt), 1, 2)
-
-        return grid_layout_meta
-
-    # Section of parameters
-    def init_ident(self):
-        grid_layout_ident = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_ident.addWidget(label, 0, 0, 1, 3)
-
-        self.ident_max_rank_only = QCheckBox()
-        self.ident_max_rank_only.stateChanged.connect(self.update_parameters)
-        tooltip = 'Only select the most confident PSM from each MS/MS spectra.'
-        grid_layout_ident.addWidget(ParameterItem('Max rank only', tooltip, self.ident_max_rank_only), 1, 0)
-
-        self.ident_require_threshold = QCheckBox()
-        self.ident_require_threshold.stateChanged.connect(self.update_parameters)
-        tooltip = 'Read only identifications that meet the target-decoy false discovery rate threshold.'
-        grid_layout_ident.addWidget(ParameterItem('Require threshold', tooltip, self.ident_require_threshold), 1, 1)
-
-        self.ident_ignore_decoy = QCheckBox()
-        self.ident_ignore_decoy.stateChanged.connect(self.update_parameters)
-        tooltip = 'Ignore PSM that have been detected as decoys by the identification engine.'
-        grid_layout_ident.addWidget(ParameterItem('Ignore decoy', tooltip, self.ident_ignore_decoy), 1, 2)
-
-        self.link_n_sig_mz = QDoubleSpinBox()
-        self.link_n_sig_mz.setRange(-LARGE, LARGE)
-        self.link_n_sig_mz.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.link_n_sig_mz.valueChanged.connect(self.update_parameters)
-        tooltip = 'Tolerance for ms2 events and identification linking measured in number of standard deviations for (m/z)'
-        grid_layout_ident.addWidget(ParameterItem('Max number of sigma for linking (m/z)', tooltip, self.link_n_sig_mz),
-                                    2, 0)
-        self.link_n_sig_rt = QDoubleSpinBox()
-        self.link_n_sig_rt.setRange(-LARGE, LARGE)
-        self.link_n_sig_rt.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.link_n_sig_rt.valueChanged.connect(self.update_parameters)
-        tooltip = 'Tolerance for ms2 events and identification linking measured in number of standard deviations for (rt)'
-        grid_layout_ident.addWidget(ParameterItem('Max number of sigma for linking (rt)', tooltip, self.link_n_sig_rt),
-                                    2, 1)
-        return grid_layout_ident
-
-    # Section of parameters
-    def init_qual(self):
-        grid_layout_qual = self.get_grid()
-        # TODO
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_qual.addWidget(label, 0, 0, 1, 3)
-
-        self.similarity_num_peaks = QSpinBox()
-        self.similarity_num_peaks.setRange(-LARGE, LARGE)
-        self.similarity_num_peaks.valueChanged.connect(self.update_parameters)
-        tooltip = 'Number of peaks used for the similarity matrix calculation.'
-        grid_layout_qual.addWidget(ParameterItem('Similarity number of peaks', tooltip, self.similarity_num_peaks), 1,
-                                   0)
-
-        self.qc_plot_palette = QComboBox()
-        self.qc_plot_palette.addItems(['husl', 'crest', 'Spectral', 'flare', 'mako'])
-        self.qc_plot_palette.currentIndexChanged.connect(self.update_parameters)
-        tooltip = 'Plot color palette.'
-        grid_layout_qual.addWidget(ParameterItem('Plot color palette', tooltip, self.qc_plot_palette), 1, 1)
-
-        self.qc_plot_extension = QComboBox()
-        self.qc_plot_extension.addItems(['png', 'pdf', 'eps'])
-        self.qc_plot_extension.currentIndexChanged.connect(self.update_parameters)
-        tooltip = 'Plot image format'
-        grid_layout_qual.addWidget(ParameterItem('Plot image format', tooltip, self.qc_plot_extension), 1, 2)
-
-        # This could be either text 'dynamic' or a double between 0.0-1.0. If
-        # set to 0.0 it will be considered dynamic.
-        self.qc_plot_fill_alpha = QDoubleSpinBox()
-        self.qc_plot_fill_alpha.setRange(0.0, 1.0)
-        self.qc_plot_fill_alpha.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_fill_alpha.valueChanged.connect(self.update_parameters)
-        tooltip = 'Transparency amount for fill plots.'
-        grid_layout_qual.addWidget(ParameterItem('Fill alpha', tooltip, self.qc_plot_fill_alpha), 2, 0)
-
-        self.qc_plot_line_style = QComboBox()
-        self.qc_plot_line_style.addItems(['fill', 'line'])
-        self.qc_plot_line_style.currentIndexChanged.connect(self.update_parameters)
-        tooltip = 'For line plots select if pure lines or fill plots should be used.'
-        grid_layout_qual.addWidget(ParameterItem('Line style', tooltip, self.qc_plot_line_style), 2, 1)
-
-        self.qc_plot_font_family = QComboBox()
-        self.qc_plot_font_family.addItems(['sans-serif', 'serif'])
-        self.qc_plot_font_family.currentIndexChanged.connect(self.update_parameters)
-        tooltip = 'Font family.'
-        grid_layout_qual.addWidget(ParameterItem('Font family', tooltip, self.qc_plot_font_family), 2, 2)
-
-        self.qc_plot_dpi = QSpinBox()
-        self.qc_plot_dpi.setRange(1, 1000)
-        self.qc_plot_dpi.valueChanged.connect(self.update_parameters)
-        tooltip = 'Plot dpi.'
-        grid_layout_qual.addWidget(ParameterItem('Plot dpi', tooltip, self.qc_plot_dpi), 3, 0)
-
-        self.qc_plot_mz_vs_sigma_mz_max_peaks = QSpinBox()
-        self.qc_plot_mz_vs_sigma_mz_max_peaks.setRange(10, LARGE)
-        self.qc_plot_mz_vs_sigma_mz_max_peaks.valueChanged.connect(self.update_parameters)
-        tooltip = 'How many peaks should be plotted for the m/z vs m/z width QC plot.'
-        grid_layout_qual.addWidget(
-            ParameterItem('Max peaks for m/z vs peak width m/z', tooltip, self.qc_plot_mz_vs_sigma_mz_max_peaks), 3, 1)
-
-        self.qc_plot_line_alpha = QDoubleSpinBox()
-        self.qc_plot_line_alpha.setRange(0.0, 1.0)
-        self.qc_plot_line_alpha.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_line_alpha.valueChanged.connect(self.update_parameters)
-        tooltip = 'Transparency amount for line plots.'
-        grid_layout_qual.addWidget(ParameterItem('Line alpha', tooltip, self.qc_plot_line_alpha), 3, 2)
-
-        self.qc_plot_scatter_alpha = QDoubleSpinBox()
-        self.qc_plot_scatter_alpha.setRange(0.0, 1.0)
-        self.qc_plot_scatter_alpha.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_scatter_alpha.valueChanged.connect(self.update_parameters)
-        tooltip = 'Transparency amount for scatter plots.'
-        grid_layout_qual.addWidget(ParameterItem('Scatter alpha', tooltip, self.qc_plot_scatter_alpha), 4, 0)
-
-        self.qc_plot_scatter_size = QDoubleSpinBox()
-        self.qc_plot_scatter_size.setRange(0.1, 10.0)
-        self.qc_plot_scatter_size.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_scatter_size.valueChanged.connect(self.update_parameters)
-        tooltip = 'Size of scatter points in QC plots.'
-        grid_layout_qual.addWidget(ParameterItem('Scatter size', tooltip, self.qc_plot_scatter_size), 4, 1)
-
-        self.qc_plot_min_dynamic_alpha = QDoubleSpinBox()
-        self.qc_plot_min_dynamic_alpha.setRange(0.1, 10.0)
-        self.qc_plot_min_dynamic_alpha.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_min_dynamic_alpha.valueChanged.connect(self.update_parameters)
-        tooltip = 'When using dynamic transparency, select a minimum alpha level to avoid too faint plots when many samples are present.'
-        grid_layout_qual.addWidget(ParameterItem('Min dynamic alpha', tooltip, self.qc_plot_min_dynamic_alpha), 4, 2)
-
-        self.qc_plot_font_size = QDoubleSpinBox()
-        self.qc_plot_font_size.setRange(1.0, 15.0)
-        self.qc_plot_font_size.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_font_size.valueChanged.connect(self.update_parameters)
-        tooltip = 'Font size.'
-        grid_layout_qual.addWidget(ParameterItem('Font size', tooltip, self.qc_plot_font_size), 5, 0)
-
-        self.qc_plot_fig_size_x = QDoubleSpinBox()
-        self.qc_plot_fig_size_x.setRange(1.0, 15.0)
-        self.qc_plot_fig_size_x.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_fig_size_x.valueChanged.connect(self.update_parameters)
-        tooltip = 'Figure size X.'
-        grid_layout_qual.addWidget(ParameterItem('Figure size X', tooltip, self.qc_plot_fig_size_x), 5, 1)
-
-        self.qc_plot_fig_size_y = QDoubleSpinBox()
-        self.qc_plot_fig_size_y.setRange(1.0, 15.0)
-        self.qc_plot_fig_size_y.setStepType(QAbstractSpinBox.AdaptiveDecimalStepType)
-        self.qc_plot_fig_size_y.valueChanged.connect(self.update_parameters)
-        tooltip = 'Figure size Y.'
-        grid_layout_qual.addWidget(ParameterItem('Figure size Y', tooltip, self.qc_plot_fig_size_y), 5, 2)
-
-        self.qc_plot_per_file = QCheckBox()
-        self.qc_plot_per_file.stateChanged.connect(self.update_parameters)
-        tooltip = 'Whether to plot QC plots for individual files or combine them into a common figure.'
-        grid_layout_qual.addWidget(ParameterItem('Plot per file', tooltip, self.qc_plot_per_file), 6, 0)
-
-        self.qc_plot_fig_legend = QCheckBox()
-        self.qc_plot_fig_legend.stateChanged.connect(self.update_parameters)
-        tooltip = 'Whether to show the legend in QC plots.'
-        grid_layout_qual.addWidget(ParameterItem('Figure legend', tooltip, self.qc_plot_fig_legend), 6, 1)
-
-        return grid_layout_qual
-
-    # Section of parameters
-    def init_quantt(self):
-        grid_layout_quantt = self.get_grid()
-        description = self.placeholder
-        label = QLabel(description)
-        grid_layout_quantt.addWidget(label, 0, 0, 1, 3)
-
-        self.quant_isotopes = QComboBox()
-        self.quant_isotopes.addItems(['height', 'volume'])
-        self.quant_isotopes.currentIndexChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc(''' Isotope quantification method for the quantitative table generation.
-                          \'Height\': Fitted isotope peak height,
-                          \'Volume\': Volume of the 3D isotope peak.''')
-        grid_layout_quantt.addWidget(ParameterItem('Isotopes', tooltip, self.quant_isotopes), 1, 0)
-
-        self.quant_features = QComboBox()
-        self.quant_features.addItems(
-            ['monoisotopic_height', 'monoisotopic_volume', 'total_height', 'total_volume', 'max_height', 'max_volume'])
-        self.quant_features.currentIndexChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Feature quantification method for the quantitative table generation.
-                          \'Max Height/Volume\': Height or volume of the highest intensity isotope,
-                          \'Monoisotopic Height/Volume\': Height or volume of the monoisotopic peak,
-                          \'Total Height/Volume\': Sum of heights or volumes of all isotopic peaks in the feature.''')
-        grid_layout_quantt.addWidget(ParameterItem('Features', tooltip, self.quant_features), 1, 1)
-
-        self.quant_features_charge_state_filter = QCheckBox()
-        self.quant_features_charge_state_filter.stateChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc(''''Whether to remove feature annotations from quantitative tables 
-                where charge state of the detected features don't mach the one given by the identification engine.''')
-        grid_layout_quantt.addWidget(
-            ParameterItem('Features charge state filter', tooltip, self.quant_features_charge_state_filter), 1, 2)
-
-        self.quant_ident_linkage = QComboBox()
-        self.quant_ident_linkage.addItems(['theoretical_mz', 'msms_event'])
-        self.quant_ident_linkage.currentIndexChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Method linking PSM with quantified isotopes.
-                          \'Theoretical m/z\': Link identifiations based on the theoretical monoisotopic m/z calculated by the identification engine,
-                          \'MS/MS event\': Link identifications to the closest isotope in m/z and retention time from the occurance of the MS/MS event.''')
-        grid_layout_quantt.addWidget(ParameterItem('Ident linkage', tooltip, self.quant_ident_linkage), 2, 0)
-
-        self.quant_consensus = QCheckBox()
-        self.quant_consensus.stateChanged.connect(self.update_parameters)
-        tooltip = 'When selected, a sequence consensus is generated for the quantitative table.'
-        grid_layout_quantt.addWidget(ParameterItem('Consensus', tooltip, self.quant_consensus), 2, 1)
-
-        self.quant_consensus_min_ident = QSpinBox()
-        self.quant_consensus_min_ident.setRange(-LARGE, LARGE)
-        self.quant_consensus_min_ident.valueChanged.connect(self.update_parameters)
-        tooltip = 'Minimum number of samples with the same identification required for consensus sequence generation.'
-        grid_layout_quantt.addWidget(ParameterItem('Consensus min ident', tooltip, self.quant_consensus_min_ident), 2,
-                                     2)
-
-        self.quant_save_all_annotations = QCheckBox()
-        self.quant_save_all_annotations.stateChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc('''Whether all annotations should be saved in addition with the aggregated tables.
-                          Depending on the number of annotations, this might dramatically increase the disk space required.''')
-        grid_layout_quantt.addWidget(ParameterItem('Save all annotations', tooltip, self.quant_save_all_annotations), 3,
-                                     0)
-
-        self.quant_proteins_min_peptides = QSpinBox()
-        self.quant_proteins_min_peptides.setRange(1, 50)
-        self.quant_proteins_min_peptides.valueChanged.connect(self.update_parameters)
-        tooltip = 'Minimum number of peptides needed for considering a protein for quantification.'
-        grid_layout_quantt.addWidget(ParameterItem('Consensus min peptide', tooltip, self.quant_proteins_min_peptides),
-                                     3, 1)
-
-        self.quant_proteins_remove_subset_proteins = QCheckBox()
-        self.quant_proteins_remove_subset_proteins.stateChanged.connect(self.update_parameters)
-        tooltip = 'Whether to remove proteins whose peptides are entirely contained within another group with longer number of evidence peptides when performing protein inference.'
-        grid_layout_quantt.addWidget(
-            ParameterItem('Remove subset proteins', tooltip, self.quant_proteins_remove_subset_proteins), 3, 2)
-
-        self.quant_proteins_ignore_ambiguous_peptides = QCheckBox()
-        self.quant_proteins_ignore_ambiguous_peptides.stateChanged.connect(self.update_parameters)
-        tooltip = 'When performing protein inference, select if peptides with ambiguous protein identifications should be ignored.'
-        grid_layout_quantt.addWidget(
-            ParameterItem('Ignore ambiguous peptides', tooltip, self.quant_proteins_ignore_ambiguous_peptides), 4, 0)
-
-        self.quant_proteins_quant_type = QComboBox()
-        self.quant_proteins_quant_type.addItems(['razor', 'unique', 'all'])
-        self.quant_proteins_quant_type.currentIndexChanged.connect(self.update_parameters)
-        tooltip = inspect.cleandoc(''' Type of quantification used for protein inference:
-                    - unique: only unique peptides will be used for quantification.
-                    - razor: same as unique plus peptides assigned as most likely due to Occam's razor constrain.
-                    - all: All peptides will be used for quantification. Shared peptides can be used more than once.''')
-        grid_layout_quantt.addWidget(
-            ParameterItem('Protein quantification type', tooltip, self.quant_proteins_quant_type), 4, 1)
-
-        return grid_layout_quantt
-
     # navigation to switch between parameter categories
     def init_nav(self):
         self.nav = QListWidget()
-        self.nav.insertItem(0, 'Instrument Settings')
-        self.nav.insertItem(1, 'Raw Data')
-        self.nav.insertItem(2, 'Quantification')
-        self.nav.insertItem(3, 'Warp2D')
-        self.nav.insertItem(4, 'MetaMatch')
-        self.nav.insertItem(5, 'Identification')
-        self.nav.insertItem(6, 'Quantitive Table Generation')
-        self.nav.insertItem(7, 'Quality Control')
+        for i, page in enumerate(parameter_schema.PAGES):
+            self.nav.insertItem(i, page.title)
 
         self.nav.currentRowChanged.connect(self.display)
         self.nav.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
@@ -947,178 +809,208 @@ class ParametersWidget(QTabWidget):
         self.nav.setMinimumWidth(175)
         self.nav.setMaximumWidth(300)
 
-    # determines what parameter category is shown
+    # determines what parameter category is shown, its page is built the first time it is shown
     def display(self, i):
+        self.build_page(i)
         self.stack.setCurrentIndex(i)
 
-    # Creates stack of parameter categories
+    # Creates stack of parameter categories, each page stays empty until it is shown
     def init_stack(self):
         self.stack = QStackedWidget()
-        self.stack.addWidget(self.inst_settings_box)
-        self.stack.addWidget(self.raw_data_box)
-        self.stack.addWidget(self.quantification_box)
-        self.stack.addWidget(self.warp_box)
-        self.stack.addWidget(self.meta_box)
-        self.stack.addWidget(self.ident_box)
-        self.stack.addWidget(self.quantt_box)
-        self.stack.addWidget(self.qual_box)
+        self.page_containers = []
+        for _ in parameter_schema.PAGES:
+            container = QWidget()
+            layout = QVBoxLayout(container)
+            layout.setContentsMargins(0, 0, 0, 0)
+            self.stack.addWidget(container)
+            self.page_containers.append(container)
 
     # Puts navigation and stack together
     def init_layout(self):
         layout = QGridLayout()
         self.init_nav()
         layout.addWidget(self.nav, 0, 0)
+        self.sweep_btn = QPushButton('Parameter sweep...')
+        self.sweep_btn.setToolTip('Run variants of the parameters side by side and compare their results')
+        self.sweep_btn.setEnabled(False)
+        layout.addWidget(self.sweep_btn, 1, 0)
         self.init_stack()
         layout.addWidget(self.stack, 0, 1)
         return layout
 
-    # Creates the UI for the parameters tab
+    # Creates the UI for the parameters tab, only the first page is built right away
     def parameters_tab_ui(self):
-        global LARGE
-        LARGE = 1000000000
-
-        self.update_allowed = False
-
-        # Instruments
-        self.inst_settings_box = QGroupBox('Instrument Settings')
-        grid_layout_inst = self.init_inst()
-        self.inst_settings_box.setLayout(grid_layout_inst)
-
-        # Raw data
-        self.raw_data_box = QGroupBox('Raw Data')
-        grid_layout_raw_data = self.init_raw_data()
-        self.raw_data_box.setLayout(grid_layout_raw_data)
-
-        # Quantification
-        self.quantification_box = QGroupBox('Quantification')
-        grid_layout_resamp = self.init_resamp()
-        self.quantification_box.setLayout(grid_layout_resamp)
-
-        # Warp2D
-        self.warp_box = QGroupBox('Warp2D')
-        grid_layout_warp = self.init_warp()
-        self.warp_box.setLayout(grid_layout_warp)
-
-        # MetaMatch
-        self.meta_box = QGroupBox('MetaMatch')
-        grid_layout_meta = self.init_meta()
-        self.meta_box.setLayout(grid_layout_meta)
-
-        # Identification
-        self.ident_box = QGroupBox('Identification')
-        grid_layout_ident = self.init_ident()
-        self.ident_box.setLayout(grid_layout_ident)
+        self.field_widgets = {}
+        self.field_items = {}
+        self.built_pages = set()
+        self.parameters_tab.setLayout(self.init_layout())
+        self.nav.setCurrentRow(0)
 
-        # Quality Control
-        self.qual_box = QGroupBox('Quality Control')
-        grid_layout_qual = self.init_qual()
+    # Builds the widgets of a page from the schema and shows the parameters in them
+    # each widget is kept as an attribute named after its field
+    def build_page(self, i):
+        if i < 0 or i in self.built_pages:
+            return
+        self.built_pages.add(i)
+        page = parameter_schema.PAGES[i]
+        grid = self.get_grid()
+        grid.addWidget(QLabel(page.description), 0, 0, 1, 3)
+        for field in page.fields:
+            widget = init_widget(field)
+            setattr(self, field.name, widget)
+            self.field_widgets.setdefault(field.key, []).append((field, widget))
+            item = ParameterItem(field.label, field.tooltip, widget)
+            self.field_items.setdefault(field.key, []).append(item)
+            grid.addWidget(item, *field.position)
+        if page.footer:
+            grid.addWidget(getattr(self, page.footer), max(field.position[0] for field in page.fields) + 1, 0, 1, 3)
+        box = QGroupBox(page.title)
+        box.setLayout(grid)
+        self.page_containers[i].layout().addWidget(box)
+
+        keys = list(dict.fromkeys(field.key for field in page.fields))
+        self.show_parameters(keys)
+        self.show_errors()
+        self.show_grid(keys)
+        for key in keys:
+            for _, widget in self.field_widgets[key]:
+                widget_signal(widget).connect(lambda *args, key=key: self.set_parameter(key, self.read_parameter(key)))
+
+    # Value of the parameter from its widgets
+    def read_parameter(self, key):
+        fields = self.field_widgets[key]
+        values = [widget_reader(widget)() for _, widget in fields]
+        from_widget = fields[0][0].from_widget
+        return from_widget(*values) if from_widget else values[0]
+
+    # Shows the parameters in the widgets of the pages that are built, the parameters are not touched
+    # a parameter the project does not have shows its default
+    def show_parameters(self, keys=None):
+        for key in list(self.field_widgets) if keys is None else keys:
+            if key not in self.field_widgets:
+                continue
+            value = self.parameters.get(key, self.field_widgets[key][0][0].default)
+            if self.read_parameter(key) == value:
+                continue
+            for field, widget in self.field_widgets[key]:
+                widget.blockSignals(True)
+                write_widget(widget, field.to_widget(value) if field.to_widget else value)
+                widget.blockSignals(False)
+
+    def set_parameter(self, key, value):
+        global saved
+        if self.parameter_model.set(key, value):
+            saved = False
 
-        self.qual_box.setLayout(grid_layout_qual)
+    # Updates all the parameters to the values of their widgets, with a single change
+    def update_parameters(self):
+        global saved
+        if self.parameter_model.update({key: self.read_parameter(key) for key in self.field_widgets}):
+            saved = False
 
-        # Quantitative Table Generation
-        self.quantt_box = QGroupBox('Quantitive Table Generation')
-        grid_layout_quantt = self.init_quantt()
-        self.quantt_box.setLayout(grid_layout_quantt)
-        self.quantt_box.setLayout(grid_layout_quantt)
+    # Sets all parameters of the schema to the defaults, with a single change
+    def reset_parameters(self, defaults):
+        global saved
+        if self.parameter_model.update(parameter_schema.complete(defaults)):
+            saved = False
 
-        self.parameters_tab.setLayout(self.init_layout())
-        self.update_allowed = True
-
-    # Updates parameters to values set in the UI by the user for the instrument section
-    def update_inst(self):
-        self.parameters['instrument_type'] = self.inst_type.currentText().lower()
-        self.parameters['resolution_ms1'] = self.res_ms1.value()
-        self.parameters['resolution_msn'] = self.res_ms2.value()
-        self.parameters['reference_mz'] = self.reference_mz.value()
-        self.parameters['avg_fwhm_rt'] = self.avg_fwhm_rt.value()
-
-    def update_raw_data(self):
-        self.parameters['min_mz'] = self.min_mz.value()
-        self.parameters['max_mz'] = self.max_mz.value()
-        self.parameters['min_rt'] = self.min_rt.value()
-        self.parameters['max_rt'] = self.max_rt.value()
-        self.parameters['polarity'] = self.polarity.currentText()
-
-    def update_resamp(self):
-        self.parameters['num_samples_mz'] = self.num_samples_mz.value()
-        self.parameters['num_samples_rt'] = self.num_samples_rt.value()
-        self.parameters['smoothing_coefficient_mz'] = self.smoothing_coefficient_mz.value()
-        self.parameters['smoothing_coefficient_rt'] = self.smoothing_coefficient_rt.value()
-        self.parameters['max_peaks'] = self.max_peaks.value()
-        charge_state_list = list(
-            range(self.feature_detection_charge_state_min.value(), self.feature_detection_charge_state_max.value() + 1))
-        charge_state_list.reverse()
-        self.parameters['feature_detection_charge_states'] = charge_state_list
-
-    def update_warp(self):
-        self.parameters['warp2d_slack'] = self.warp2d_slack.value()
-        self.parameters['warp2d_window_size'] = self.warp2d_window_size.value()
-        self.parameters['warp2d_num_points'] = self.warp2d_num_points.value()
-        self.parameters['warp2d_rt_expand_factor'] = self.warp2d_rt_expand_factor.value()
-        self.parameters['warp2d_peaks_per_window'] = self.warp2d_peaks_per_window.value()
-
-    def update_meta(self):
-        self.parameters['metamatch_fraction'] = self.metamatch_fraction.value()
-        self.parameters['metamatch_n_sig_mz'] = self.metamatch_n_sig_mz.value()
-        self.parameters['metamatch_n_sig_rt'] = self.metamatch_n_sig_rt.value()
-
-    def update_ident(self):
-        self.parameters['ident_max_rank_only'] = self.ident_max_rank_only.isChecked()
-        self.parameters['ident_require_threshold'] = self.ident_require_threshold.isChecked()
-        self.parameters['ident_ignore_decoy'] = self.ident_ignore_decoy.isChecked()
-        self.parameters['link_n_sig_mz'] = self.link_n_sig_mz.value()
-        self.parameters['link_n_sig_rt'] = self.link_n_sig_rt.value()
-        self.parameters['similarity_num_peaks'] = self.similarity_num_peaks.value()
-
-    def update_qual(self):
-        self.parameters['qc_plot_palette'] = self.qc_plot_palette.currentText()
-        self.parameters['qc_plot_extension'] = self.qc_plot_extension.currentText()
-        if self.qc_plot_fill_alpha.value() == 0.0:
-            self.parameters['qc_plot_fill_alpha'] = 'dynamic'
-        else:
-            self.parameters['qc_plot_fill_alpha'] = self.qc_plot_fill_alpha.value()
-        self.parameters['qc_plot_line_alpha'] = self.qc_plot_line_alpha.value()
-        self.parameters['qc_plot_scatter_alpha'] = self.qc_plot_scatter_alpha.value()
-        self.parameters['qc_plot_scatter_size'] = self.qc_plot_scatter_size.value()
-        self.parameters['qc_plot_min_dynamic_alpha'] = self.qc_plot_min_dynamic_alpha.value()
-        self.parameters['qc_plot_per_file'] = self.qc_plot_per_file.isChecked()
-        self.parameters['qc_plot_line_style'] = self.qc_plot_line_style.currentText()
-        self.parameters['qc_plot_dpi'] = self.qc_plot_dpi.value()
-        self.parameters['qc_plot_font_family'] = self.qc_plot_font_family.currentText()
-        self.parameters['qc_plot_font_size'] = self.qc_plot_font_size.value()
-        self.parameters['qc_plot_fig_size_x'] = self.qc_plot_fig_size_x.value()
-        self.parameters['qc_plot_fig_size_y'] = self.qc_plot_fig_size_y.value()
-        self.parameters['qc_plot_fig_legend'] = self.qc_plot_fig_legend.isChecked()
-        self.parameters['qc_plot_mz_vs_sigma_mz_max_peaks'] = self.qc_plot_mz_vs_sigma_mz_max_peaks.value()
-
-    def update_quantt(self):
-        self.parameters['quant_isotopes'] = self.quant_isotopes.currentText()
-        self.parameters['quant_features'] = self.quant_features.currentText()
-        self.parameters['quant_features_charge_state_filter'] = self.quant_features_charge_state_filter.isChecked()
-        self.parameters['quant_ident_linkage'] = self.quant_ident_linkage.currentText()
-        self.parameters['quant_consensus'] = self.quant_consensus.isChecked()
-        self.parameters['quant_consensus_min_ident'] = self.quant_consensus_min_ident.value()
-        self.parameters['quant_save_all_annotations'] = self.quant_save_all_annotations.isChecked()
-        self.parameters['quant_proteins_min_peptides'] = self.quant_proteins_min_peptides.value()
-        self.parameters[
-            'quant_proteins_remove_subset_proteins'] = self.quant_proteins_remove_subset_proteins.isChecked()
-        self.parameters[
-            'quant_proteins_ignore_ambiguous_peptides'] = self.quant_proteins_ignore_ambiguous_peptides.isChecked()
-        self.parameters['quant_proteins_quant_type'] = self.quant_proteins_quant_type.currentText()
-
-    # Updates all the parameters
-    def update_parameters(self):
-        if not self.update_allowed:
+    # With the automatic number of samples, the samples follow the parameters the grid depends on
+    # invalid parameters keep the samples as they are until they are fixed
+    def tune_samples(self, keys):
+        global saved
+        if not self.parameters.get('num_samples_auto') or not set(keys).intersection(estimator.SAMPLING_PARAMS):
             return
-
+        params = parameter_schema.complete(self.parameters)
+        if validation.Validator().validate(params, estimator.SAMPLING_PARAMS):
+            return
+        budget = params['grid_memory_budget'] * 1024 ** 3
+        samples = min(estimator.tune_samples(params, budget, bounds) for bounds in self.grid_bounds())
+        if self.parameter_model.update({'num_samples_mz': samples, 'num_samples_rt': samples}):
+            saved = False
+
+    # range of the data of each raw file, None for the ones that were not scanned yet
+    def raw_bounds(self):
+        return [self.file_catalog.bounds(input_file['raw_path']) for input_file in self.input_files]
+
+    # range of the data of each raw file for its grid, the assumed range for the files that were not scanned yet
+    # and without raw files
+    def grid_bounds(self):
+        return [bounds or estimator.ASSUMED_BOUNDS for bounds in self.raw_bounds()] or [estimator.ASSUMED_BOUNDS]
+
+    # Shows the range of the data of the raw files and whether the window cuts it or reads more than there is
+    def show_data_range(self, keys=None):
+        if keys is not None and not set(keys).intersection(['min_mz', 'max_mz', 'min_rt', 'max_rt']):
+            return
+        bounds = self.raw_bounds()
+        data_window = rawscan.window(bounds)
+        scanned = sum(file_bounds is not None for file_bounds in bounds)
+        self.data_range_btn.setEnabled(bool(bounds) and scanned == len(bounds))
+        if data_window is None:
+            self.data_range_label.setText('The range of the data is known once the raw files are scanned.'
+                                          if bounds else '')
+            self.data_range_label.setToolTip('')
+            return
+        text = 'Data of the raw files: m/z {:g} to {:g}, retention time {:g} to {:g} s'.format(*data_window)
+        if scanned < len(bounds):
+            text += ' ({} of {} raw files scanned)'.format(scanned, len(bounds))
+        params = parameter_schema.complete(self.parameters)
+        if [params[key] for key in ('min_mz', 'max_mz', 'min_rt', 'max_rt')] == list(data_window):
+            text += ', the window is set to it'
+        self.data_range_label.setText(text)
+        self.data_range_label.setToolTip('\n'.join('{}: {}'.format(
+            os.path.basename(input_file['raw_path']),
+            rawscan.describe(self.file_catalog.get(input_file['raw_path']).metadata))
+            for input_file, file_bounds in zip(self.input_files, bounds) if file_bounds))
+
+    # Sets the m/z and retention time window to the range of the data of all raw files
+    def use_data_range(self):
         global saved
-        saved = False
+        data_window = rawscan.window(self.raw_bounds())
+        if data_window is None:
+            return
+        if self.parameter_model.update(dict(zip(['min_mz', 'max_mz', 'min_rt', 'max_rt'], data_window))):
+            saved = False
 
-        self.update_inst()
-        self.update_raw_data()
-        self.update_resamp()
-        self.update_warp()
-        self.update_meta()
-        self.update_ident()
-        self.update_qual()
-        self.update_quantt()
+    # Shows the grid of a raw file the sampling makes, the samples are chosen automatically or by hand
+    def show_grid(self, keys=None):
+        grid_keys = estimator.SAMPLING_PARAMS + ['num_samples_mz', 'num_samples_rt']
+        if keys is not None and not set(keys).intersection(grid_keys):
+            return
+        params = parameter_schema.complete(self.parameters)
+        for key in ('num_samples_mz', 'num_samples_rt'):
+            for _, widget in self.field_widgets.get(key, []):
+                widget.setEnabled(not params['num_samples_auto'])
+        if validation.Validator().validate(params, grid_keys):
+            self.grid_label.clear()
+            return
+        bounds = max(self.grid_bounds(), key=lambda file_bounds: estimator.grid_memory(params, file_bounds))
+        mz, rt = estimator.grid_size(params, bounds)
+        memory = estimator.grid_memory(params, bounds)
+        text = 'Grid of a raw file: {} x {} points (m/z x retention time), {} of memory'.format(
+            mz, rt, files.format_size(memory))
+        self.grid_label.setToolTip('For the raw file with the largest grid, {} data from m/z {:g} to {:g} and from '
+                                   '{:g} to {:g} seconds, within the m/z and retention time window'.format(
+                                       'with' if bounds in self.raw_bounds() else 'assumed to have', *bounds))
+        if params['num_samples_auto'] and memory > params['grid_memory_budget'] * 1024 ** 3:
+            text = '<b>{}, over the budget even with a single sample</b>'.format(text)
+        self.grid_label.setText(text)
+
+    # Checks the rules of the changed parameters, all of them by default, returns the messages of all errors
+    # the parts of parameters are checked as their widgets show them
+    def validate(self, keys=None):
+        parts = {field.name: widget_reader(widget)() for key in self.field_widgets
+                 for field, widget in self.field_widgets[key] if field in parameter_schema.PART_FIELDS}
+        messages = self.validator.validate(self.parameters, keys, parts)
+        self.show_errors()
+        return messages
+
+    # Shows the errors at the parameters of the built pages and marks the pages that have any
+    def show_errors(self):
+        for key, items in self.field_items.items():
+            message = '\n'.join(self.validator.key_errors(key))
+            for item in items:
+                item.set_error(message)
+        for i, page in enumerate(parameter_schema.PAGES):
+            invalid = any(self.validator.key_errors(field.key) for field in page.fields)
+            self.nav.item(i).setForeground(QBrush(QColor('red')) if invalid else QBrush())
+        self.check_run_btn()
@@ -0,0 +1,60 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class ParameterModel(QObject):
+    """
+    The parameters of the project, set one key at a time by the widget that shows it.
+    Every change is announced with the exact keys that changed, a bulk change only once,
+    and the keys changed since the last run are kept so the stages they affect are known.
+
+    Arguments:
+    - initial parameters
+    """
+    changed = pyqtSignal(list)
+
+    def __init__(self, values=None, parent=None):
+        super().__init__(parent)
+        self.values = dict(values or {})
+        self.dirty = set()
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    # sets a single key, returns whether its value changed
+    def set(self, key, value):
+        return bool(self.update({key: value}))
+
+    # sets the given keys at once, returns the keys whose value changed
+    def update(self, values):
+        changed = [key for key, value in values.items() if key not in self.values or self.values[key] != value]
+        if not changed:
+            return []
+        for key in changed:
+            self.values[key] = values[key]
+        self.dirty.update(changed)
+        self.changed.emit(changed)
+        return changed
+
+    # replaces all parameters, for when a project is opened or created
+    # what changed before belongs to another project, so nothing is dirty afterwards
+    def load(self, values):
+        values = dict(values)
+        changed = [key for key in set(self.values) | set(values)
+                   if key not in self.values or key not in values or self.values[key] != values[key]]
+        self.values = values
+        self.dirty = set()
+        if changed:
+            self.changed.emit(sorted(changed))
+        return changed
+
+    # keys changed since the last call, for the run that is about to start
+    def take_dirty(self):
+        dirty = sorted(self.dirty)
+        self.dirty = set()
+        return dirty
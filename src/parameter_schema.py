@@ -0,0 +1,319 @@
+import inspect
+
+
+# Largest value of the number widgets without a tighter range
+LARGE = 1000000000
+PLACEHOLDER = 'Description of container'
+
+
+class Field:
+    """
+    A parameter of the PASTAQ pipeline as it is shown in the parameters tab.
+    A parameter shown by several widgets has a field for each of them, sharing its key.
+
+    Arguments:
+    - key of the parameter
+    - label
+    - kind of widget: int, float, bool or choice
+    - row and column in the page
+    - tooltip text
+    - default value
+    - range of a number or the choices of a choice
+    - attribute name of the widget, the key by default
+    - conversion of the value to the widget value
+    - conversion of the values of all widgets of the key to the value
+    """
+    def __init__(self, key, label, kind, position, tooltip, default, values=None, name=None, to_widget=None,
+                 from_widget=None):
+        self.key = key
+        self.label = label
+        self.kind = kind
+        self.position = position
+        self.tooltip = tooltip
+        self.default = default
+        self.values = values
+        self.name = name or key
+        self.to_widget = to_widget
+        self.from_widget = from_widget
+
+
+class Page:
+    """
+    A category of parameters, one page of the parameters tab.
+
+    Arguments:
+    - title
+    - fields of the page
+    - description shown above the fields
+    - attribute name of a widget shown below the fields, None for none
+    """
+    def __init__(self, title, fields, description=PLACEHOLDER, footer=None):
+        self.title = title
+        self.fields = fields
+        self.description = description
+        self.footer = footer
+
+
+# The charge states are shown as the lowest and the highest one
+def charge_states(low, high):
+    return list(range(high, low - 1, -1))
+
+
+# A fill alpha of 0.0 stands for a dynamic one
+def fill_alpha(alpha):
+    return 'dynamic' if alpha == 0.0 else alpha
+
+
+PAGES = [
+    Page('Instrument Settings', [
+        Field('instrument_type', 'Instrument type', 'choice', (1, 0),
+              'The type of mass analyser used to acquire the data.',
+              'orbitrap', ['orbitrap', 'tof', 'ft-icr', 'quadrupole'], name='inst_type'),
+        Field('resolution_ms1', 'Resolution MS1', 'int', (1, 1),
+              'MS1 resolution set on the mass spectrometer at the time of data acquisition.',
+              70000, (-LARGE, LARGE), name='res_ms1'),
+        Field('resolution_msn', 'Resolution MS2', 'int', (1, 2),
+              'MS/MS resolution set on the mass spectrometer at the time of data acquisition.',
+              30000, (-LARGE, LARGE), name='res_ms2'),
+        Field('reference_mz', 'Reference m/z', 'int', (2, 0),
+              'Reference m/z at which the resolution is calculated.',
+              200, (-LARGE, LARGE)),
+        Field('avg_fwhm_rt', 'Avg FWHM RT', 'int', (2, 1),
+              'Expected full-width half-maximum width of chromatographic peaks.',
+              10, (-LARGE, LARGE)),
+    ]),
+    Page('Raw Data', [
+        Field('min_mz', 'Min m/z', 'float', (1, 0),
+              'Filter minimum m/z value for spectra during raw data reading.',
+              0, (0, LARGE)),
+        Field('max_mz', 'Max m/z', 'float', (1, 1),
+              'Filter maximum m/z value for spectra during raw data reading.',
+              100000, (0, LARGE)),
+        Field('polarity', 'Polarity', 'choice', (1, 2), inspect.cleandoc(
+              '''Filter polarity (Positive '+', negative '-', or any) for spectra during raw data reading.
+              This should only be modified if the raw data file contains both positive and negative polarity spectra.'''),
+              'both', ['positive', 'negative', 'both']),
+        Field('min_rt', 'Min retention time', 'float', (2, 0),
+              'Filter minimum retention time value for spectra during raw data reading.',
+              0, (0, LARGE)),
+        Field('max_rt', 'Max retention time', 'float', (2, 1),
+              'Filter maximum retention time value for spectra during raw data reading.',
+              100000, (0, LARGE)),
+    ], footer='data_range'),
+    Page('Quantification', [
+        Field('num_samples_mz', 'Number of samples m/z', 'int', (1, 0), inspect.cleandoc(
+              '''Number of sampling points per full-width half-maximum in m/z.
+              If the memory consumption is too high it can be reduced at
+              the cost of potentially missing peaks or obtaining less accurate fitting.'''),
+              5, (-LARGE, LARGE)),
+        Field('num_samples_rt', 'Number of samples rt', 'int', (1, 1), inspect.cleandoc(
+              '''Number of sampling points per full-width half-maximum in retention time.
+              If the memory consumption is too high it can be reduced at the
+              cost of potentially missing peaks or obtaining less accurate fitting.'''),
+              5, (-LARGE, LARGE)),
+        Field('smoothing_coefficient_mz', 'Smoothing coefficient (m/z)', 'float', (1, 2),
+              'Amount of smoothing applied for resampling in the m/z dimension.',
+              0.4, (-LARGE, LARGE)),
+        Field('smoothing_coefficient_rt', 'Smoothing coefficient (rt)', 'float', (2, 0),
+              'Amount of smoothing applied for resampling in the retention time dimension.',
+              0.4, (-LARGE, LARGE)),
+        Field('feature_detection_charge_states', 'Feature detection min charge', 'int', (2, 1),
+              'Feature detection charge state min.',
+              [5, 4, 3, 2, 1], (1, LARGE), name='feature_detection_charge_state_min',
+              to_widget=lambda states: min(states, default=1), from_widget=charge_states),
+        Field('feature_detection_charge_states', 'Feature detection max charge', 'int', (2, 2),
+              'Feature detection charge state max.',
+              [5, 4, 3, 2, 1], (1, LARGE), name='feature_detection_charge_state_max',
+              to_widget=lambda states: max(states, default=1), from_widget=charge_states),
+        Field('max_peaks', 'Max number of peaks', 'int', (3, 0),
+              'Maximum number of peaks per file being detected at isotope level in decreasing intensity order.',
+              1000000, (-LARGE, LARGE)),
+        Field('num_samples_auto', 'Automatic number of samples', 'bool', (3, 1), inspect.cleandoc(
+              '''Choose the number of samples in m/z and retention time from the instrument settings and the
+              m/z and retention time window: the most samples for which the grid of a raw file fits in the
+              grid memory budget.'''),
+              False),
+        Field('grid_memory_budget', 'Grid memory budget (GB)', 'float', (3, 2),
+              'Memory the resampled grid of a single raw file may use with the automatic number of samples.',
+              16.0, (0.1, LARGE)),
+    ], footer='grid_label'),
+    Page('Warp2D', [
+        Field('warp2d_slack', 'Slack', 'int', (1, 0),
+              'Number of points allowed to move for each anchor node during retention time alignment.',
+              30, (-LARGE, LARGE)),
+        Field('warp2d_window_size', 'Window Size', 'int', (1, 1),
+              'Number of points between anchor points.',
+              100, (-LARGE, LARGE)),
+        Field('warp2d_num_points', 'Number of points', 'int', (1, 2),
+              'Number of points in which the minimum and maximum retention time range will be discretized.',
+              2000, (-LARGE, LARGE)),
+        Field('warp2d_rt_expand_factor', 'Expand factor rt', 'float', (2, 0),
+              'Expansion of the retention time range to avoid edge effects at the min/max nodes.',
+              0.2, (-LARGE, LARGE)),
+        Field('warp2d_peaks_per_window', 'Peaks per window', 'int', (2, 1),
+              'Number of peaks used for similarity calculation in each alignment window.',
+              100, (-LARGE, LARGE)),
+    ]),
+    Page('MetaMatch', [
+        Field('metamatch_fraction', 'Fraction of samples', 'float', (1, 0), inspect.cleandoc(
+              '''Minimum percentage of peak presence (value between 0 and 1) in at least
+              one sample group to be included in Metamatch result.
+              For example, if there are 10 samples in group A and 10 in group B,
+              for a fraction value of 0.7, we consider a valid cluster if there are
+              matched peaks present in at least 7 samples in at least one of the sample group.'''),
+              0.7, (-LARGE, LARGE)),
+        Field('metamatch_n_sig_mz', 'Number of sigma (m/z)', 'float', (1, 1),
+              'Number of standard deviations to use as tolerance for m/z radius.',
+              1.5, (-LARGE, LARGE)),
+        Field('metamatch_n_sig_rt', 'Number of sigma (rt)', 'float', (1, 2),
+              'Number of standard deviations to use as tolerance for retention time radius.',
+              1.5, (-LARGE, LARGE)),
+    ]),
+    Page('Identification', [
+        Field('ident_max_rank_only', 'Max rank only', 'bool', (1, 0),
+              'Only select the most confident PSM from each MS/MS spectra.',
+              True),
+        Field('ident_require_threshold', 'Require threshold', 'bool', (1, 1),
+              'Read only identifications that meet the target-decoy false discovery rate threshold.',
+              True),
+        Field('ident_ignore_decoy', 'Ignore decoy', 'bool', (1, 2),
+              'Ignore PSM that have been detected as decoys by the identification engine.',
+              True),
+        Field('link_n_sig_mz', 'Max number of sigma for linking (m/z)', 'float', (2, 0),
+              'Tolerance for ms2 events and identification linking measured in number of standard deviations for (m/z)',
+              3, (-LARGE, LARGE)),
+        Field('link_n_sig_rt', 'Max number of sigma for linking (rt)', 'float', (2, 1),
+              'Tolerance for ms2 events and identification linking measured in number of standard deviations for (rt)',
+              3, (-LARGE, LARGE)),
+    ]),
+    Page('Quantitive Table Generation', [
+        Field('quant_isotopes', 'Isotopes', 'choice', (1, 0), inspect.cleandoc(
+              '''Isotope quantification method for the quantitative table generation.
+              'Height': Fitted isotope peak height,
+              'Volume': Volume of the 3D isotope peak.'''),
+              'height', ['height', 'volume']),
+        Field('quant_features', 'Features', 'choice', (1, 1), inspect.cleandoc(
+              '''Feature quantification method for the quantitative table generation.
+              'Max Height/Volume': Height or volume of the highest intensity isotope,
+              'Monoisotopic Height/Volume': Height or volume of the monoisotopic peak,
+              'Total Height/Volume': Sum of heights or volumes of all isotopic peaks in the feature.'''),
+              'max_height', ['monoisotopic_height', 'monoisotopic_volume', 'total_height', 'total_volume',
+                             'max_height', 'max_volume']),
+        Field('quant_features_charge_state_filter', 'Features charge state filter', 'bool', (1, 2), inspect.cleandoc(
+              '''Whether to remove feature annotations from quantitative tables where charge state
+              of the detected features don't mach the one given by the identification engine.'''),
+              True),
+        Field('quant_ident_linkage', 'Ident linkage', 'choice', (2, 0), inspect.cleandoc(
+              '''Method linking PSM with quantified isotopes.
+              'Theoretical m/z': Link identifiations based on the theoretical monoisotopic m/z calculated by the identification engine,
+              'MS/MS event': Link identifications to the closest isotope in m/z and retention time from the occurance of the MS/MS event.'''),
+              'msms_event', ['theoretical_mz', 'msms_event']),
+        Field('quant_consensus', 'Consensus', 'bool', (2, 1),
+              'When selected, a sequence consensus is generated for the quantitative table.',
+              True),
+        Field('quant_consensus_min_ident', 'Consensus min ident', 'int', (2, 2),
+              'Minimum number of samples with the same identification required for consensus sequence generation.',
+              2, (-LARGE, LARGE)),
+        Field('quant_save_all_annotations', 'Save all annotations', 'bool', (3, 0), inspect.cleandoc(
+              '''Whether all annotations should be saved in addition with the aggregated tables.
+              Depending on the number of annotations, this might dramatically increase the disk space required.'''),
+              True),
+        Field('quant_proteins_min_peptides', 'Consensus min peptide', 'int', (3, 1),
+              'Minimum number of peptides needed for considering a protein for quantification.',
+              1, (1, 50)),
+        Field('quant_proteins_remove_subset_proteins', 'Remove subset proteins', 'bool', (3, 2),
+              'Whether to remove proteins whose peptides are entirely contained within another group with longer '
+              'number of evidence peptides when performing protein inference.',
+              True),
+        Field('quant_proteins_ignore_ambiguous_peptides', 'Ignore ambiguous peptides', 'bool', (4, 0),
+              'When performing protein inference, select if peptides with ambiguous protein identifications '
+              'should be ignored.',
+              True),
+        Field('quant_proteins_quant_type', 'Protein quantification type', 'choice', (4, 1), inspect.cleandoc(
+              '''Type of quantification used for protein inference:
+              - unique: only unique peptides will be used for quantification.
+              - razor: same as unique plus peptides assigned as most likely due to Occam's razor constrain.
+              - all: All peptides will be used for quantification. Shared peptides can be used more than once.'''),
+              'razor', ['razor', 'unique', 'all']),
+    ]),
+    Page('Quality Control', [
+        Field('similarity_num_peaks', 'Similarity number of peaks', 'int', (1, 0),
+              'Number of peaks used for the similarity matrix calculation.',
+              2000, (-LARGE, LARGE)),
+        Field('qc_plot_palette', 'Plot color palette', 'choice', (1, 1),
+              'Plot color palette.',
+              'husl', ['husl', 'crest', 'Spectral', 'flare', 'mako']),
+        Field('qc_plot_extension', 'Plot image format', 'choice', (1, 2),
+              'Plot image format',
+              'png', ['png', 'pdf', 'eps']),
+        Field('qc_plot_fill_alpha', 'Fill alpha', 'float', (2, 0),
+              'Transparency amount for fill plots.',
+              'dynamic', (0.0, 1.0), to_widget=lambda alpha: 0.0 if alpha == 'dynamic' else alpha,
+              from_widget=fill_alpha),
+        Field('qc_plot_line_style', 'Line style', 'choice', (2, 1),
+              'For line plots select if pure lines or fill plots should be used.',
+              'fill', ['fill', 'line']),
+        Field('qc_plot_font_family', 'Font family', 'choice', (2, 2),
+              'Font family.',
+              'sans-serif', ['sans-serif', 'serif']),
+        Field('qc_plot_dpi', 'Plot dpi', 'int', (3, 0),
+              'Plot dpi.',
+              300, (1, 1000)),
+        Field('qc_plot_mz_vs_sigma_mz_max_peaks', 'Max peaks for m/z vs peak width m/z', 'int', (3, 1),
+              'How many peaks should be plotted for the m/z vs m/z width QC plot.',
+              200000, (10, LARGE)),
+        Field('qc_plot_line_alpha', 'Line alpha', 'float', (3, 2),
+              'Transparency amount for line plots.',
+              0.5, (0.0, 1.0)),
+        Field('qc_plot_scatter_alpha', 'Scatter alpha', 'float', (4, 0),
+              'Transparency amount for scatter plots.',
+              0.3, (0.0, 1.0)),
+        Field('qc_plot_scatter_size', 'Scatter size', 'float', (4, 1),
+              'Size of scatter points in QC plots.',
+              2, (0.1, 10.0)),
+        Field('qc_plot_min_dynamic_alpha', 'Min dynamic alpha', 'float', (4, 2),
+              'When using dynamic transparency, select a minimum alpha level to avoid too faint plots when many '
+              'samples are present.',
+              0.1, (0.1, 10.0)),
+        Field('qc_plot_font_size', 'Font size', 'float', (5, 0),
+              'Font size.',
+              7, (1.0, 15.0)),
+        Field('qc_plot_fig_size_x', 'Figure size X', 'float', (5, 1),
+              'Figure size X.',
+              7.08661, (1.0, 15.0)),
+        Field('qc_plot_fig_size_y', 'Figure size Y', 'float', (5, 2),
+              'Figure size Y.',
+              4.379765814562611, (1.0, 15.0)),
+        Field('qc_plot_per_file', 'Plot per file', 'bool', (6, 0),
+              'Whether to plot QC plots for individual files or combine them into a common figure.',
+              False),
+        Field('qc_plot_fig_legend', 'Figure legend', 'bool', (6, 1),
+              'Whether to show the legend in QC plots.',
+              False),
+    ]),
+]
+FIELDS = [field for page in PAGES for field in page.fields]
+# Fields that show a part of a parameter shown by several widgets, like the lowest of the charge states
+PART_FIELDS = [field for field in FIELDS if sum(other.key == field.key for other in FIELDS) > 1]
+
+
+# Default value of every parameter in the schema
+def defaults():
+    return {field.key: field.default for field in FIELDS}
+
+
+# The parameters with the defaults of the ones that are not set, for saving and running
+def complete(parameters):
+    return dict(defaults(), **parameters)
+
+
+# Values of the widgets of the parts of the parameters by their attribute name, as the widgets show them
+# a part that can not be shown from the value of its parameter is None
+def part_values(parameters):
+    values = {}
+    for field in PART_FIELDS:
+        try:
+            values[field.name] = field.to_widget(parameters[field.key])
+        except (TypeError, ValueError):
+            values[field.name] = None
+    return values
@@ -1,67 +1,938 @@
+import contextlib
+import datetime
+import estimator
 import files
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
 import pastaq
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
 import time
-from PyQt5.QtCore import QObject, pyqtSignal, QThread, QObjectCleanupHandler
-from PyQt5.QtWidgets import QDialog, QTextEdit, QDialogButtonBox, QVBoxLayout
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from PyQt5.QtCore import QObject, pyqtSignal, QThread, QObjectCleanupHandler, QTimer
+from PyQt5.QtWidgets import QDialog, QLabel, QPlainTextEdit, QDialogButtonBox, QVBoxLayout
+if sys.platform != 'win32':
+    import resource
+
+
+# The complete log of a run is written to this file in the output directory
+LOG_FILE = 'pipeline.log'
+# Lines kept in the log view, older lines are only available in the log file
+LOG_MAX_LINES = 10000
+# Characters handed to the log view per flush, the rest is only available in the log file
+LOG_MAX_PENDING = 1000000
+# Interval in milliseconds in which the log view is updated
+LOG_FLUSH_INTERVAL = 100
+
+# Command line flag that makes the (frozen) GUI executable run a pipeline job instead
+WORKER_FLAG = '--pipeline-job'
+
+
+# Functions running a stage of the DDA pipeline on the input files in params['input_files']
+def read_raw(params, output_dir, logger, force_override):
+    pastaq.parse_raw_files(params, output_dir, logger, force_override)
+
+
+def find_peaks(params, output_dir, logger, force_override):
+    pastaq.detect_peaks(params, output_dir, False, logger, force_override)
+
+
+def peaks_similarity(params, output_dir, logger, force_override):
+    pastaq.calculate_similarity_matrix(params, output_dir, 'peaks', logger, force_override)
+
+
+def warped_peaks_similarity(params, output_dir, logger, force_override):
+    pastaq.calculate_similarity_matrix(params, output_dir, 'warped_peaks', logger, force_override)
+
+
+def summary(params, output_dir, logger, force_override):
+    pastaq.dda_pipeline_summary(params, output_dir, logger)
+
+
+class Stage:
+    """
+    A step of the DDA pipeline with the stages it depends on, the input files
+    and parameters it reads and the outputs it writes (relative to the output directory).
+    Stages that run per file only need the results of their inputs for the same file.
+
+    Arguments:
+    - name of the stage
+    - function running the stage
+    - names of the stages it depends on
+    - keys of the input file entries it reads
+    - parameters it reads
+    - outputs it writes, {stem} is replaced by the stem of the input file
+    - whether it runs separately for each input file
+    """
+    def __init__(self, name, function, inputs, files, params, outputs, per_file):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.files = files
+        self.params = params
+        self.outputs = outputs
+        self.per_file = per_file
+
+
+RAW_PARAMS = ['min_mz', 'max_mz', 'min_rt', 'max_rt', 'instrument_type', 'resolution_ms1', 'resolution_msn',
+              'reference_mz', 'avg_fwhm_rt', 'polarity']
+STAGES = [
+    Stage('raw', read_raw, [], ['raw_path'], RAW_PARAMS,
+          ['raw/{stem}.ms1', 'raw/{stem}.ms2'], True),
+    Stage('peaks', find_peaks, ['raw'], [],
+          ['num_samples_mz', 'num_samples_rt', 'smoothing_coefficient_mz', 'smoothing_coefficient_rt', 'max_peaks'],
+          ['peaks/{stem}.peaks'], True),
+    Stage('similarity', peaks_similarity, ['peaks'], [], ['similarity_num_peaks'],
+          ['quality/similarity_peaks.csv'], False),
+    Stage('warp', pastaq.perform_rt_alignment, ['peaks'], ['reference'],
+          ['warp2d_slack', 'warp2d_window_size', 'warp2d_num_points', 'warp2d_rt_expand_factor',
+           'warp2d_peaks_per_window', 'similarity_num_peaks'],
+          ['warped_peaks/{stem}.peaks', 'time_map/{stem}.tmap'], False),
+    Stage('warped_similarity', warped_peaks_similarity, ['warp'], [], ['similarity_num_peaks'],
+          ['quality/similarity_warped_peaks.csv'], False),
+    Stage('features', pastaq.perform_feature_detection, ['warp'], [], ['feature_detection_charge_states'],
+          ['features/{stem}.features'], True),
+    Stage('ident', pastaq.parse_mzidentml_files, [], ['ident_path'],
+          ['ident_ignore_decoy', 'ident_require_threshold', 'ident_max_rank_only', 'min_mz', 'max_mz', 'min_rt',
+           'max_rt'],
+          ['ident/{stem}.ident'], True),
+    Stage('link', pastaq.link_peaks_msms_idents, ['raw', 'warp', 'ident'], [], ['link_n_sig_mz', 'link_n_sig_rt'],
+          ['linking/{stem}.peak_ms2.link', 'linking/{stem}.ident_ms2.link', 'linking/{stem}.ident_peak.link'], True),
+    Stage('metamatch', pastaq.match_peaks_and_features, ['warp', 'features'], ['group'],
+          ['metamatch_fraction', 'metamatch_n_sig_mz', 'metamatch_n_sig_rt'],
+          ['metamatch/peaks.clusters', 'metamatch/features.clusters'], False),
+    Stage('quant', pastaq.create_quantitative_tables, ['link', 'metamatch', 'ident', 'features'], [],
+          ['quant_isotopes', 'quant_features', 'quant_features_charge_state_filter', 'quant_ident_linkage',
+           'quant_consensus', 'quant_consensus_min_ident', 'quant_save_all_annotations',
+           'quant_proteins_min_peptides', 'quant_proteins_remove_subset_proteins',
+           'quant_proteins_ignore_ambiguous_peptides', 'quant_proteins_quant_type'],
+          ['quant/peak_clusters_metadata.csv', 'quant/feature_clusters_metadata.csv'], False),
+    Stage('qc_plots', pastaq.generate_qc_plots, ['quant', 'similarity', 'warped_similarity'], [],
+          ['qc_plot_palette', 'qc_plot_extension', 'qc_plot_fill_alpha', 'qc_plot_line_alpha',
+           'qc_plot_scatter_alpha', 'qc_plot_scatter_size', 'qc_plot_min_dynamic_alpha', 'qc_plot_per_file',
+           'qc_plot_line_style', 'qc_plot_dpi', 'qc_plot_font_family', 'qc_plot_font_size', 'qc_plot_fig_size_x',
+           'qc_plot_fig_size_y', 'qc_plot_fig_legend', 'qc_plot_mz_vs_sigma_mz_max_peaks'],
+          ['quality'], False),
+    Stage('summary', summary, ['quant'], [], [], ['summary.log'], False),
+]
+STAGE_INDEX = {stage.name: stage for stage in STAGES}
+
+
+# Stages whose results depend on any of the parameters, directly or through the stages they depend on
+# the stages are listed in an order where each stage comes after its inputs
+def stale_stages(params):
+    params = set(params)
+    stale = set()
+    for stage in STAGES:
+        if params.intersection(stage.params) or stale.intersection(stage.inputs):
+            stale.add(stage.name)
+    return [stage.name for stage in STAGES if stage.name in stale]
+
+
+# Subdirectories of the output directory the stages write to
+OUTPUT_DIRS = ['raw', 'quality', 'peaks', 'time_map', 'warped_peaks', 'metamatch', 'linking', 'ident', 'features',
+               'quant']
+
+
+class StageError(Exception):
+    """
+    Failure of a stage in a worker process, carrying the output the stage printed until then.
+    """
+    def __init__(self, message, output):
+        super().__init__(message, output)
+        self.message = message
+        self.output = output
+
+    def __str__(self):
+        return self.message
+
+
+# Logger of the worker process, writing to info.log like pastaq.dda_pipeline does
+def stage_logger(output_dir):
+    logger = logging.getLogger('pipeline')
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        handler = logging.FileHandler(os.path.join(output_dir, 'info.log'))
+        handler.setFormatter(logging.Formatter('%(asctime)s | %(message)s'))
+        logger.addHandler(handler)
+    return logger
+
+
+# Runs a stage in a worker process and returns what it printed
+def run_stage_task(name, params, output_dir, force_override=False):
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            STAGE_INDEX[name].function(params, output_dir, stage_logger(output_dir), force_override)
+    except Exception as e:
+        raise StageError('{}: {}'.format(type(e).__name__, e), output.getvalue())
+    return output.getvalue()
+
+
+# Manifest of the stage cache in the output directory
+CACHE_FILE = 'stage_cache.json'
+# Changing this invalidates all cached stages
+CACHE_VERSION = 1
+
+
+# Identifies the content of an input file without reading it
+def fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path, None, None]
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+class StageCache:
+    """
+    Remembers the key each stage task was last computed with, so that a task is only
+    run again when its inputs, the parameters it reads or the tasks it depends on changed.
+    A key is the hash of the input file fingerprints, the parameter subset of the stage
+    and the keys of the upstream tasks, so a change invalidates everything downstream of it.
+
+    Arguments:
+    - output directory
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, CACHE_FILE)
+        self.entries = {}
+
+    def load(self):
+        try:
+            with open(self.path) as cache_file:
+                self.entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(self.entries, cache_file)
+        os.replace(tmp_path, self.path)
+
+    # Hash of everything the result of a task depends on
+    @staticmethod
+    def key(task, params, input_files, upstream_keys):
+        stage = task.stage
+        files = []
+        for input_file in input_files:
+            values = [input_file['stem']]
+            for name in stage.files:
+                value = input_file.get(name)
+                if name.endswith('_path') and value and value != 'none':
+                    value = fingerprint(value)
+                values.append(value)
+            files.append(values)
+        content = {
+            'version': CACHE_VERSION,
+            'stage': stage.name,
+            'params': {name: params.get(name) for name in stage.params},
+            'files': files,
+            'upstream': sorted(upstream_keys),
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    # Outputs the task declares, relative to the output directory
+    @staticmethod
+    def outputs(task):
+        stems = [input_file['stem'] for input_file in task.input_files] or ['']
+        return list(dict.fromkeys(output.format(stem=stem) for output in task.stage.outputs for stem in stems))
+
+    # Whether the task was computed with this key and its results are still there
+    def hit(self, task, key):
+        entry = self.entries.get(task.id)
+        if not entry or entry['key'] != key:
+            return False
+        return all(os.path.exists(os.path.join(self.output_dir, output)) for output in entry['outputs'])
+
+    # Records a computed task with the outputs it actually wrote
+    def store(self, task, key):
+        outputs = [output for output in self.outputs(task) if os.path.exists(os.path.join(self.output_dir, output))]
+        self.entries[task.id] = {'key': key, 'outputs': outputs}
+        self.save()
+
+
+# Removes the files a task is about to write, they may be links shared with other output directories
+# files in an output directory are copied instead, since the task may read the ones it does not write
+def detach_outputs(output_dir, task):
+    for output in StageCache.outputs(task):
+        path = os.path.join(output_dir, output)
+        if os.path.isfile(path):
+            os.remove(path)
+        elif os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    file_path = os.path.join(root, name)
+                    if os.stat(file_path).st_nlink > 1:
+                        shutil.copy2(file_path, file_path + '.tmp')
+                        os.replace(file_path + '.tmp', file_path)
+
+
+# Links a file of one output directory into another, copies it where links are not possible
+def link_file(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+# Makes the outputs a task wrote in one output directory available in another
+def link_outputs(source_dir, target_dir, outputs):
+    for output in outputs:
+        source = os.path.join(source_dir, output)
+        if not os.path.isdir(source):
+            link_file(source, os.path.join(target_dir, output))
+            continue
+        for root, _, names in os.walk(source):
+            for name in names:
+                relative = os.path.relpath(os.path.join(root, name), source_dir)
+                link_file(os.path.join(source_dir, relative), os.path.join(target_dir, relative))
+
+
+class StageTask:
+    """
+    A stage run for one input file, or for all of them if the stage is not per file.
+
+    Arguments:
+    - the stage
+    - the input file or None
+    - all input files, whose outputs a stage that is not per file writes
+    """
+    def __init__(self, stage, input_file=None, input_files=()):
+        self.stage = stage
+        self.input_file = input_file
+        self.input_files = [input_file] if input_file else list(input_files)
+        self.id = task_id(stage.name, input_file)
+        self.deps = set()
+
+    def describe(self):
+        if self.input_file:
+            return '{} ({})'.format(self.stage.name, self.input_file['stem'])
+        return self.stage.name
+
+
+def task_id(name, input_file=None):
+    if input_file:
+        return '{}:{}'.format(name, input_file['stem'])
+    return name
+
+
+# Largest peak memory of the child processes that finished so far in bytes, None where it can not be measured
+def children_peak_memory():
+    if sys.platform == 'win32':
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # kilobytes everywhere but on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageRunner:
+    """
+    Runs the DDA pipeline as a graph of stage tasks instead of a single pastaq.dda_pipeline call.
+    Per file stages start for a file as soon as the stages they depend on are done for that file,
+    and all independent tasks run concurrently on a pool of worker processes.
+    With an estimate of its resources, the automatic number of workers is bounded by the free memory
+    and a run that computed every task is recorded to calibrate later estimates.
+
+    Arguments:
+    - pastaq parameters
+    - input files
+    - output directory
+    - number of worker processes (0 is automatic)
+    - whether results of earlier runs are reused (see StageCache)
+    - uncalibrated estimate of the resources of the run (see estimator.Estimate.to_dict)
+    """
+    def __init__(self, params, input_files, output_dir, workers=0, cache=True, prediction=None):
+        self.params = params
+        self.input_files = input_files
+        self.output_dir = output_dir
+        self.workers = workers
+        self.cache = StageCache(output_dir) if cache else None
+        self.estimate = estimator.Estimate.from_dict(prediction) if prediction else None
+        self.keys = {}
+        self.executor = None
+
+    # Prepares the output directory and the input files in the same way pastaq.dda_pipeline does
+    def prepare(self):
+        for directory in OUTPUT_DIRS:
+            os.makedirs(os.path.join(self.output_dir, directory), exist_ok=True)
+        for file in self.input_files:
+            if 'ident_path' not in file:
+                file['ident_path'] = 'none'
+            if 'stem' not in file:
+                file['stem'] = os.path.splitext(os.path.basename(file['raw_path']))[0]
+            if 'group' not in file:
+                file['group'] = 'none'
+        self.params['input_files'] = self.input_files
+        with open(os.path.join(self.output_dir, 'parameters.json'), 'w') as json_file:
+            json.dump(self.params, json_file)
+        if self.cache:
+            self.cache.load()
+
+    # Creates the tasks of all stages with their dependencies
+    def tasks(self):
+        tasks = {}
+        for stage in STAGES:
+            for input_file in (self.input_files if stage.per_file else [None]):
+                task = StageTask(stage, input_file, self.input_files)
+                for name in stage.inputs:
+                    if STAGE_INDEX[name].per_file and input_file:
+                        task.deps.add(task_id(name, input_file))
+                    elif STAGE_INDEX[name].per_file:
+                        task.deps.update(task_id(name, file) for file in self.input_files)
+                    else:
+                        task.deps.add(name)
+                tasks[task.id] = task
+        return tasks
+
+    # Parameters passed to a task, per file tasks only see their own file
+    def task_params(self, task):
+        if task.input_file:
+            return dict(self.params, input_files=[task.input_file])
+        return self.params
+
+    def get_workers(self):
+        if self.workers > 0 or not self.estimate:
+            return estimator.stage_workers(self.workers, self.parallel_files())
+        task_memory = estimator.Calibration.load(self.output_dir).apply(self.estimate).task_memory
+        return estimator.stage_workers(self.workers, self.parallel_files(), task_memory, files.available_memory())
+
+    # Files whose tasks can run side by side
+    def parallel_files(self):
+        return len(self.input_files)
+
+    # Submits a task to the pool, returns None if its cached result is still valid
+    # without the cache pastaq decides itself, as it always did, and skips the outputs that exist
+    def submit(self, task):
+        if not self.cache:
+            return self.executor.submit(run_stage_task, task.stage.name, self.task_params(task), self.output_dir)
+        input_files = [task.input_file] if task.input_file else self.input_files
+        upstream_keys = [self.keys[dep] for dep in task.deps]
+        self.keys[task.id] = self.cache.key(task, self.params, input_files, upstream_keys)
+        if self.cache.hit(task, self.keys[task.id]):
+            return None
+        detach_outputs(self.output_dir, task)
+        # pastaq skips outputs that exist, regardless of the parameters they were computed with
+        return self.executor.submit(run_stage_task, task.stage.name, self.task_params(task), self.output_dir, True)
+
+    def run(self):
+        self.prepare()
+        tasks = self.tasks()
+        done = set()
+        running = {}
+        totals = {stage.name: 0 for stage in STAGES}
+        for task in tasks.values():
+            totals[task.stage.name] += 1
+        finished_counts = {stage.name: 0 for stage in STAGES}
+        hits = {stage.name: 0 for stage in STAGES}
+
+        time_start = time.time()
+        memory_start = children_peak_memory()
+        workers = self.get_workers()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as self.executor:
+            while tasks or running:
+                for task in [task for task in tasks.values() if task.deps <= done]:
+                    del tasks[task.id]
+                    future = self.submit(task)
+                    if future is None:
+                        print('Stage cached: {}'.format(task.describe()))
+                        hits[task.stage.name] += 1
+                        done.add(task.id)
+                        continue
+                    print('Stage started: {}'.format(task.describe()))
+                    running[future] = task
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        print(future.result(), end='')
+                    except StageError as e:
+                        print(e.output, end='')
+                        self.abort()
+                        raise
+                    done.add(task.id)
+                    if self.cache:
+                        self.cache.store(task, self.keys[task.id])
+                    name = task.stage.name
+                    finished_counts[name] += 1
+                    print('Stage finished: {} [{}/{}]'.format(task.describe(), finished_counts[name], totals[name]))
+        self.executor = None
+        if self.cache:
+            print('Cache hits: ' + ', '.join('{} {}/{}'.format(name, hits[name], totals[name]) for name in totals))
+        print('Pipeline finished in {}'.format(datetime.timedelta(seconds=round(time.time() - time_start))))
+        # a run that reused cached results says little about what a complete run needs
+        if self.estimate and not any(hits.values()):
+            self.record(workers, time.time() - time_start, memory_start)
+
+    # Records what the run used next to its estimate, the peak memory is that of the largest worker
+    # and is only known when a worker used more than every process the runner started before
+    def record(self, workers, seconds, memory_start):
+        memory = children_peak_memory()
+        if memory is None or memory <= (memory_start or 0):
+            memory = None
+        self.estimate.workers = workers
+        estimator.record_run(self.output_dir, self.estimate.prediction(),
+                             {'memory': memory, 'disk': self.output_size(), 'time': seconds})
+
+    # Size of the files in the output directories of the stages
+    def output_size(self):
+        size = 0
+        for directory in OUTPUT_DIRS:
+            for root, _, names in os.walk(os.path.join(self.output_dir, directory)):
+                size += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+        return size
+
+    # Stops all worker processes, which frees all memory they allocated
+    def abort(self):
+        executor = self.executor
+        if executor is None:
+            return
+        for item in list(getattr(executor, '_pending_work_items', {}).values()):
+            item.future.cancel()
+        # the pool has no public way of stopping tasks that are already running
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+
+
+# Variants of a parameter sweep are run in numbered directories in this subdirectory of the output directory
+SWEEP_DIR = 'sweep'
+# Results a variant replaces while other variants still need them are kept here until the sweep ends
+KEPT_DIR = 'kept'
+
+
+def variant_dir(output_dir, index):
+    return os.path.join(output_dir, SWEEP_DIR, 'variant_{:02d}'.format(index + 1))
+
+
+class SweepRunner(StageRunner):
+    """
+    Runs variants of the parameters side by side, each in its own directory (see variant_dir).
+    A task is identified by its cache key, so a task that is the same in several variants, like the
+    stages upstream of the swept parameters, is computed once and its outputs are linked into the
+    other variants. Results of earlier runs of the project or of the sweep are linked in the same way.
+    The tasks of all variants share one pool of workers.
+
+    Arguments:
+    - pastaq parameters
+    - input files
+    - output directory
+    - parameters each variant changes
+    - number of worker processes (0 is automatic)
+    - uncalibrated estimate of the resources of a single variant
+    """
+    def __init__(self, params, input_files, output_dir, variants, workers=0, prediction=None):
+        super().__init__(params, input_files, output_dir, workers, False, prediction)
+        self.runners = [StageRunner(dict(params, **changes), input_files, variant_dir(output_dir, i), workers)
+                        for i, changes in enumerate(variants)]
+        # output directory and outputs of each task key whose results exist
+        self.sources = {}
+
+    def parallel_files(self):
+        return len(self.input_files) * len(self.runners)
+
+    @staticmethod
+    def describe(runner, task):
+        return '{} ({})'.format(task.describe(), os.path.basename(runner.output_dir))
+
+    # Prepares the variant directories and computes the key of every task of every variant
+    def prepare_variants(self):
+        caches = [StageCache(self.output_dir)]
+        caches[0].load()
+        items = []
+        for runner in self.runners:
+            runner.prepare()
+            caches.append(runner.cache)
+            for task in runner.tasks().values():
+                input_files = [task.input_file] if task.input_file else runner.input_files
+                upstream_keys = [runner.keys[dep] for dep in task.deps]
+                runner.keys[task.id] = StageCache.key(task, runner.params, input_files, upstream_keys)
+                items.append((runner, task))
+        for cache in caches:
+            for entry in cache.entries.values():
+                if all(os.path.exists(os.path.join(cache.output_dir, output)) for output in entry['outputs']):
+                    self.sources.setdefault(entry['key'], (cache.output_dir, entry['outputs']))
+        return items
+
+    # Sets the results a variant holds for a task aside before they are replaced, other variants may need them
+    def keep(self, runner, task):
+        entry = runner.cache.entries.get(task.id)
+        if not entry or self.sources.get(entry['key'], (None,))[0] != runner.output_dir:
+            return
+        kept_dir = os.path.join(self.output_dir, SWEEP_DIR, KEPT_DIR, entry['key'])
+        link_outputs(runner.output_dir, kept_dir, entry['outputs'])
+        self.sources[entry['key']] = (kept_dir, entry['outputs'])
+
+    # Finishes a task of a variant with the results of the same task computed elsewhere
+    def share(self, runner, task):
+        key = runner.keys[task.id]
+        if runner.cache.hit(task, key):
+            print('Stage cached: {}'.format(self.describe(runner, task)))
+            return
+        source_dir, outputs = self.sources[key]
+        self.keep(runner, task)
+        link_outputs(source_dir, runner.output_dir, outputs)
+        print('Stage shared: {}'.format(self.describe(runner, task)))
+        runner.cache.store(task, key)
+
+    def run(self):
+        items = self.prepare_variants()
+        done = set()
+        computing = set()
+        running = {}
+        computed = shared = 0
+
+        time_start = time.time()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.get_workers(), mp_context=context) as self.executor:
+            while items or running:
+                waiting = []
+                for runner, task in items:
+                    key = runner.keys[task.id]
+                    if not all((runner, dep) in done for dep in task.deps) or key in computing:
+                        waiting.append((runner, task))
+                    elif key in self.sources:
+                        self.share(runner, task)
+                        done.add((runner, task.id))
+                        shared += 1
+                    else:
+                        self.keep(runner, task)
+                        detach_outputs(runner.output_dir, task)
+                        future = self.executor.submit(run_stage_task, task.stage.name, runner.task_params(task),
+                                                      runner.output_dir, True)
+                        print('Stage started: {}'.format(self.describe(runner, task)))
+                        computing.add(key)
+                        running[future] = (runner, task)
+                items = waiting
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    runner, task = running.pop(future)
+                    try:
+                        print(future.result(), end='')
+                    except StageError as e:
+                        print(e.output, end='')
+                        self.abort()
+                        raise
+                    key = runner.keys[task.id]
+                    runner.cache.store(task, key)
+                    self.sources[key] = (runner.output_dir, runner.cache.entries[task.id]['outputs'])
+                    computing.discard(key)
+                    done.add((runner, task.id))
+                    computed += 1
+                    print('Stage finished: {}'.format(self.describe(runner, task)))
+        self.executor = None
+        shutil.rmtree(os.path.join(self.output_dir, SWEEP_DIR, KEPT_DIR), ignore_errors=True)
+        print('Tasks computed: {}, shared or cached: {}'.format(computed, shared))
+        print('Sweep of {} variants finished in {}'.format(
+            len(self.runners), datetime.timedelta(seconds=round(time.time() - time_start))))
+
+
+# Runs the DDA pipeline, either in the GUI process or in a worker process
+# with variants, the variants of a parameter sweep are run instead
+def run_dda(params, input_files, output_dir, workers=0, cache=True, prediction=None, variants=None):
+    if variants:
+        SweepRunner(params, input_files, output_dir, variants, workers, prediction).run()
+    else:
+        StageRunner(params, input_files, output_dir, workers, cache, prediction).run()
+
+
+# Entry point of the worker process, runs the pipeline job stored at the given path
+def run_job(job_path):
+    with open(job_path) as job_file:
+        job = json.load(job_file)
+    try:
+        run_dda(job['params'], job['input_files'], job['output_dir'], job.get('workers', 0), job.get('cache', True),
+                job.get('prediction'), job.get('variants'))
+    except Exception as e:
+        print('ERROR:', e)
+        return 1
+    return 0
+
+
+# Command that starts a worker process for a pipeline job
+def worker_command(job_path):
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, WORKER_FLAG, job_path]
+    return [sys.executable, '-u', os.path.abspath(__file__), job_path]
+
+
+# Starts the worker in its own process group so that it can be killed together with its children
+def start_worker(job_path):
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    options = files.process_group_options()
+    return subprocess.Popen(
+        worker_command(job_path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+        env=env,
+        **options
+    )
 
 
 class TextStream(QObject):
     """
     The log text appearing on the pipeline modal.
     This will display the progress of the pipeline.
+    Writes from any thread are collected until the modal takes them in a batch,
+    and the complete log is written to a file.
+
+    Arguments:
+    - path of the log file (optional)
     """
-    # A qt signal carrying the text output by the pipeline
-    text_written = pyqtSignal(str)
+    def __init__(self, log_path=None, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.pending_size = 0
+        self.log_file = None
+        if log_path:
+            try:
+                self.log_file = open(log_path, 'a', encoding='utf-8')
+            except OSError:
+                pass
 
     def write(self, text):
-        self.text_written.emit(str(text))
+        text = str(text)
+        with self.lock:
+            self.pending.append(text)
+            self.pending_size += len(text)
+            # the view can not show more than this anyway, so do not keep it in memory
+            while self.pending_size > LOG_MAX_PENDING and len(self.pending) > 1:
+                self.pending_size -= len(self.pending.pop(0))
+            if self.log_file:
+                self.log_file.write(text)
+
+    # returns all text written since the last call
+    def drain(self):
+        with self.lock:
+            text = ''.join(self.pending)
+            self.pending = []
+            self.pending_size = 0
+        return text
+
+    def flush(self):
+        with self.lock:
+            if self.log_file:
+                self.log_file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
+
 
- 
 class PipelineRunner(QThread):
     """
     Thread that runs the pipeline parallel to the GUI.
     It also is responsible for automatically converting .mgf files
-    to .mzID files if necessary.
+    to .mzID files if necessary. The conversions run on a bounded pool
+    of workers, and with all_or_nothing a single failed conversion stops the run,
+    otherwise the failed files are quantified without identifications.
+    The stages of the pipeline run on a pool of worker processes, which are killed on cancel.
+    When isolated, the pipeline itself also runs in a separate process.
+    The search progress of each .mgf file is reported with the progress signal.
+    Once finished, succeeded tells whether every stage of the pipeline ran without an error.
 
     Arguments:
     - a file processor for .mgf files
     """
     finished = pyqtSignal()
+    progress = pyqtSignal(str, int)
     params = {}
     input_files = []
     output_dir = ''
+    ident_workers = 1
+    all_or_nothing = True
+    ident_batched = False
+    conversion_workers = 1
+    isolated = False
+    stage_workers = 0
+    use_cache = True
+    # parameters changed in the GUI since the last run
+    changed_params = []
+    # uncalibrated estimate of the resources of the run
+    prediction = None
+    # parameters each variant of a parameter sweep changes, empty for a single run
+    variants = []
+    succeeded = False
 
     def __init__(self, file_processor):
         QThread.__init__(self)
         self.file_processor = file_processor
+        self.process = None
+        self.engine = None
+        self.cancelled = False
 
     def __del__(self):
         self.wait()
 
+    # processes the .mgf files of the run in parallel and rewrites their identification path
+    # returns the input files for the pipeline or None if the pipeline should not be started
+    def identify(self):
+        pending = [entry for entry in self.input_files if entry.get('ident_path', '').endswith('.mgf')]
+        if not pending:
+            return self.input_files
+
+        failed = set()
+        # a cancel of an earlier run does not keep this one from starting processes
+        self.file_processor.cancelled = False
+        if self.cancelled:
+            return None
+        self.file_processor.interactive = False
+        self.file_processor.progress = self.progress.emit
+        self.file_processor.share(1 if self.ident_batched else self.ident_workers)
+        queue = files.ConversionQueue(self.file_processor.convert, self.conversion_workers)
+        if self.ident_batched:
+            outcomes = self.identify_batch(pending, queue)
+        else:
+            outcomes = self.identify_parallel(pending, queue)
+        for done, (entry, mzid) in enumerate(outcomes, 1):
+            if mzid:
+                print('[{}/{}] {} successfully processed to {}'.format(done, len(pending), entry['ident_path'], mzid))
+                entry['ident_path'] = mzid
+                continue
+            print('[{}/{}] Automatic identification process of {} not successful'.format(
+                done, len(pending), entry['ident_path']))
+            failed.add(id(entry))
+        queue.close()
+        self.file_processor.interactive = True
+        self.file_processor.progress = None
+
+        if self.cancelled:
+            print('Pipeline cancelled')
+            return None
+        if failed and self.all_or_nothing:
+            return None
+        # failed files are run without identification, the project itself keeps the .mgf
+        return [dict(entry, ident_path='none') if id(entry) in failed else entry for entry in self.input_files]
+
+    # identifies the files on a pool of threads, yields each entry with its .mzID or False
+    # a thread starts the next search as soon as it handed its .pepXML to the conversion queue
+    def identify_parallel(self, pending, queue):
+        print('Starting automatic identification process of {} files on {} workers, converting on {}'.format(
+            len(pending), self.ident_workers, self.conversion_workers))
+        with ThreadPoolExecutor(max_workers=self.ident_workers) as pool:
+            running = {pool.submit(self.file_processor.process, entry['ident_path'], queue): entry
+                       for entry in pending}
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                if self.cancelled:
+                    # searches and conversions that have not started yet are dropped
+                    for future in running:
+                        future.cancel()
+                    queue.cancel()
+                    return
+                for future in finished:
+                    entry = running.pop(future)
+                    if future.cancelled():
+                        continue
+                    mzid = future.result()
+                    if isinstance(mzid, Future):
+                        running[mzid] = entry
+                        continue
+                    yield entry, mzid
+                    if not mzid and self.all_or_nothing:
+                        # identifications that have not started yet are dropped
+                        for other in running:
+                            other.cancel()
+                        queue.cancel()
+
+    # identifies all files in a single MSFragger run, yields each entry with its .mzID or False
+    def identify_batch(self, pending, queue):
+        print('Starting automatic identification process of {} files in a single MSFragger run'.format(len(pending)))
+        mzids = self.file_processor.process_batch([entry['ident_path'] for entry in pending], queue)
+        for entry in pending:
+            yield entry, mzids[entry['ident_path']]
+
+    # runs the pipeline in a worker process and streams its output into the log
+    def run_isolated(self, input_files):
+        job_file, job_path = tempfile.mkstemp(prefix='pastaq_job_', suffix='.json')
+        with os.fdopen(job_file, 'w') as job:
+            json.dump({'params': self.params, 'input_files': input_files, 'output_dir': self.output_dir,
+                       'workers': self.stage_workers, 'cache': self.use_cache, 'prediction': self.prediction,
+                       'variants': self.variants}, job)
+        try:
+            self.process = start_worker(job_path)
+            for line in self.process.stdout:
+                print(line, end='')
+            code = self.process.wait()
+        finally:
+            os.unlink(job_path)
+
+        if self.cancelled:
+            print('Pipeline cancelled')
+        elif code < 0:
+            # killed by a signal, most likely by the out of memory killer
+            print('ERROR: pipeline process was killed by signal {} (out of memory?)'.format(-code))
+        elif code != 0:
+            print('ERROR: pipeline process exited with code {}'.format(code))
+        else:
+            self.succeeded = True
+
+    # runs the stages of the pipeline from this thread
+    def run_in_thread(self, input_files):
+        try:
+            if self.variants:
+                self.engine = SweepRunner(self.params, input_files, self.output_dir, self.variants,
+                                          self.stage_workers, self.prediction)
+            else:
+                self.engine = StageRunner(self.params, input_files, self.output_dir, self.stage_workers,
+                                          self.use_cache, self.prediction)
+            self.engine.run()
+        except Exception as e:
+            if self.cancelled:
+                print('Pipeline cancelled')
+            else:
+                print('ERROR:', e)
+        else:
+            self.succeeded = not self.cancelled
+
+    # kills the processes of the pipeline and of the identification, which frees all of their cores and memory
+    def cancel(self):
+        self.cancelled = True
+        self.file_processor.cancel()
+        if self.process:
+            files.kill_process_tree(self.process)
+        if self.engine:
+            self.engine.abort()
+
     # this will be run when the thread is started
     def run(self):
-        skip = False
-        for entry in self.input_files:
-            path = entry['ident_path']
-            if path.endswith('.mgf'):
-                print('Starting automatic identification process of ' + path)
-                mzid = self.file_processor.process(path)
-                if mzid:
-                    print(entry['ident_path'] + ' successfully processed to ' + mzid)
-                    entry['ident_path'] = mzid
-                else:
-                    print('Automatic identification process not successful')
-                    skip = True
-                    break
-
-        if not skip:
-            print('Starting DDA Pipeline')
+        self.succeeded = False
+        input_files = self.identify()
+
+        if input_files is not None and not self.cancelled:
+            if self.variants:
+                print('Starting parameter sweep of {} variants'.format(len(self.variants)))
+            else:
+                print('Starting DDA Pipeline')
+            if self.use_cache and self.changed_params and not self.variants:
+                print('Parameters changed since the last run: {}'.format(', '.join(self.changed_params)))
+                print('Stages to run again: {}'.format(', '.join(stale_stages(self.changed_params)) or 'none'))
             time.sleep(1)
-            try:
-                pastaq.dda_pipeline(self.params, self.input_files, self.output_dir)
-            except Exception as e:
-                print('ERROR:', e)
+            if self.isolated:
+                self.run_isolated(input_files)
+            else:
+                self.run_in_thread(input_files)
 
         self.finished.emit()
 
@@ -76,20 +947,34 @@ class PipelineLogDialog(QDialog):
     - input files for the PASTAQ pipeline
     - parameters for the pipeline
     - output directory
+    - parameters changed since the last run
+    - uncalibrated estimate of the resources of the run
+    - parameters each variant of a parameter sweep changes, None for a single run
     """
     group = ''
     mzid_paths = []
 
-    def __init__(self, params, input_files, output_dir, file_processor, parent=None):
+    def __init__(self, params, input_files, output_dir, file_processor, changed_params=None, prediction=None,
+                 variants=None, parent=None):
         super().__init__(parent)
 
         self.setWindowTitle('PASTAQ: DDA Pipeline (Running)')
 
         # Add custom output to text stream.
-        sys.stdout = TextStream(text_written=self.append_text)
+        self.stream = TextStream(os.path.join(output_dir, LOG_FILE))
+        sys.stdout = self.stream
 
-        # Log text box.
+        # Search progress of the .mgf files, shown once identification starts.
+        self.search_progress = {}
+        self.progress_label = QLabel()
+        self.progress_label.setWordWrap(True)
+        self.progress_label.hide()
+
+        # Log text box, updated in batches.
         self.text_box = self.init_log()
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_INTERVAL)
 
         # Dialog buttons (Ok/Cancel).
         self.buttons = self.init_buttons()
@@ -98,14 +983,18 @@ class PipelineLogDialog(QDialog):
         self.setLayout(self.init_layout(self.buttons, self.text_box))
 
         self.pipeline_thread = self.init_pipeline(params, input_files, output_dir, file_processor)
+        self.pipeline_thread.changed_params = changed_params or []
+        self.pipeline_thread.prediction = prediction
+        self.pipeline_thread.variants = variants or []
         self.pipeline_thread.start()
 
     def __del__(self):
         sys.stdout = sys.__stdout__
 
     def init_log(self):
-        text_box = QTextEdit()
+        text_box = QPlainTextEdit()
         text_box.setReadOnly(True)
+        text_box.setMaximumBlockCount(LOG_MAX_LINES)
         return text_box
 
     # Allows for cancellation of the pipeline or confirmation once it is done
@@ -116,6 +1005,7 @@ class PipelineLogDialog(QDialog):
 
     def init_layout(self, buttons, textbox):
         layout = QVBoxLayout()
+        layout.addWidget(self.progress_label)
         layout.addWidget(textbox)
         layout.addWidget(buttons)
         return layout
@@ -126,9 +1016,39 @@ class PipelineLogDialog(QDialog):
         pipeline_thread.params = params
         pipeline_thread.input_files = input_files
         pipeline_thread.output_dir = output_dir
+        pending = [entry for entry in input_files if entry.get('ident_path', '').endswith('.mgf')]
+        heap = file_processor.estimate_heap([entry['ident_path'] for entry in pending])
+        pipeline_thread.ident_workers = file_processor.get_workers(len(pending), heap)
+        pipeline_thread.all_or_nothing = file_processor.all_or_nothing
+        pipeline_thread.ident_batched = file_processor.batched
+        pipeline_thread.conversion_workers = file_processor.get_conversions(len(pending))
+        pipeline_thread.isolated = params.get('pipeline_isolated', True)
+        pipeline_thread.stage_workers = params.get('pipeline_workers', 0)
+        pipeline_thread.use_cache = params.get('pipeline_cache', True)
         pipeline_thread.finished.connect(self.exit_success)
+        pipeline_thread.progress.connect(self.update_progress)
         return pipeline_thread
 
+    # Moves the text written since the last flush into the log field
+    def flush_log(self):
+        text = self.stream.drain()
+        if text:
+            self.append_text(text)
+
+    # Stops updating the log field and closes the log file
+    def close_log(self):
+        sys.stdout = sys.__stdout__
+        self.log_timer.stop()
+        self.flush_log()
+        self.stream.close()
+
+    # Shows the search progress of each .mgf file
+    def update_progress(self, mgf, percent):
+        self.search_progress[os.path.basename(mgf)] = percent
+        self.progress_label.setText('MSFragger search: ' + ', '.join(
+            '{} {}%'.format(name, percent) for name, percent in self.search_progress.items()))
+        self.progress_label.show()
+
     # Appends text in the log field from the pipeline
     def append_text(self, text):
         cursor = self.text_box.textCursor()
@@ -140,7 +1060,7 @@ class PipelineLogDialog(QDialog):
     # In case the pipeline succeeds replace the cancel button with an ok button
     def exit_success(self):
         # Restore stdout pipe.
-        sys.stdout = sys.__stdout__
+        self.close_log()
 
         new_buttons = QDialogButtonBox(QDialogButtonBox.Ok)
         new_buttons.accepted.connect(self.accept)
@@ -154,9 +1074,11 @@ class PipelineLogDialog(QDialog):
         # temporary files.
 
         # Restore stdout pipe.
-        sys.stdout = sys.__stdout__
-        # this does not quit, the thread it keeps running in the background
-        self.pipeline_thread.quit()
-        # self.pipeline_thread.terminate() can be used in place of quit, and it will end the thread
-        # but not free the memory allocated in the C++ part of the code
+        self.close_log()
+        # killing the worker processes frees the memory allocated in the C++ part of the code
+        self.pipeline_thread.cancel()
         self.reject()
+
+
+if __name__ == '__main__':
+    sys.exit(run_job(sys.argv[1]))
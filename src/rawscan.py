@@ -0,0 +1,266 @@
+import collections
+import math
+import mmap
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Files scanned side by side when raw files are added
+RAW_SCAN_WORKERS = 8
+# The header of a spectrum ends before its peak arrays, which are never read
+HEADER_LIMIT = 1 << 16
+
+ATTRIBUTE = re.compile(rb'([\w:]+)\s*=\s*"([^"]*)"')
+CV_PARAM = re.compile(rb'<cvParam\s([^>]*)>')
+INDEX_OFFSET = re.compile(rb'<offset[^>]*>\s*(\d+)\s*</offset>')
+# retention time of mzXML, an xs:duration like PT123.4S
+DURATION = re.compile(r'^-?PT?(?:([\d.]+)H)?(?:([\d.]+)M)?(?:([\d.]+)S)?$')
+
+# cvParams of the spectrum header of mzML
+MS_LEVEL = 'MS:1000511'
+MS1_SPECTRUM = 'MS:1000579'
+MSN_SPECTRUM = 'MS:1000580'
+POSITIVE_SCAN = 'MS:1000130'
+NEGATIVE_SCAN = 'MS:1000129'
+SCAN_START_TIME = 'MS:1000016'
+LOWEST_MZ = 'MS:1000528'
+HIGHEST_MZ = 'MS:1000527'
+WINDOW_LOWER = 'MS:1000501'
+WINDOW_UPPER = 'MS:1000500'
+MINUTE_UNITS = ('UO:0000031', 'minute')
+
+
+def attributes(text):
+    return {name.decode(): value.decode() for name, value in ATTRIBUTE.findall(text)}
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# seconds of an xs:duration, mzXML files also hold plain seconds
+def duration_seconds(value):
+    if value is None:
+        return None
+    match = DURATION.match(value.strip())
+    if not match:
+        return to_float(value)
+    hours, minutes, seconds = (float(part) if part else 0.0 for part in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+# Level, polarity, retention time in seconds and m/z range of a spectrum from its mzML header
+# the observed m/z range is used where the file has it, the scan window where it does not
+def read_mzml_header(header):
+    params = {}
+    for cv_param in CV_PARAM.findall(header):
+        values = attributes(cv_param)
+        params.setdefault(values.get('accession'), values)
+    level = params.get(MS_LEVEL, {}).get('value')
+    level = int(level) if level and level.isdigit() else 1 if MS1_SPECTRUM in params else None
+    polarity = 'positive' if POSITIVE_SCAN in params else 'negative' if NEGATIVE_SCAN in params else None
+    rt = None
+    if SCAN_START_TIME in params:
+        start = params[SCAN_START_TIME]
+        rt = to_float(start.get('value'))
+        if rt is not None and (start.get('unitAccession') in MINUTE_UNITS or start.get('unitName') in MINUTE_UNITS):
+            rt *= 60
+    low = to_float(params.get(LOWEST_MZ, params.get(WINDOW_LOWER, {})).get('value'))
+    high = to_float(params.get(HIGHEST_MZ, params.get(WINDOW_UPPER, {})).get('value'))
+    return level, polarity, rt, low, high
+
+
+# The same from the attributes of an mzXML scan
+def read_mzxml_header(header):
+    values = attributes(header)
+    level = values.get('msLevel')
+    polarity = {'+': 'positive', '-': 'negative'}.get(values.get('polarity'))
+    low = to_float(values.get('lowMz', values.get('startMz')))
+    high = to_float(values.get('highMz', values.get('endMz')))
+    return (int(level) if level and level.isdigit() else None, polarity,
+            duration_seconds(values.get('retentionTime')), low, high)
+
+
+class RawFormat:
+    """
+    Where the spectra of a raw file format are and how their headers are read.
+
+    Arguments:
+    - start of the element of a spectrum
+    - end of the header of a spectrum, the peak arrays follow it
+    - element holding the offset of the index
+    - start of the index of the spectra
+    - reader of a header
+    """
+    def __init__(self, spectrum, header_end, index_offset, index, read_header):
+        self.spectrum = spectrum
+        self.header_end = header_end
+        self.index_offset = index_offset
+        self.index = index
+        self.read_header = read_header
+
+
+FORMATS = {
+    'mzml': RawFormat(b'<spectrum ', b'<binaryDataArrayList', b'<indexListOffset>', b'<index name="spectrum"',
+                      read_mzml_header),
+    'mzxml': RawFormat(b'<scan ', b'>', b'<indexOffset>', b'<index name="scan"', read_mzxml_header),
+}
+
+
+class RawScan:
+    """
+    Summary of a .mzML or .mzXML file from the headers of its spectra, the peak arrays are not decoded.
+    With an index the scan jumps from header to header, without one it finds the spectra in a single pass.
+    The retention time and m/z range is that of the MS1 spectra, which pastaq resamples.
+
+    Arguments:
+    - raw file path
+    """
+    def __init__(self, path):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower().lstrip('.')
+        self.spectra = 0
+        self.ms_levels = collections.Counter()
+        self.polarities = collections.Counter()
+        self.min_rt = None
+        self.max_rt = None
+        self.min_mz = None
+        self.max_mz = None
+        self.indexed = False
+        self.error = None
+
+    def scan(self):
+        raw_format = FORMATS.get(self.format)
+        if not raw_format:
+            self.error = 'not an mzML or mzXML file'
+            return self
+        try:
+            with open(self.path, 'rb') as raw:
+                if os.fstat(raw.fileno()).st_size == 0:
+                    return self
+                with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self.read(data, raw_format)
+        except OSError as e:
+            self.error = str(e)
+        return self
+
+    def read(self, data, raw_format):
+        offsets = self.index(data, raw_format)
+        self.indexed = offsets is not None
+        if offsets is None:
+            offsets = self.find_spectra(data, raw_format)
+        for offset in offsets:
+            end = data.find(raw_format.header_end, offset, offset + HEADER_LIMIT)
+            self.add(*raw_format.read_header(data[offset:end if end >= 0 else offset + HEADER_LIMIT]))
+
+    # offsets of the spectra from the index at the end of the file, None without a usable index
+    @staticmethod
+    def index(data, raw_format):
+        position = data.rfind(raw_format.index_offset, max(0, len(data) - HEADER_LIMIT))
+        if position < 0:
+            return None
+        position += len(raw_format.index_offset)
+        end = data.find(b'<', position)
+        try:
+            index_start = int(data[position:end])
+        except ValueError:
+            return None
+        start = data.find(raw_format.index, index_start)
+        if index_start >= len(data) or start < 0:
+            return None
+        end = data.find(b'</index>', start)
+        offsets = [int(offset) for offset in INDEX_OFFSET.findall(data[start:end if end >= 0 else len(data)])]
+        # an index that does not point at the spectra is of no use
+        if any(data[offset:offset + len(raw_format.spectrum)] != raw_format.spectrum for offset in offsets):
+            return None
+        return offsets
+
+    # offsets of the spectra found by jumping from one to the next with find
+    @staticmethod
+    def find_spectra(data, raw_format):
+        offsets = []
+        offset = data.find(raw_format.spectrum)
+        while offset >= 0:
+            offsets.append(offset)
+            offset = data.find(raw_format.spectrum, offset + 1)
+        return offsets
+
+    def add(self, level, polarity, rt, low_mz, high_mz):
+        self.spectra += 1
+        if level is not None:
+            self.ms_levels[level] += 1
+        if polarity:
+            self.polarities[polarity] += 1
+        if level not in (1, None):
+            return
+        if rt is not None:
+            self.min_rt = rt if self.min_rt is None else min(self.min_rt, rt)
+            self.max_rt = rt if self.max_rt is None else max(self.max_rt, rt)
+        if low_mz is not None and high_mz is not None:
+            self.min_mz = low_mz if self.min_mz is None else min(self.min_mz, low_mz)
+            self.max_mz = high_mz if self.max_mz is None else max(self.max_mz, high_mz)
+
+    # what the file catalog keeps of the scan
+    def metadata(self):
+        metadata = {
+            'spectra': self.spectra,
+            'ms_levels': {str(level): count for level, count in sorted(self.ms_levels.items())},
+            'polarities': dict(self.polarities),
+            'indexed': self.indexed,
+        }
+        if None not in (self.min_rt, self.min_mz):
+            metadata['bounds'] = [self.min_mz, self.max_mz, self.min_rt, self.max_rt]
+        if self.error:
+            metadata['scan_error'] = self.error
+        return metadata
+
+
+# Scans the headers of a raw file, runs in a worker process
+def scan_raw(path):
+    return RawScan(path).scan()
+
+
+# Scans several raw files side by side, returns their scans by path
+def scan_raws(paths):
+    paths = list(dict.fromkeys(paths))
+    if len(paths) < 2:
+        return {path: scan_raw(path) for path in paths}
+    workers = min(len(paths), os.cpu_count() or 1, RAW_SCAN_WORKERS)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return dict(zip(paths, pool.map(scan_raw, paths)))
+
+
+# Range of the data of a raw file as (min m/z, max m/z, min rt, max rt), None until it was scanned
+def data_bounds(metadata):
+    bounds = (metadata or {}).get('bounds')
+    return tuple(bounds) if bounds else None
+
+
+# Smallest window of whole numbers that holds the data of all the given bounds, None if there are none
+def window(bounds):
+    bounds = [file_bounds for file_bounds in bounds if file_bounds]
+    if not bounds:
+        return None
+    return (float(math.floor(min(file_bounds[0] for file_bounds in bounds))),
+            float(math.ceil(max(file_bounds[1] for file_bounds in bounds))),
+            float(math.floor(min(file_bounds[2] for file_bounds in bounds))),
+            float(math.ceil(max(file_bounds[3] for file_bounds in bounds))))
+
+
+# Short description of the scanned spectra of a raw file
+def describe(metadata):
+    levels = metadata.get('ms_levels', {})
+    text = '{} spectra'.format(metadata.get('spectra', 0))
+    if levels:
+        text += ' ({})'.format(', '.join('MS{} {}'.format(level, count) for level, count in levels.items()))
+    if metadata.get('polarities'):
+        text += ', ' + ' and '.join(sorted(metadata['polarities']))
+    bounds = data_bounds(metadata)
+    if bounds:
+        text += ', m/z {:.1f}-{:.1f}, RT {:.1f}-{:.1f} s'.format(*bounds)
+    return text
@@ -0,0 +1,242 @@
+import csv
+import itertools
+import os
+import parameter_schema
+import pipeline
+import validation
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QComboBox, QGridLayout, QLabel, QLineEdit, QPushButton
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QVBoxLayout, QHeaderView
+
+
+# Most variants a sweep may have
+MAX_VARIANTS = 50
+# The comparison of the variants is also written to this file in the sweep directory
+COMPARISON_FILE = 'comparison.csv'
+
+# Numbers read by the stages of the pipeline can be swept, the charge states are a list
+SWEEP_FIELDS = [field for field in parameter_schema.FIELDS if field.kind in ('int', 'float') and
+                field.from_widget is None and any(field.key in stage.params for stage in pipeline.STAGES)]
+FIELD_INDEX = {field.key: field for field in SWEEP_FIELDS}
+
+
+# Values of a swept parameter: a comma separated list of values and ranges start:stop:step, the stop included
+def parse_values(text, kind):
+    convert = int if kind == 'int' else float
+    values = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if ':' not in part:
+            values.append(convert(part))
+            continue
+        bounds = [convert(bound) for bound in part.split(':')]
+        if len(bounds) != 3 or bounds[2] <= 0 or bounds[1] < bounds[0]:
+            raise ValueError('{} is not a range start:stop:step'.format(part))
+        start, stop, step = bounds
+        # a small tolerance keeps a stop that is reached by adding float steps
+        count = int((stop - start) / step + 1e-9) + 1
+        values.extend(start + i * step if kind == 'int' else round(start + i * step, 10) for i in range(count))
+    if not values:
+        raise ValueError('no values')
+    return list(dict.fromkeys(values))
+
+
+# Every combination of the values of the swept parameters, as the parameters each variant changes
+def make_variants(sweeps):
+    keys = list(sweeps)
+    return [dict(zip(keys, values)) for values in itertools.product(*sweeps.values())]
+
+
+# Number of rows of a csv file, only those with a value in the column if one is given, None without the file
+def count_rows(path, column=None):
+    try:
+        with open(path, newline='') as csv_file:
+            rows = csv.DictReader(csv_file)
+            if column is None:
+                return sum(1 for _ in rows)
+            return sum(1 for row in rows if row.get(column))
+    except OSError:
+        return None
+
+
+# Mean similarity of the files with each other, from a similarity matrix of pastaq
+# None without the matrix or with a single file
+def mean_similarity(path):
+    try:
+        with open(path, newline='') as csv_file:
+            rows = [row[1:] for row in csv.reader(csv_file)][1:]
+    except OSError:
+        return None
+    pairs = [float(value) for i, row in enumerate(rows) for j, value in enumerate(row) if i != j]
+    return round(sum(pairs) / len(pairs), 4) if pairs else None
+
+
+# What the comparison shows of each variant, from the outputs in its directory
+METRICS = [
+    ('Feature clusters', lambda path: count_rows(os.path.join(path, 'quant', 'feature_clusters_metadata.csv'))),
+    ('Identified feature clusters', lambda path: count_rows(
+        os.path.join(path, 'quant', 'feature_clusters_metadata.csv'), 'psm_sequence')),
+    ('Peak clusters', lambda path: count_rows(os.path.join(path, 'quant', 'peak_clusters_metadata.csv'))),
+    ('Identified peak clusters', lambda path: count_rows(
+        os.path.join(path, 'quant', 'peak_clusters_metadata.csv'), 'psm_sequence')),
+    ('Similarity before alignment', lambda path: mean_similarity(
+        os.path.join(path, 'quality', 'similarity_peaks.csv'))),
+    ('Similarity after alignment', lambda path: mean_similarity(
+        os.path.join(path, 'quality', 'similarity_warped_peaks.csv'))),
+]
+
+
+# Header and a row for each variant with its swept values and metrics, written to the sweep directory
+def compare(output_dir, variants):
+    keys = list(variants[0]) if variants else []
+    header = ['Variant'] + [FIELD_INDEX[key].label for key in keys] + [name for name, _ in METRICS]
+    rows = []
+    for i, changes in enumerate(variants):
+        path = pipeline.variant_dir(output_dir, i)
+        rows.append([os.path.basename(path)] + [changes[key] for key in keys] +
+                    [metric(path) for _, metric in METRICS])
+    try:
+        with open(os.path.join(output_dir, pipeline.SWEEP_DIR, COMPARISON_FILE), 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+    except OSError as e:
+        print('Comparison of the variants could not be written: {}'.format(e))
+    return header, rows
+
+
+class SweepDialog(QDialog):
+    """
+    Asks for the parameters to sweep and their values, a list or ranges for each of them,
+    and shows how many variants the combinations make before they are run.
+
+    Arguments:
+    - parameters the variants start from
+    """
+    def __init__(self, params, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('PASTAQ: Parameter sweep')
+        self.params = params
+        self.rows = []
+        self.variants = []
+
+        self.grid = QGridLayout()
+        self.grid.addWidget(QLabel('Parameter'), 0, 0)
+        self.grid.addWidget(QLabel('Values, like 10, 20, 30 or 10:30:10'), 0, 1)
+        add_button = QPushButton('Add parameter')
+        add_button.clicked.connect(lambda: self.add_row())
+        self.status = QLabel()
+        self.status.setWordWrap(True)
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttons.button(QDialogButtonBox.Ok).setText('Run sweep')
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(self.grid)
+        layout.addWidget(add_button)
+        layout.addWidget(self.status)
+        layout.addWidget(self.buttons)
+        self.add_row('warp2d_slack')
+
+    # adds a parameter with its current value as the only value
+    def add_row(self, key=None):
+        key = key or SWEEP_FIELDS[0].key
+        combo = QComboBox()
+        for field in SWEEP_FIELDS:
+            combo.addItem(field.label, field.key)
+        combo.setCurrentIndex(combo.findData(key))
+        values = QLineEdit(str(self.params.get(key, '')))
+        combo.currentIndexChanged.connect(lambda *args: values.setText(str(self.params.get(combo.currentData(), ''))))
+        combo.currentIndexChanged.connect(self.update_variants)
+        values.textChanged.connect(self.update_variants)
+        remove = QPushButton('Remove')
+        row = (combo, values, remove)
+        row_index = self.grid.rowCount()
+        remove.clicked.connect(lambda: self.remove_row(row))
+        for column, widget in enumerate(row):
+            self.grid.addWidget(widget, row_index, column)
+        self.rows.append(row)
+        self.update_variants()
+
+    def remove_row(self, row):
+        self.rows.remove(row)
+        for widget in row:
+            self.grid.removeWidget(widget)
+            widget.deleteLater()
+        self.update_variants()
+
+    # values of each swept parameter, a parameter given twice keeps its last values
+    def sweeps(self):
+        sweeps = {}
+        for combo, values, _ in self.rows:
+            field = FIELD_INDEX[combo.currentData()]
+            try:
+                sweeps[field.key] = parse_values(values.text(), field.kind)
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(field.label, e))
+        return sweeps
+
+    # Makes the variants of the values and only allows running them if they are all valid
+    def update_variants(self):
+        self.variants = []
+        try:
+            variants = make_variants(self.sweeps()) if self.rows else []
+        except ValueError as e:
+            message = str(e)
+        else:
+            message = self.check(variants)
+            if not message:
+                self.variants = variants
+                message = '{} variants, each in its own directory in {}'.format(len(variants), pipeline.SWEEP_DIR)
+        self.status.setText(message)
+        self.buttons.button(QDialogButtonBox.Ok).setEnabled(bool(self.variants))
+
+    # why the variants can not be run, None if they can
+    def check(self, variants):
+        if len(variants) < 2:
+            return 'A sweep needs at least two variants.'
+        if len(variants) > MAX_VARIANTS:
+            return '{} variants are more than the {} a sweep may have.'.format(len(variants), MAX_VARIANTS)
+        validator = validation.Validator()
+        for changes in variants:
+            errors = validator.validate(dict(self.params, **changes))
+            if errors:
+                return 'Variant {}: {}'.format(', '.join('{} {}'.format(FIELD_INDEX[key].label, value)
+                                                         for key, value in changes.items()), errors[0])
+        return None
+
+
+class SweepResultsDialog(QDialog):
+    """
+    Compares the outputs of the variants of a sweep in a table that sorts by any column.
+
+    Arguments:
+    - output directory of the project
+    - parameters each variant changed
+    """
+    def __init__(self, output_dir, variants, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('PASTAQ: Parameter sweep results')
+        header, rows = compare(output_dir, variants)
+        self.table = QTableWidget(len(rows), len(header))
+        self.table.setHorizontalHeaderLabels(header)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                item = QTableWidgetItem()
+                item.setData(Qt.DisplayRole, '-' if value is None else value)
+                item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
+                self.table.setItem(i, j, item)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok)
+        buttons.accepted.connect(self.accept)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel('Also written to {}'.format(
+            os.path.join(output_dir, pipeline.SWEEP_DIR, COMPARISON_FILE))))
+        layout.addWidget(self.table)
+        layout.addWidget(buttons)
+        self.resize(900, 400)
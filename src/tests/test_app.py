@@ -114,11 +114,17 @@ class TestApp:
         actions = self.main_window.findChildren(QAction)
         assert len(actions) == 10
 
-    # test the number of buttons
+    # test the number of buttons, the pages of the parameters and the paths tab add theirs when they are shown
     # T1.9
     def test_number_btn(self):
-        buttons = self.main_window.findChildren(QPushButton)
-        assert len(buttons) == 66
+        window = app.MainWindow()
+        buttons = window.findChildren(QPushButton)
+        assert len(buttons) == 12
+        for i in range(window.parameters_container.nav.count()):
+            window.parameters_container.nav.setCurrentRow(i)
+        window.parameters_container.setCurrentWidget(window.parameters_container.input_paths_tab)
+        buttons = window.findChildren(QPushButton)
+        assert len(buttons) == 77
 
     # test is the save project btn is the main window
     # T1.10
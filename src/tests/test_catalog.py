@@ -0,0 +1,149 @@
+import os
+import sys
+import mock
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import catalog
+import files
+
+
+class TestFileCatalog:
+
+    def write(self, tmp_path, name, content):
+        path = tmp_path / name
+        path.write_text(content)
+        return str(path)
+
+    # files are unknown until the catalog looked at them, after that the entry answers
+    # T6.1
+    def test_exists(self, tmp_path):
+        mzml = self.write(tmp_path, 'a.mzML', 'spectra')
+        missing = str(tmp_path / 'missing.mzML')
+        file_catalog = catalog.FileCatalog()
+        assert file_catalog.exists(mzml) is None
+        assert file_catalog.update_stats([mzml, missing])
+        assert file_catalog.exists(mzml) is True
+        assert file_catalog.exists(missing) is False
+        os.unlink(mzml)
+        assert file_catalog.exists(mzml) is True
+        assert file_catalog.update_stats([mzml])
+        assert file_catalog.exists(mzml) is False
+
+    # hashes and metadata are computed once and survive reopening the catalog
+    # T6.2
+    def test_hashes_saved(self, tmp_path):
+        mgf = self.write(tmp_path, 'a.mgf', 'BEGIN IONS\nCHARGE=2+\nEND IONS\n')
+        path = str(tmp_path / catalog.CATALOG_FILE)
+        file_catalog = catalog.FileCatalog(path)
+        file_catalog.update_stats([mgf])
+        assert file_catalog.update_hashes([mgf])
+        assert not file_catalog.update_hashes([mgf])
+        file_catalog.save()
+
+        reopened = catalog.FileCatalog(path)
+        entry = reopened.get(mgf)
+        assert entry.hash == files.file_hash(mgf)
+        assert entry.metadata == {'format': 'mgf', 'spectra': 1}
+        assert not reopened.update_stats([mgf])
+        with mock.patch('catalog.files.file_hash') as mock_hash:
+            assert not reopened.update_hashes([mgf])
+            mock_hash.assert_not_called()
+
+    # a changed file loses its hash until it is hashed again
+    # T6.3
+    def test_changed_file(self, tmp_path):
+        mzml = self.write(tmp_path, 'a.mzML', 'spectra')
+        file_catalog = catalog.FileCatalog()
+        file_catalog.update_stats([mzml])
+        file_catalog.update_hashes([mzml])
+        self.write(tmp_path, 'a.mzML', 'more spectra')
+        assert file_catalog.update_stats([mzml])
+        assert file_catalog.hash(mzml) is None
+        file_catalog.update_hashes([mzml])
+        assert file_catalog.hash(mzml) == files.file_hash(mzml)
+
+    # only the entries that changed since the last save are written
+    # T6.4
+    def test_save_changed(self, tmp_path):
+        mzml = self.write(tmp_path, 'a.mzML', 'spectra')
+        file_catalog = catalog.FileCatalog(str(tmp_path / catalog.CATALOG_FILE))
+        file_catalog.exists(mzml)
+        file_catalog.save()
+        with mock.patch.object(file_catalog, 'connect') as mock_connect:
+            file_catalog.save()
+            mock_connect.assert_not_called()
+
+    # the files of a directory are looked at with a single listing of it
+    # T6.5
+    def test_update_stats_listing(self, tmp_path):
+        paths = [self.write(tmp_path, '{}.mzML'.format(i), 'spectra') for i in range(5)]
+        paths.append(str(tmp_path / 'missing.mzML'))
+        file_catalog = catalog.FileCatalog()
+        with mock.patch('catalog.os.scandir', wraps=os.scandir) as mock_scandir, \
+                mock.patch('catalog.os.stat', wraps=os.stat) as mock_stat:
+            assert file_catalog.update_stats(paths)
+            mock_scandir.assert_called_once_with(str(tmp_path))
+            mock_stat.assert_called_once_with(paths[-1])
+        assert [file_catalog.exists(path) for path in paths] == [True] * 5 + [False]
+
+    # the headers of new raw files are scanned before they are hashed, the scan is kept with the hash
+    # T6.7
+    def test_update_metadata(self, tmp_path):
+        mzml = self.write(tmp_path, 'a.mzML', '<mzML><spectrum index="0">'
+                          '<cvParam accession="MS:1000511" value="1"/><cvParam accession="MS:1000528" value="400.5"/>'
+                          '<cvParam accession="MS:1000527" value="1500"/><cvParam accession="MS:1000016" value="90.5" '
+                          'unitAccession="UO:0000010"/><binaryDataArrayList/></spectrum></mzML>')
+        mgf = self.write(tmp_path, 'a.mgf', 'BEGIN IONS\nEND IONS\n')
+        path = str(tmp_path / catalog.CATALOG_FILE)
+        file_catalog = catalog.FileCatalog(path)
+        file_catalog.update_stats([mzml, mgf])
+        assert file_catalog.bounds(mzml) is None
+        with mock.patch('catalog.files.file_hash') as mock_hash:
+            assert file_catalog.update_metadata([mzml, mgf])
+            mock_hash.assert_not_called()
+        assert file_catalog.get(mgf).metadata == {}
+        assert file_catalog.bounds(mzml) == (400.5, 1500.0, 90.5, 90.5)
+        assert not file_catalog.update_metadata([mzml, mgf])
+        with mock.patch('catalog.rawscan.scan_raw') as mock_scan:
+            file_catalog.update_hashes([mzml])
+            mock_scan.assert_not_called()
+        file_catalog.save()
+        assert catalog.FileCatalog(path).get(mzml).metadata['spectra'] == 1
+
+    # a raw file hashed before its scan is still scanned once, in the pool, and keeps its hash
+    # T6.8
+    def test_scan_after_hash(self, tmp_path):
+        mzml = self.write(tmp_path, 'a.mzML', '<mzML></mzML>')
+        file_catalog = catalog.FileCatalog()
+        file_catalog.update_stats([mzml])
+        with mock.patch('catalog.rawscan.scan_raw') as mock_scan:
+            assert file_catalog.update_hashes([mzml])
+            mock_scan.assert_not_called()
+        with mock.patch('catalog.rawscan.scan_raws', wraps=catalog.rawscan.scan_raws) as mock_scans:
+            assert file_catalog.update_metadata([mzml])
+            assert not file_catalog.update_metadata([mzml])
+            mock_scans.assert_called_once_with([mzml])
+        assert file_catalog.hash(mzml) == files.file_hash(mzml)
+        assert file_catalog.get(mzml).metadata['spectra'] == 0
+
+
+class TestCatalogWatcher:
+
+    # changes in a watched directory are reported as its input files, once per delay
+    # T6.6
+    def test_report(self, tmp_path):
+        a = str(tmp_path / 'a.mzML')
+        b = str(tmp_path / 'b.mzML')
+        watcher = catalog.CatalogWatcher()
+        watcher.watch([a, b, str(tmp_path / 'gone' / 'c.mzML')])
+        assert watcher.watcher.directories() == [str(tmp_path)]
+        reported = []
+        watcher.changed.connect(reported.append)
+        watcher.directory_changed(str(tmp_path))
+        watcher.directory_changed(str(tmp_path))
+        assert watcher.timer.isActive()
+        watcher.report()
+        assert reported == [[a, b]]
+        watcher.watch([])
+        assert watcher.watcher.directories() == []
@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+
+import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import estimator
+import parameter_schema
+
+
+class TestEstimator:
+    params = dict(parameter_schema.defaults(), num_samples_mz=5, num_samples_rt=5, avg_fwhm_rt=10)
+
+    # the grid has as many points as pastaq.resample makes for data from m/z 400 to 1600 and 60 to 300 seconds
+    # T11.1
+    def test_grid_size(self):
+        bounds = (400, 1600, 60, 300)
+        sizes = {'orbitrap': 247488, 'tof': 485204, 'quadrupole': 2100001, 'ft-icr': 131251}
+        for instrument, mz in sizes.items():
+            assert estimator.grid_size(dict(self.params, instrument_type=instrument), bounds) == (mz, 121)
+        # the window of the parameters cuts the data, a window beside the data leaves no grid
+        assert estimator.grid_size(dict(self.params, min_rt=100, max_rt=200), bounds)[1] == 51
+        assert estimator.grid_size(dict(self.params, min_mz=1700, max_mz=1800), bounds) == (0, 0)
+
+    # the largest tasks run at once on the workers, which share the work
+    # T11.2
+    def test_estimate_workers(self):
+        estimate = estimator.Estimate([(1, 1)] * 3, [4, 1, 2], 10, [30, 10, 20], workers=2)
+        assert estimate.task_memory == 4
+        assert estimate.memory == 6
+        assert estimate.time == 30
+        estimate.workers = 1
+        assert estimate.memory == 4
+        assert estimate.time == 60
+        restored = estimator.Estimate.from_dict(json.loads(json.dumps(estimate.to_dict())))
+        assert restored.grids == estimate.grids
+        assert restored.prediction() == estimate.prediction() == {'memory': 4, 'disk': 10, 'time': 60}
+
+    # larger raw files and more samples per peak need more of everything
+    # T11.3
+    def test_estimate_grows(self):
+        small = estimator.estimate(self.params, [10 ** 8])
+        large = estimator.estimate(self.params, [10 ** 9])
+        fine = estimator.estimate(dict(self.params, num_samples_mz=10), [10 ** 8])
+        for estimate in (large, fine):
+            assert estimate.memory > small.memory
+            assert estimate.disk > small.disk
+            assert estimate.time > small.time
+        assert fine.grids[0][0] > 2 * small.grids[0][0] - 2
+
+    # the calibration is the median ratio of the measured to the estimated values of the recorded runs
+    # T11.4
+    def test_calibration(self, tmp_path):
+        assert estimator.Calibration.load(str(tmp_path)).factors == {'memory': 1.0, 'disk': 1.0, 'time': 1.0}
+        predicted = {'memory': 100, 'disk': 100, 'time': 100}
+        estimator.record_run(str(tmp_path), predicted, {'memory': 200, 'disk': 50, 'time': 100})
+        estimator.record_run(str(tmp_path), predicted, {'memory': None, 'disk': 70, 'time': 300})
+        estimator.record_run(str(tmp_path), predicted, {'memory': 400, 'disk': 90, 'time': 1000})
+        calibration = estimator.Calibration.load(str(tmp_path))
+        assert calibration.runs == 3
+        assert calibration.factors == {'memory': 3.0, 'disk': 0.7, 'time': 3.0}
+        scaled = calibration.apply(estimator.Estimate([(1, 1)], [10], 10, [10]))
+        assert (scaled.memory, scaled.disk, scaled.time) == (30, 7, 30)
+        (tmp_path / estimator.RUNS_FILE).write_text('not json')
+        assert estimator.Calibration.load(str(tmp_path)).runs == 0
+
+    # automatic workers are one per core and file, as far as their tasks fit in memory
+    # T11.5
+    @mock.patch('estimator.os.cpu_count')
+    def test_stage_workers(self, mock_cpu):
+        mock_cpu.return_value = 8
+        assert estimator.stage_workers(3, 10, 100, 100) == 3
+        assert estimator.stage_workers(0, 10) == 8
+        assert estimator.stage_workers(0, 2) == 2
+        assert estimator.stage_workers(0, 10, 100, 450) == 4
+        assert estimator.stage_workers(0, 10, 100, 50) == 1
+
+    # the most samples whose grid fits in the memory, within the limits of the automatic number of samples
+    # T11.6
+    def test_tune_samples(self):
+        params = dict(self.params, min_mz=400, max_mz=1600, min_rt=60, max_rt=300)
+        assert estimator.tune_samples(params, 10 ** 12) == estimator.MAX_SAMPLES
+        assert estimator.tune_samples(params, 1) == estimator.MIN_SAMPLES
+        memory = estimator.grid_memory(dict(params, num_samples_mz=3, num_samples_rt=3))
+        assert estimator.tune_samples(params, memory) == 3
+        assert estimator.tune_samples(params, memory - 1) == 2
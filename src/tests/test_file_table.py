@@ -0,0 +1,72 @@
+import os
+import sys
+import mock
+from PyQt5.QtCore import Qt
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import catalog
+import file_table
+
+
+def make_model(paths):
+    file_catalog = catalog.FileCatalog()
+    file_catalog.exists = lambda path: 'missing' not in path
+    return file_table.InputFilesModel([{'raw_path': path, 'reference': False} for path in paths], file_catalog)
+
+
+class TestInputFilesModel:
+
+    # cells show the input files, missing files are marked and bold
+    # T8.1
+    def test_data(self):
+        model = make_model(['a.mzML', 'missing.mzML'])
+        model.input_files[0].update({'ident_path': 'a.mzID', 'group': 'g', 'reference': True})
+        assert model.rowCount() == 2
+        assert [model.index(0, column).data() for column in range(3)] == ['a.mzML', 'a.mzID', 'g']
+        assert model.index(0, 3).data(Qt.CheckStateRole) == Qt.Checked
+        assert model.index(1, 0).data() == '(missing) missing.mzML'
+        assert model.index(1, 0).data(Qt.FontRole).bold()
+        assert model.index(1, 1).data() is None
+
+    # toggling a reference changes the input file and only signals its cell
+    # T8.2
+    def test_set_reference(self):
+        model = make_model(['a.mzML', 'b.mzML'])
+        changed = mock.Mock()
+        model.dataChanged.connect(changed)
+        assert model.setData(model.index(1, 3), Qt.Checked, Qt.CheckStateRole)
+        assert model.input_files[1]['reference']
+        assert not model.input_files[0]['reference']
+        top_left, bottom_right, _ = changed.call_args.args
+        assert (top_left.row(), top_left.column(), bottom_right.row(), bottom_right.column()) == (1, 3, 1, 3)
+        assert not model.setData(model.index(1, 0), 'x', Qt.EditRole)
+
+    # rows are added and removed in place, consecutive rows at once
+    # T8.3
+    def test_insert_remove(self):
+        model = make_model(['{}.mzML'.format(i) for i in range(6)])
+        inserted = mock.Mock()
+        removed = mock.Mock()
+        model.rowsInserted.connect(inserted)
+        model.rowsRemoved.connect(removed)
+        model.append_files([{'raw_path': '6.mzML', 'reference': False}])
+        assert inserted.call_args.args[1:] == (6, 6)
+        model.remove_rows([5, 1, 2, 6])
+        assert [call.args[1:] for call in removed.call_args_list] == [(5, 6), (1, 2)]
+        assert [file['raw_path'] for file in model.input_files] == ['0.mzML', '3.mzML', '4.mzML']
+
+    # only the rows whose files appeared or went missing are signalled
+    # T8.4
+    def test_update_missing(self):
+        model = make_model(['a.mzML', 'missing.mzML', 'b.mzML', 'c.mzML'])
+        model.input_files[2]['ident_path'] = 'b.mzID'
+        changed = mock.Mock()
+        model.dataChanged.connect(changed)
+        model.update_missing()
+        gone = {'b.mzID', 'c.mzML'}
+        model.file_catalog.exists = lambda path: 'missing' not in path and path not in gone
+        model.update_missing()
+        model.update_missing()
+        assert [(call.args[0].row(), call.args[1].row(), call.args[1].column()) for call in changed.call_args_list] == [
+            (2, 2, 1), (3, 3, 1)]
+        assert model.index(2, 1).data() == '(missing) b.mzID'
@@ -1,8 +1,10 @@
 import os
 import sys
 import mock
+import threading
 import pytest
 import subprocess
+from xml.etree import ElementTree
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import files
@@ -14,7 +16,17 @@ id_path = 'id_path'
 params_path = 'params_path'
 mgf_path = 'mgf_path.mgf'
 pep_path = 'pep_path.pepxml'
-run = 'files.subprocess.run'
+mzid_path = 'mgf_path.mzID'
+popen = 'files.subprocess.Popen'
+
+
+# temporary files of the tests go to a folder of their own, which has to be empty again after the test
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path_factory, monkeypatch):
+    temp = tmp_path_factory.mktemp('temp')
+    monkeypatch.setattr(files.tempfile, 'tempdir', str(temp))
+    yield temp
+    assert not os.listdir(str(temp))
 
 
 @mock.patch('files.Path.is_file')
@@ -141,47 +153,47 @@ class TestMS:
     # tests for execute_msfragger
     # tests if subprocess is called
     # T3.17
-    @mock.patch(run)
-    def test_execute_msfragger_call(self, mock_run, mock_popup):
+    @mock.patch(popen)
+    def test_execute_msfragger_call(self, mock_popen, mock_popup):
         file_processor.execute_msfragger(mgf_path)
-        mock_run.assert_called()
+        mock_popen.assert_called()
 
     # tests when subprocess throws exception, should trigger popup window
     # T3.18
     def test_execute_msfragger_popup(self, mock_popup):
-        with mock.patch(run, side_effect=subprocess.CalledProcessError(1, 'java')):
+        with mock.patch(popen, side_effect=subprocess.CalledProcessError(1, 'java')):
             file_processor.execute_msfragger(mgf_path)
             mock_popup.assert_called()
 
     # tests when subprocess throws exception, should return False
     # T3.19
     def test_execute_msfragger_return(self, mock_popup):
-        with mock.patch(run, side_effect=subprocess.CalledProcessError(1, 'java')):
+        with mock.patch(popen, side_effect=subprocess.CalledProcessError(1, 'java')):
             assert not file_processor.execute_msfragger(mgf_path)
 
     # test return code checking
     # test return code called
     # T3.20
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_msfragger_return_code_call(self, mock_run, mock_returncode, mock_popup):
+    def test_execute_msfragger_return_code_call(self, mock_popen, mock_returncode, mock_popup):
         file_processor.execute_msfragger(mgf_path)
         mock_returncode.assert_called()
 
     # test returncode throws error, should trigger popup window
     # T3.21
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_msfragger_return_code_popup(self, mock_run, mock_return, mock_popup):
+    def test_execute_msfragger_return_code_popup(self, mock_popen, mock_return, mock_popup):
         mock_return.side_effect = subprocess.CalledProcessError(1, 'java')
         file_processor.execute_msfragger(mgf_path)
         mock_popup.assert_called()
 
     # test returncode throws error, should return False
     # T3.22
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_msfragger_return_code_return(self, mock_run, mock_return, mock_popup):
+    def test_execute_msfragger_return_code_return(self, mock_popen, mock_return, mock_popup):
         mock_return.side_effect = subprocess.CalledProcessError(1, 'java')
         assert not file_processor.execute_msfragger(mgf_path)
 
@@ -192,47 +204,47 @@ class TestID:
     # tests for execute_idconvert
     # tests if subprocess is called
     # T3.23
-    @mock.patch(run)
-    def test_execute_idconvert_call(self, mock_run, mock_popup):
+    @mock.patch(popen)
+    def test_execute_idconvert_call(self, mock_popen, mock_popup):
         file_processor.execute_idconvert(pep_path, mgf_path)
-        mock_run.assert_called()
+        mock_popen.assert_called()
 
     # tests when subprocess throws exception, should trigger popup window
     # T3.24
     def test_execute_idconvert_popup(self, mock_popup):
-        with mock.patch(run, side_effect=subprocess.CalledProcessError(1, 'java')):
+        with mock.patch(popen, side_effect=subprocess.CalledProcessError(1, 'java')):
             file_processor.execute_idconvert(pep_path, mgf_path)
             mock_popup.assert_called()
 
     # tests when subprocess throws exception, should return False
     # T3.25
     def test_execute_idconvert_return(self, mock_popup):
-        with mock.patch(run, side_effect=subprocess.CalledProcessError(1, 'java')):
+        with mock.patch(popen, side_effect=subprocess.CalledProcessError(1, 'java')):
             assert not file_processor.execute_idconvert(pep_path, mgf_path)
 
     # test return code checking
     # test return code called
     # T3.26
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_idconvert_return_code_call(self, mock_run, mock_returncode, mock_popup):
+    def test_execute_idconvert_return_code_call(self, mock_popen, mock_returncode, mock_popup):
         file_processor.execute_idconvert(pep_path, mgf_path)
         mock_returncode.assert_called()
 
     # test returncode throws error, should trigger popup window
     # T3.27
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_idconvert_return_code_popup(self, mock_run, mock_return, mock_popup):
+    def test_execute_idconvert_return_code_popup(self, mock_popen, mock_return, mock_popup):
         mock_return.side_effect = subprocess.CalledProcessError(1, 'java')
         file_processor.execute_idconvert(pep_path, mgf_path)
         mock_popup.assert_called()
 
     # test returncode throws error, should return False
     # T3.28
-    @mock.patch(run)
+    @mock.patch(popen)
     @mock.patch('files.subprocess.CompletedProcess.check_returncode')
-    def test_execute_idconvert_return_code_return(self, mock_run, mock_return, mock_popup):
+    def test_execute_idconvert_return_code_return(self, mock_popen, mock_return, mock_popup):
         mock_return.side_effect = subprocess.CalledProcessError(1, 'java')
         assert not file_processor.execute_idconvert(pep_path, mgf_path)
 
@@ -280,6 +292,625 @@ class TestCheck:
         mock_popup.assert_called()
 
 
+class TestWorkers:
+
+    # a configured number of workers is used but never more than there are files
+    # T3.47
+    def test_get_workers_configured(self):
+        processor = files.FileProcessor()
+        processor.workers = 4
+        assert processor.get_workers(10) == 4
+        assert processor.get_workers(2) == 2
+
+    # automatic number of workers is bounded by the memory each MSFragger instance needs
+    # T3.48
+    @mock.patch('files.os.cpu_count')
+    @mock.patch('files.available_memory')
+    def test_get_workers_auto(self, mock_memory, mock_cpu):
+        processor = files.FileProcessor()
+        processor.workers = 0
+        mock_cpu.return_value = 16
+        mock_memory.return_value = 4 * files.MSFRAGGER_HEAP
+        assert processor.get_workers(10) == 3
+        mock_memory.return_value = files.MSFRAGGER_HEAP // 2
+        assert processor.get_workers(10) == 1
+
+    # in the background errors go to the log instead of a popup
+    # T3.49
+    @mock.patch('files.popup_window')
+    def test_error_background(self, mock_popup):
+        processor = files.FileProcessor()
+        processor.interactive = False
+        processor.error('failure')
+        mock_popup.assert_not_called()
+
+
+class TestBatch:
+
+    # all files without an .mzID are searched in one MSFragger run and converted one by one
+    # T3.50
+    @mock.patch('files.FileProcessor.convert')
+    @mock.patch('files.FileProcessor.execute_msfragger')
+    @mock.patch('files.FileProcessor.check')
+    @mock.patch('files.FileProcessor.lookup')
+    def test_process_batch(self, mock_lookup, mock_check, mock_msfragger, mock_convert):
+        processor = files.FileProcessor()
+        mock_lookup.side_effect = lambda mgf: 'a.mzID' if mgf == 'a.mgf' else False
+        mock_check.return_value = True
+        mock_msfragger.return_value = True
+        mock_convert.side_effect = lambda mgf: mgf.replace('.mgf', '.mzID') if mgf == 'b.mgf' else False
+        mzids = processor.process_batch(['a.mgf', 'b.mgf', 'c.mgf', 'b.mgf'])
+        mock_msfragger.assert_called_once_with('b.mgf', 'c.mgf')
+        assert mzids == {'a.mgf': 'a.mzID', 'b.mgf': 'b.mzID', 'c.mgf': False}
+
+    # if the MSFragger run fails, none of its files are identified
+    # T3.51
+    @mock.patch('files.FileProcessor.convert')
+    @mock.patch('files.FileProcessor.execute_msfragger')
+    @mock.patch('files.FileProcessor.check')
+    @mock.patch('files.os.path.exists')
+    def test_process_batch_fail(self, mock_exists, mock_check, mock_msfragger, mock_convert):
+        processor = files.FileProcessor()
+        mock_exists.return_value = False
+        mock_check.return_value = True
+        mock_msfragger.return_value = False
+        assert processor.process_batch(['a.mgf', 'b.mgf']) == {'a.mgf': False, 'b.mgf': False}
+        mock_convert.assert_not_called()
+
+    # every file is passed to the same java command
+    # T3.52
+    @mock.patch(popen)
+    def test_execute_msfragger_batch(self, mock_popen):
+        processor = files.FileProcessor()
+        processor.ms_jar = [True, '/ms/MSFragger.jar']
+        processor.params = [True, 'fragger.params']
+        mock_popen.return_value.stdout = []
+        mock_popen.return_value.returncode = 0
+        assert processor.execute_msfragger('a.mgf', 'b.mgf')
+        assert mock_popen.call_args.args[0] == ['java', '-Xmx4096m', '-jar', 'MSFragger.jar', 'fragger.params',
+                                              'a.mgf', 'b.mgf']
+
+
+class TestIdentificationCache:
+
+    def make_processor(self, tmp_path):
+        for name in ['a.mgf', 'MSFragger.jar', 'proteins.fasta']:
+            (tmp_path / name).write_text(name)
+        (tmp_path / 'fragger.params').write_text('database_name = {}\n'.format(tmp_path / 'proteins.fasta'))
+        processor = files.FileProcessor()
+        processor.params = [True, str(tmp_path / 'fragger.params')]
+        processor.ms_jar = [True, str(tmp_path / 'MSFragger.jar')]
+        processor.cache_dir = str(tmp_path / 'cache')
+        return processor
+
+    # a stored identification is found again and copied next to the .mgf
+    # T3.57
+    def test_lookup(self, tmp_path):
+        processor = self.make_processor(tmp_path)
+        mgf = str(tmp_path / 'a.mgf')
+        assert not processor.lookup(mgf)
+        (tmp_path / 'new.mzID').write_text('identifications')
+        processor.store(mgf, str(tmp_path / 'new.mzID'))
+        assert processor.lookup(mgf) == str(tmp_path / 'a.mzID')
+        assert (tmp_path / 'a.mzID').read_text() == 'identifications'
+
+    # a change of the .mgf, the parameters or MSFragger misses the cache
+    # T3.58
+    def test_cache_key(self, tmp_path):
+        processor = self.make_processor(tmp_path)
+        mgf = str(tmp_path / 'a.mgf')
+        key = processor.cache_key(mgf)
+        for name in ['a.mgf', 'fragger.params', 'MSFragger.jar']:
+            with open(str(tmp_path / name), 'a') as changed:
+                changed.write('\n# changed')
+            assert processor.cache_key(mgf) != key
+            key = processor.cache_key(mgf)
+
+    # a new database at the same path or another converter misses the cache
+    # T3.81
+    def test_cache_key_database(self, tmp_path):
+        processor = self.make_processor(tmp_path)
+        mgf = str(tmp_path / 'a.mgf')
+        key = processor.cache_key(mgf)
+        (tmp_path / 'new.mzID').write_text('identifications')
+        processor.store(mgf, str(tmp_path / 'new.mzID'))
+        (tmp_path / 'proteins.fasta').write_text('>other protein')
+        assert processor.cache_key(mgf) != key
+        assert not processor.lookup(mgf)
+        key = processor.cache_key(mgf)
+        processor.set_converter(files.CONVERTERS[1])
+        assert processor.cache_key(mgf) != key
+
+    # the cache is kept in the cache directory of the user unless the processor is given another
+    # T3.82
+    def test_cache_dir(self):
+        processor = files.FileProcessor()
+        assert processor.get_cache_dir() == files.ident_cache_dir()
+        assert files.ident_cache_dir().endswith(files.IDENT_CACHE_DIR)
+        assert not files.ident_cache_dir().startswith(os.path.dirname(os.path.dirname(files.__file__)) + os.sep)
+
+    # files with the same content share their identification, wherever they are
+    # T3.59
+    def test_cache_key_content(self, tmp_path):
+        processor = self.make_processor(tmp_path)
+        (tmp_path / 'copy').mkdir()
+        (tmp_path / 'copy' / 'b.mgf').write_text('a.mgf')
+        assert processor.cache_key(str(tmp_path / 'a.mgf')) == processor.cache_key(str(tmp_path / 'copy' / 'b.mgf'))
+        assert processor.cache_key(str(tmp_path / 'missing.mgf')) is None
+
+
+class TestStreaming:
+
+    # output is passed on line by line while only its last lines are kept
+    # T3.60
+    @mock.patch('builtins.print')
+    def test_run_process(self, mock_print):
+        command = [sys.executable, '-c', 'for i in range(100): print(i)\nraise SystemExit(3)']
+        completed = file_processor.run_process(command, 'test')
+        assert completed.returncode == 3
+        assert completed.stdout.splitlines() == [str(i) for i in range(100 - files.OUTPUT_TAIL_LINES, 100)]
+        mock_print.assert_any_call('[test] 0')
+        assert mock_print.call_count == 100
+
+    # progress is attributed to the file MSFragger reported last
+    # T3.61
+    def test_msfragger_progress(self):
+        report = mock.Mock()
+        progress = files.MSFraggerProgress(['/data/a.mgf', '/data/b.mgf'], report)
+        assert not progress.parse('Operating on slice 1 of 1:')
+        assert not progress.parse('\t001. a.mgf 0.2 s | deisotoping 0.1 s')
+        assert progress.parse('\t\t[progress: 10/40 (25%) - 100 spectra/s]')
+        assert progress.parse('\t\t[progress: 11/40 (25%) - 100 spectra/s]')
+        progress.parse('\t002. b.mgf 0.2 s')
+        progress.parse('[progress: 40/40 (100%) - 100 spectra/s]')
+        assert report.call_args_list == [mock.call('/data/a.mgf', 25), mock.call('/data/b.mgf', 100)]
+
+    # progress lines are reported instead of logged
+    # T3.62
+    @mock.patch('builtins.print')
+    @mock.patch('files.subprocess.Popen')
+    def test_execute_msfragger_progress(self, mock_popen, mock_print):
+        processor = files.FileProcessor()
+        processor.progress = mock.Mock()
+        mock_popen.return_value.stdout = ['Searching\n', '[progress: 1/2 (50%)]\n']
+        mock_popen.return_value.returncode = 0
+        assert processor.execute_msfragger('a.mgf')
+        processor.progress.assert_called_once_with('a.mgf', 50)
+        mock_print.assert_called_with('[MSFragger a.mgf] Searching')
+
+    # a cancel kills the running processes with their children and keeps new ones from starting
+    # T3.83
+    @mock.patch('builtins.print')
+    def test_cancel_processes(self, mock_print):
+        processor = files.FileProcessor()
+        script = 'import subprocess, sys, time\nsubprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])' \
+                 '\nprint("started", flush=True)\ntime.sleep(60)'
+        completed = []
+        thread = threading.Thread(target=lambda: completed.append(
+            processor.run_process([sys.executable, '-c', script], 'test')))
+        thread.start()
+        for _ in range(100):
+            if mock_print.call_count:
+                break
+            thread.join(0.1)
+        assert len(processor.processes) == 1
+        processor.cancel()
+        thread.join(10)
+        assert not thread.is_alive()
+        assert completed[0].returncode != 0
+        assert not processor.processes
+        with mock.patch(popen) as mock_popen:
+            assert processor.run_process(['idconvert'], 'idconvert').returncode != 0
+            mock_popen.assert_not_called()
+
+
+class TestPepXMLConverter:
+    pepxml = '''<?xml version="1.0" encoding="UTF-8"?>
+<msms_pipeline_analysis xmlns="http://regis-web.systemsbiology.net/pepXML">
+<msms_run_summary base_name="a" raw_data_type="mgf" raw_data=".mgf">
+<search_summary base_name="a" search_engine="X! Tandem" search_id="1">
+<search_database local_path="/db/proteins.fasta" type="AA"/>
+<parameter name="decoy_prefix" value="DECOY_"/>
+</search_summary>
+<spectrum_query start_scan="42" assumed_charge="2" spectrum="a.00042.00042.2" end_scan="42" index="1"
+ precursor_neutral_mass="1000.0" retention_time_sec="123.4">
+<search_result>
+<search_hit peptide="PEPMIDEK" calc_neutral_pep_mass="1000.01" hit_rank="1" protein="sp|P1|A" protein_descr="A">
+<alternative_protein protein="DECOY_sp|P2|B" protein_descr="B"/>
+<modification_info mod_nterm_mass="43.0184">
+<mod_aminoacid_mass mass="147.0354" position="4"/>
+</modification_info>
+<search_score name="hyperscore" value="25.3"/>
+</search_hit>
+</search_result>
+</spectrum_query>
+<spectrum_query start_scan="43" assumed_charge="3" spectrum="a.00043.00043.3" end_scan="43" index="2"
+ precursor_neutral_mass="1500.0" retention_time_sec="130.0">
+<search_result>
+<search_hit peptide="PEPMIDEK" calc_neutral_pep_mass="1000.01" hit_rank="1" protein="sp|P1|A" protein_descr="A">
+</search_hit>
+</search_result>
+</spectrum_query>
+</msms_run_summary>
+</msms_pipeline_analysis>
+'''
+
+    def convert(self, tmp_path):
+        (tmp_path / 'a.pepxml').write_text(self.pepxml)
+        converter = files.PepXMLConverter(str(tmp_path / 'a.pepxml'), str(tmp_path / 'a.mzID'))
+        return converter, converter.convert()
+
+    # every spectrum with a match ends up in the .mzID
+    # T3.63
+    def test_convert(self, tmp_path):
+        _, matches = self.convert(tmp_path)
+        assert matches == 2
+        root = ElementTree.parse(str(tmp_path / 'a.mzID')).getroot()
+        ns = {'m': 'http://psidev.info/psi/pi/mzIdentML/1.1'}
+        items = root.findall('.//m:SpectrumIdentificationItem', ns)
+        assert [item.get('chargeState') for item in items] == ['2', '3']
+        assert float(items[0].get('experimentalMassToCharge')) == pytest.approx((1000.0 + 2 * files.PROTON_MASS) / 2)
+        assert len(items[0].findall('m:PeptideEvidenceRef', ns)) == 2
+        assert len(root.findall('.//m:Peptide', ns)) == 2
+
+    # modification masses are turned into mass deltas and decoys follow the prefix of the search
+    # T3.64
+    def test_convert_sequences(self, tmp_path):
+        converter, _ = self.convert(tmp_path)
+        modified = [modifications for sequence, modifications in converter.peptides.values() if modifications][0]
+        assert [(position, residue) for position, residue, _ in modified] == [(0, ''), (4, 'M')]
+        assert [delta for _, _, delta in modified] == pytest.approx([42.0106, 15.9949], abs=1e-3)
+        root = ElementTree.parse(str(tmp_path / 'a.mzID')).getroot()
+        decoys = [elem.get('isDecoy') for elem in root.iter('{http://psidev.info/psi/pi/mzIdentML/1.1}PeptideEvidence')]
+        assert sorted(decoys) == ['false', 'false', 'true']
+
+    # the converted file can be read by pastaq
+    # T3.65
+    def test_convert_pastaq(self, tmp_path):
+        pastaq = pytest.importorskip('pastaq')
+        self.convert(tmp_path)
+        ident_data = pastaq.read_mzidentml(str(tmp_path / 'a.mzID'), ignore_decoy=False)
+        assert len(ident_data.spectrum_matches) == 2
+        assert ident_data.spectrum_matches[0].retention_time == pytest.approx(123.4)
+
+    # the built-in converter does not need idconvert
+    # T3.66
+    @mock.patch('files.popup_window')
+    def test_check_builtin(self, mock_popup):
+        processor = files.FileProcessor()
+        processor.ms_jar = [True, 'MSFragger.jar']
+        processor.params = [True, 'fragger.params']
+        assert not processor.check()
+        processor.converter = 'built-in'
+        assert processor.check()
+
+
+class TestMGFIndex:
+    spectrum = 'BEGIN IONS\nTITLE=a.{0}.{0}.{1}\nRTINSECONDS={2}\nPEPMASS=500.2\nCHARGE={1}\n100.1 20\n200.2 30\nEND IONS\n'
+
+    def write(self, tmp_path, text):
+        mgf = tmp_path / 'a.mgf'
+        mgf.write_text(text)
+        return files.scan_mgf(str(mgf))
+
+    # offsets, charges and retention times of all spectra are collected
+    # T3.67
+    def test_scan(self, tmp_path):
+        text = ''.join(self.spectrum.format(i, charge, rt) for i, (charge, rt) in enumerate([('2+', 10), ('3+', 5.5),
+                                                                                            ('2+', 30)]))
+        index = self.write(tmp_path, text)
+        assert index.spectra == 3
+        assert [text[offset:offset + 10] for offset in index.offsets] == ['BEGIN IONS'] * 3
+        assert index.charges == {2: 2, 3: 1}
+        assert (index.min_rt, index.max_rt) == (5.5, 30)
+        assert index.problem() is None
+        assert index.describe() == '3 spectra, charge 2+: 67% 3+: 33%, RT 5.5-30.0 s'
+
+    # empty, missing and truncated files are rejected
+    # T3.68
+    def test_problem(self, tmp_path):
+        assert self.write(tmp_path, '').problem() == 'contains no spectra'
+        assert 'can not be read' in files.scan_mgf(str(tmp_path / 'missing.mgf')).problem()
+        truncated = self.spectrum.format(1, '2+', 10) + self.spectrum.format(2, '2+', 10)[:40]
+        assert self.write(tmp_path, truncated).problem() == 'is truncated (1 spectra without END IONS)'
+
+    # files of the other polarity than the project are rejected
+    # T3.69
+    def test_problem_polarity(self, tmp_path):
+        index = self.write(tmp_path, self.spectrum.format(1, '2-', 10))
+        assert index.problem('positive') == 'only has negative precursor charges'
+        assert index.problem('negative') is None
+        assert index.problem('both') is None
+
+    # several files are scanned by a pool of processes
+    # T3.70
+    def test_scan_mgfs(self, tmp_path):
+        paths = []
+        for i in range(3):
+            path = tmp_path / '{}.mgf'.format(i)
+            path.write_text(self.spectrum.format(1, '2+', 10) * (i + 1))
+            paths.append(str(path))
+        indexes = files.scan_mgfs(paths)
+        assert [indexes[path].spectra for path in paths] == [1, 2, 3]
+
+
+class TestSearchSizing:
+
+    def processor(self, tmp_path, params):
+        (tmp_path / 'fragger.params').write_text(params)
+        (tmp_path / 'human.fasta').write_bytes(b'A' * 1000)
+        processor = files.FileProcessor()
+        processor.ms_jar = [True, str(tmp_path / 'ms' / 'MSFragger.jar')]
+        processor.params = [True, str(tmp_path / 'fragger.params')]
+        return processor
+
+    # settings are read from the .params file, database is found next to it
+    # T3.71
+    def test_read_params(self, tmp_path):
+        processor = self.processor(tmp_path, 'database_name = human.fasta # comment\nnum_threads = 8\n# x = 1\n')
+        settings = processor.read_params()
+        assert settings == {'database_name': 'human.fasta', 'num_threads': '8'}
+        assert processor.find_database(settings) == str(tmp_path / 'human.fasta')
+        assert processor.find_database({'database_name': 'missing.fasta'}) is None
+
+    # heap grows with the database and the largest .mgf file and is at least the minimum heap
+    # T3.72
+    def test_estimate_heap(self, tmp_path):
+        processor = self.processor(tmp_path, 'database_name = human.fasta\n')
+        assert processor.estimate_heap([]) == files.MSFRAGGER_MIN_HEAP
+        with mock.patch('files.MSFRAGGER_MIN_HEAP', 0):
+            mgf = tmp_path / 'a.mgf'
+            mgf.write_bytes(b'B' * 500)
+            assert processor.estimate_heap([str(mgf), 'missing.mgf']) == files.MSFRAGGER_BASE_HEAP \
+                + 1000 * files.MSFRAGGER_HEAP_PER_DATABASE_BYTE + 500 * files.MSFRAGGER_HEAP_PER_MGF_BYTE
+
+    # heap is bounded by the memory share of a search, threads by the cores and the .params file
+    # T3.73
+    @mock.patch('files.os.cpu_count')
+    @mock.patch('files.available_memory')
+    def test_plan_search(self, mock_memory, mock_cpu, tmp_path):
+        processor = self.processor(tmp_path, '')
+        mock_cpu.return_value = 16
+        mock_memory.return_value = 40 * 1024 ** 3
+        processor.share(4)
+        with mock.patch.object(processor, 'estimate_heap', return_value=64 * 1024 ** 3):
+            assert processor.plan_search([], {}) == (8 * 1024 ** 3, 4)
+            assert processor.plan_search([], {'num_threads': '2'}) == (8 * 1024 ** 3, 2)
+            processor.share(20)
+            assert processor.plan_search([], {'num_threads': '0'}) == (files.MSFRAGGER_MIN_HEAP, 1)
+
+    # derived .params file has the threads of the run and the full database path
+    # T3.74
+    def test_derive_params(self, tmp_path):
+        processor = self.processor(tmp_path, 'database_name = human.fasta\nnum_threads = 0 # all\nx = 1\n')
+        derived = processor.derive_params(processor.read_params(), 6)
+        try:
+            with open(derived) as derived_file:
+                text = derived_file.read()
+        finally:
+            os.unlink(derived)
+        assert text == 'database_name = {}\nnum_threads = 6\nx = 1\n'.format(tmp_path / 'human.fasta')
+
+    # no derived .params file is left behind when the original can not be read
+    # T3.85
+    def test_derive_params_missing(self, tmp_path, temp_dir):
+        processor = self.processor(tmp_path, '')
+        processor.params = [True, str(tmp_path / 'missing.params')]
+        with pytest.raises(OSError):
+            processor.derive_params({}, 6)
+        assert not os.listdir(str(temp_dir))
+
+
+class TestSharding:
+    spectrum = 'BEGIN IONS\nTITLE={}\nPEPMASS=500.2\nCHARGE=2+\n100.1 20\nEND IONS\n'
+    pepxml = '''<?xml version="1.0" encoding="UTF-8"?>
+<msms_pipeline_analysis>
+<msms_run_summary base_name="/data/{0}" raw_data_type="mgf" raw_data=".mgf">
+<search_summary base_name="/data/{0}" search_engine="X! Tandem"/>
+{1}</msms_run_summary>
+</msms_pipeline_analysis>
+'''
+    query = '<spectrum_query start_scan="{1}" spectrum="{0}.{1}.{1}.2" end_scan="{1}" index="{2}">\n</spectrum_query>\n'
+
+    def write_pepxml(self, path, name, scans):
+        path.write_text(self.pepxml.format(name, ''.join(self.query.format(name, scan, i)
+                                                            for i, scan in enumerate(scans, 1))))
+
+    # shards keep the global settings and every spectrum, spectra without scan number get their position
+    # T3.75
+    def test_split_mgf(self, tmp_path):
+        spectra = [self.spectrum.format(title) for title in ['x', 'a.7.7.2', 'y', 'z', 'w']]
+        spectra[3] = spectra[3].replace('CHARGE', 'SCANS=40\nCHARGE')
+        mgf = tmp_path / 'a.mgf'
+        mgf.write_text('MASS=Monoisotopic\n' + ''.join(spectra))
+        shards = files.split_mgf(files.scan_mgf(str(mgf)), 2)
+        assert shards == [str(tmp_path / 'a_shard1.mgf'), str(tmp_path / 'a_shard2.mgf')]
+        with_scans = [spectrum.replace('BEGIN IONS\n', 'BEGIN IONS\nSCANS={}\n'.format(i), 1)
+                      for i, spectrum in enumerate(spectra, 1)]
+        assert (tmp_path / 'a_shard1.mgf').read_text() == 'MASS=Monoisotopic\n' + with_scans[0] + spectra[1] \
+            + with_scans[2]
+        assert (tmp_path / 'a_shard2.mgf').read_text() == 'MASS=Monoisotopic\n' + spectra[3] + with_scans[4]
+
+    # merged .pepXML has the header of the first shard and the spectrum queries of all, named after the .mgf
+    # T3.76
+    def test_merge_pepxml(self, tmp_path):
+        self.write_pepxml(tmp_path / 'a_shard1.pepxml', 'a_shard1', [1, 2])
+        self.write_pepxml(tmp_path / 'a_shard2.pepxml', 'a_shard2', [3])
+        queries = files.merge_pepxml([str(tmp_path / 'a_shard1.pepxml'), str(tmp_path / 'a_shard2.pepxml')],
+                                     str(tmp_path / 'a.pepxml'), 'a')
+        assert queries == 3
+        self.write_pepxml(tmp_path / 'expected.pepxml', 'a', [1, 2, 3])
+        assert (tmp_path / 'a.pepxml').read_text() == (tmp_path / 'expected.pepxml').read_text()
+
+    # shard without the end of the run can not be merged
+    # T3.77
+    def test_merge_pepxml_incomplete(self, tmp_path):
+        (tmp_path / 'a_shard1.pepxml').write_text(self.pepxml.format('a_shard1', '').split('</msms_run')[0])
+        with pytest.raises(ValueError):
+            files.merge_pepxml([str(tmp_path / 'a_shard1.pepxml')], str(tmp_path / 'a.pepxml'), 'a')
+
+    # large .mgf is searched in shards whose results end up in its .pepXML, the shards are removed
+    # T3.78
+    @mock.patch('files.FileProcessor.execute_msfragger')
+    def test_search_shards(self, mock_msfragger, tmp_path):
+        mgf = tmp_path / 'a.mgf'
+        mgf.write_text(''.join(self.spectrum.format('a.{0}.{0}.2'.format(i)) for i in range(1, 6)))
+
+        def msfragger(shard, shards=1, calibrate=True):
+            name = os.path.splitext(os.path.basename(shard))[0]
+            scans = [index + 1 for index in range(len(files.scan_mgf(shard).offsets))]
+            self.write_pepxml(tmp_path / (name + '.pepxml'), name, scans)
+            return True
+        mock_msfragger.side_effect = msfragger
+
+        processor = files.FileProcessor()
+        processor.shard_spectra = 2
+        assert processor.search(str(mgf))
+        assert mock_msfragger.call_count == 3
+        assert sorted(os.listdir(str(tmp_path))) == ['a.mgf', 'a.pepxml']
+        assert (tmp_path / 'a.pepxml').read_text().count('<spectrum_query') == 5
+        processor.shard_spectra = 5
+        processor.search(str(mgf))
+        mock_msfragger.assert_called_with(str(mgf))
+
+    # a sharded search finds what a search of the whole .mgf without calibration finds
+    # calibration from part of the spectra would differ between the shards, so it is off for them
+    # T3.84
+    @mock.patch('files.FileProcessor.run_process')
+    def test_shards_match_whole(self, mock_run, tmp_path):
+        def msfragger(command, label, **kwargs):
+            params = {}
+            with open(command[4]) as params_file:
+                for line in params_file:
+                    key, _, value = line.partition('=')
+                    params[key.strip()] = value.strip()
+            mgf = command[-1]
+            name = os.path.splitext(os.path.basename(mgf))[0]
+            with open(mgf) as spectra:
+                scans = [int(line.split('.')[1]) for line in spectra if line.startswith('TITLE=')]
+            # a calibrated search depends on all the spectra it sees
+            offset = len(scans) if params.get('calibrate_mass', '0') != '0' else 0
+            queries = ''.join(self.query.format(name, scan, i).replace('>', ' offset="{}">'.format(offset), 1)
+                              for i, scan in enumerate(scans, 1))
+            (tmp_path / (name + '.pepxml')).write_text(self.pepxml.format(name, queries))
+            return subprocess.CompletedProcess(command, 0, '')
+        mock_run.side_effect = msfragger
+
+        mgf = tmp_path / 'a.mgf'
+        mgf.write_text(''.join(self.spectrum.format('a.{0}.{0}.2'.format(i)) for i in range(1, 8)))
+        (tmp_path / 'MSFragger.jar').write_text('jar')
+        processor = files.FileProcessor()
+        processor.ms_jar = [True, str(tmp_path / 'MSFragger.jar')]
+        processor.params = [True, str(tmp_path / 'fragger.params')]
+        (tmp_path / 'fragger.params').write_text('calibrate_mass = 0\n')
+        assert processor.search(str(mgf))
+        whole = (tmp_path / 'a.pepxml').read_text()
+
+        (tmp_path / 'fragger.params').write_text('calibrate_mass = 2\n')
+        processor.shard_spectra = 3
+        assert processor.search(str(mgf))
+        assert mock_run.call_count == 4
+        assert (tmp_path / 'a.pepxml').read_text() == whole
+        assert 'offset="0"' in whole
+
+
+class TestScanFolders:
+
+    def make_tree(self, tmp_path):
+        for path in ['study/b/2.mzML', 'study/a/1.mzXML', 'study/a/deep/3.MGF', 'study/a/notes.txt', 'study/4.mzID']:
+            (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / path).write_text('')
+        return str(tmp_path / 'study')
+
+    # files of all subfolders are found in a stable order, batches have at most the batch size
+    # T3.79
+    @mock.patch('files.SCAN_BATCH_SIZE', 2)
+    def test_scan_folders(self, tmp_path):
+        study = self.make_tree(tmp_path)
+        os.symlink(study, os.path.join(study, 'loop'))
+        batches = list(files.scan_folders([study], files.RAW_EXTENSIONS + files.IDENT_EXTENSIONS))
+        found = [os.path.relpath(path, study) for batch, _ in batches for path in batch]
+        assert found == ['4.mzID', os.path.join('a', '1.mzXML'), os.path.join('a', 'deep', '3.MGF'),
+                         os.path.join('b', '2.mzML')]
+        assert all(len(batch) <= 3 for batch, _ in batches)
+        assert batches[-1][1] == 4
+
+    # a stopped scan hands over what it found until then
+    # T3.80
+    def test_scan_folders_stop(self, tmp_path):
+        study = self.make_tree(tmp_path)
+        batches = list(files.scan_folders([study], files.RAW_EXTENSIONS, stop=lambda: True))
+        assert batches == [([], 0)]
+
+
+class TestConversionQueue:
+    pepxml = b'<msms_pipeline_analysis>\n</msms_pipeline_analysis>\n'
+
+    # a .pepXML is only complete once its last element is written
+    # T3.53
+    def test_pepxml_complete(self, tmp_path):
+        pep = tmp_path / 'a.pepxml'
+        assert not files.pepxml_complete(str(pep))
+        pep.write_bytes(self.pepxml[:30])
+        assert not files.pepxml_complete(str(pep))
+        pep.write_bytes(self.pepxml)
+        assert files.pepxml_complete(str(pep))
+
+    # only complete .pepXML files written during the run are converted, each once
+    # T3.54
+    def test_submit_finished(self, tmp_path):
+        for name, content in [('a', self.pepxml), ('b', self.pepxml[:30]), ('c', self.pepxml)]:
+            (tmp_path / (name + '.pepxml')).write_bytes(content)
+        old = str(tmp_path / 'c.pepxml')
+        os.utime(old, (0, 0))
+        convert = mock.Mock(return_value='done')
+        queue = files.ConversionQueue(convert, 2)
+        mgfs = [str(tmp_path / (name + '.mgf')) for name in 'abc']
+        queue.submit_finished(mgfs, 1)
+        queue.submit_finished(mgfs, 1)
+        queue.close()
+        convert.assert_called_once_with(mgfs[0])
+
+    # with a queue the search hands the conversion over instead of waiting for it
+    # T3.55
+    @mock.patch('files.FileProcessor.convert')
+    @mock.patch('files.FileProcessor.execute_msfragger')
+    @mock.patch('files.FileProcessor.check')
+    @mock.patch('files.os.path.exists')
+    def test_process_queue(self, mock_exists, mock_check, mock_msfragger, mock_convert):
+        processor = files.FileProcessor()
+        mock_exists.return_value = False
+        queue = mock.Mock()
+        assert processor.process('a.mgf', queue) is queue.submit.return_value
+        queue.submit.assert_called_once_with('a.mgf')
+        mock_convert.assert_not_called()
+
+    # in a batched run files are converted while MSFragger searches the next ones
+    # T3.56
+    @mock.patch('files.PEPXML_POLL_INTERVAL', 0.01)
+    @mock.patch('files.FileProcessor.check')
+    def test_process_batch_queue(self, mock_check, tmp_path):
+        mgfs = [str(tmp_path / (name + '.mgf')) for name in 'ab']
+        converted = threading.Event()
+
+        def msfragger(*mgfs):
+            files.Path(files.FileProcessor.make_pep_path(mgfs[0])).write_bytes(self.pepxml)
+            assert converted.wait(5)
+            files.Path(files.FileProcessor.make_pep_path(mgfs[1])).write_bytes(self.pepxml)
+            return True
+
+        def convert(mgf):
+            converted.set()
+            return mgf.replace('.mgf', '.mzID')
+
+        processor = files.FileProcessor()
+        processor.execute_msfragger = msfragger
+        queue = files.ConversionQueue(convert, 2)
+        mzids = processor.process_batch(mgfs, queue)
+        queue.close()
+        assert mzids == {mgf: mgf.replace('.mgf', '.mzID') for mgf in mgfs}
+
+
 @mock.patch('files.os.path.exists')
 @mock.patch('files.FileProcessor.check')
 @mock.patch('files.FileProcessor.execute_msfragger')
@@ -291,20 +922,22 @@ class TestCheck:
 class TestProcess:
 
     # tests for process
-    # mzid already exists
+    # identification is cached
     # T3.34
-    def test_process(self, mock_os_path, mock_make_mzid, mock_delete_pep, mock_make_pep,
+    @mock.patch('files.FileProcessor.lookup')
+    def test_process(self, mock_lookup, mock_os_path, mock_make_mzid, mock_delete_pep, mock_make_pep,
                      mock_idconvert, mock_msfragger, mock_check, mock_popup):
-        mock_os_path.return_value = True
-        assert file_processor.process(mgf_path) == file_processor.make_mzid_path(mgf_path)
+        mock_lookup.return_value = mzid_path
+        assert file_processor.process(mgf_path) == mzid_path
 
-    # mzid already exists, so process should not continue
+    # identification is cached, so process should not continue
     # T3.35
-    def test_process_discontinue_call(self, mock_os_path, mock_make_mzid, mock_delete_pep, mock_make_pep,
-                                      mock_idconvert, mock_msfragger, mock_check, mock_popup):
-        mock_os_path.return_value = True
+    @mock.patch('files.FileProcessor.lookup')
+    def test_process_discontinue_call(self, mock_lookup, mock_os_path, mock_make_mzid, mock_delete_pep,
+                                      mock_make_pep, mock_idconvert, mock_msfragger, mock_check, mock_popup):
+        mock_lookup.return_value = mzid_path
         file_processor.process(mgf_path)
-        mock_check.assert_not_called()
+        mock_msfragger.assert_not_called()
 
     # is the paths do not pass the check, the function should return False
     # T3.36
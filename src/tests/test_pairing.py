@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pairing
+
+
+class TestPairing:
+
+    # files with the same stem are paired, whatever their directory and extension
+    # T7.1
+    def test_exact_stems(self):
+        result = pairing.Pairing(['/raw/a.mzML', '/raw/b.mzXML'], ['/ident/b.mzID', '/ident/a.mgf'])
+        assert result.pairs == {'/raw/a.mzML': '/ident/a.mgf', '/raw/b.mzXML': '/ident/b.mzID'}
+        assert result.summary() is None
+
+    # naming rules pair files whose names differ in case, separators or suffixes
+    # T7.2
+    def test_rules(self):
+        result = pairing.Pairing(['Sample-1.mzML', 'sample_2.mzML', 'blank.mzML'],
+                                 ['sample_1_calibrated.mgf', 'Sample.2.interact.mzID', 'other.mzID'])
+        assert result.pairs == {'Sample-1.mzML': 'sample_1_calibrated.mgf',
+                                'sample_2.mzML': 'Sample.2.interact.mzID'}
+        assert result.unmatched_raw == ['blank.mzML']
+        assert result.unmatched_ident == ['other.mzID']
+        assert pairing.Pairing(['Sample-1.mzML'], ['sample_1_calibrated.mgf'], rules=[]).pairs == {}
+
+    # an exact stem wins over the rules, several candidates for the same name are ambiguous
+    # T7.3
+    def test_ambiguous(self):
+        result = pairing.Pairing(['a.mzML', 'b.mzML'], ['a.mzID', 'a_id.mzID', 'b.mgf', 'b.mzID'])
+        assert result.pairs == {'a.mzML': 'a.mzID'}
+        assert result.ambiguous == {'b.mzML': ['b.mgf', 'b.mzID']}
+        assert result.unmatched_raw == []
+        assert result.unmatched_ident == ['a_id.mzID']
+
+    # summary counts the paired files and lists the others
+    # T7.4
+    def test_summary(self):
+        raws = ['{}.mzML'.format(i) for i in range(15)]
+        result = pairing.Pairing(raws, ['0.mzID', 'x.mzID'])
+        summary = result.summary()
+        assert summary.startswith('1 of 15 files paired.')
+        assert 'No identification file for: 1.mzML, 2.mzML' in summary
+        assert 'and 4 more' in summary
+        assert 'Not paired with a raw file: x.mzID' in summary
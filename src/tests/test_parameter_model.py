@@ -0,0 +1,46 @@
+import os
+import sys
+import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import parameter_model
+
+
+class TestParameterModel:
+
+    # only keys whose value changes are set, marked dirty and announced
+    # T9.1
+    def test_set(self):
+        model = parameter_model.ParameterModel({'max_peaks': 10})
+        changed = mock.Mock()
+        model.changed.connect(changed)
+        assert not model.set('max_peaks', 10)
+        changed.assert_not_called()
+        assert model.set('max_peaks', 20)
+        changed.assert_called_once_with(['max_peaks'])
+        assert model['max_peaks'] == 20
+        assert model.take_dirty() == ['max_peaks']
+        assert model.take_dirty() == []
+
+    # a bulk update is announced once with all the keys that changed
+    # T9.2
+    def test_update(self):
+        model = parameter_model.ParameterModel({'min_mz': 0, 'max_mz': 100})
+        changed = mock.Mock()
+        model.changed.connect(changed)
+        assert model.update({'min_mz': 0, 'max_mz': 200, 'polarity': 'both'}) == ['max_mz', 'polarity']
+        changed.assert_called_once_with(['max_mz', 'polarity'])
+
+    # loading replaces the parameters at once and forgets what was dirty
+    # T9.3
+    def test_load(self):
+        model = parameter_model.ParameterModel({'min_mz': 0, 'max_mz': 100})
+        model.set('min_mz', 10)
+        values = {'max_mz': 100, 'polarity': 'both'}
+        changed = mock.Mock()
+        model.changed.connect(changed)
+        assert sorted(model.load(values)) == ['min_mz', 'polarity']
+        changed.assert_called_once_with(['min_mz', 'polarity'])
+        assert model.values == values and model.values is not values
+        assert 'min_mz' not in model
+        assert model.take_dirty() == []
@@ -3,9 +3,14 @@ import sys
 import pytest
 
 import mock
+from PyQt5.QtWidgets import QApplication
+import pastaq
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import buttons
+import catalog
+import estimator
 import parameter
+import parameter_schema
 from files import EditFileDialog, FileProcessor
 
 
@@ -76,7 +81,7 @@ class TestButtons:
 
     # T4.7
     # test to see if a new file gets added correctly
-    @mock.patch('parameter.Path.is_file')
+    @mock.patch('parameter.catalog.FileCatalog.exists')
     @mock.patch('parameter.ParametersWidget.check_run_btn')
     def test_add_new_file(self, mock_check, mock_is_file, tmp_path):
         widget = parameter.ParametersWidget()
@@ -105,7 +110,7 @@ class TestButtons:
     # T4.9
     # test to see if files get updated correctly
     @mock.patch('parameter.files.popup_window')
-    @mock.patch('parameter.Path.is_file')
+    @mock.patch('parameter.catalog.FileCatalog.exists')
     @mock.patch('parameter.ParametersWidget.check_run_btn')
     def test_update_input_files(self, mock_check, mock_is_file, mock_popup, tmp_path):
         widget = parameter.ParametersWidget()
@@ -115,7 +120,7 @@ class TestButtons:
         f1 = directory / mzXML
         widget.input_files = [{'raw_path': str(f1), 'reference': False}]
         widget.update_input_files(widget.input_files)
-        assert widget.input_files_table.rowCount() == 1
+        assert widget.input_files_model.rowCount() == 1
 
     # T4.10
     # test to see if files get removed
@@ -127,7 +132,7 @@ class TestButtons:
         widget.update_input_files(widget.input_files)
         widget.input_files_table.selectRow(0)
         widget.remove_file()
-        assert widget.input_files_table.rowCount() == 2
+        assert widget.input_files_model.rowCount() == 2
 
     # T4.11
     # test to see if the parameters update accordingly
@@ -140,3 +145,202 @@ class TestButtons:
         assert widget.parameters['resolution_ms1'] == 3000
         assert widget.parameters['instrument_type'] == "orbitrap"
         assert not parameter.saved
+
+    # T4.15
+    # test to see if a widget change only sets its own parameter
+    def test_parameter_per_key(self):
+        widget = parameter.ParametersWidget()
+        widget.nav.setCurrentRow(2)
+        widget.nav.setCurrentRow(7)
+        widget.update_parameters()
+        changed = mock.Mock()
+        widget.parameter_model.changed.connect(changed)
+        widget.res_ms1.setValue(widget.res_ms1.value() + 1)
+        changed.assert_called_once_with(['resolution_ms1'])
+        widget.feature_detection_charge_state_max.setValue(3)
+        widget.feature_detection_charge_state_min.setValue(2)
+        assert widget.parameters['feature_detection_charge_states'] == [3, 2]
+        widget.qc_plot_fill_alpha.setValue(0.0)
+        assert widget.parameters['qc_plot_fill_alpha'] == 'dynamic'
+
+    # T4.16
+    # test to see if a page is only built when it is shown, with the parameters loaded before
+    def test_lazy_pages(self):
+        widget = parameter.ParametersWidget()
+        assert widget.built_pages == {0}
+        assert not hasattr(widget, 'warp2d_slack')
+        widget.parameters = {'warp2d_slack': 12, 'qc_plot_fill_alpha': 0.5}
+        assert widget.res_ms1.value() == 70000
+        widget.nav.setCurrentRow(3)
+        assert widget.warp2d_slack.value() == 12
+        assert widget.warp2d_window_size.value() == 100
+        assert widget.parameters == {'warp2d_slack': 12, 'qc_plot_fill_alpha': 0.5}
+        widget.parameters = {}
+        assert widget.warp2d_slack.value() == 30
+
+    # T4.17
+    # test to see if the defaults of the schema are the ones of pastaq, next to the settings of the GUI
+    def test_schema_defaults(self):
+        defaults = parameter_schema.defaults()
+        pastaq_defaults = pastaq.default_parameters('orbitrap', 10)
+        assert {key: defaults[key] for key in pastaq_defaults} == pastaq_defaults
+        assert set(defaults) - set(pastaq_defaults) == {'num_samples_auto', 'grid_memory_budget'}
+
+    # T4.18
+    # test to see if invalid parameters are shown at their widgets and block the run
+    def test_parameter_errors(self):
+        widget = parameter.ParametersWidget()
+        widget.set_run_btn(mock.Mock())
+        widget.parameters = {'max_mz': 10, 'min_mz': 20}
+        widget.run_btn.setEnabled.assert_called_with(False)
+        assert widget.nav.item(1).foreground().color().name() == '#ff0000'
+        widget.nav.setCurrentRow(1)
+        assert widget.field_items['max_mz'][0].error.text() == 'Min m/z has to be below max m/z.'
+        widget.max_mz.setValue(30)
+        assert not widget.field_items['min_mz'][0].error.text()
+        assert widget.validator.errors == {}
+        widget.nav.setCurrentRow(2)
+        widget.feature_detection_charge_state_max.setValue(2)
+        widget.feature_detection_charge_state_min.setValue(3)
+        assert widget.field_items['feature_detection_charge_states'][0].error.text() == \
+            'Feature detection min charge has to be at most the max charge.'
+        widget.feature_detection_charge_state_max.setValue(4)
+        assert widget.validator.errors == {}
+
+    # T4.19
+    # test to see if the estimate is shown once the catalog knows the raw files and warns when memory is short
+    @mock.patch('parameter.files.available_memory')
+    def test_estimate(self, mock_memory, tmp_path):
+        raw = tmp_path / 'a.mzML'
+        raw.write_bytes(b'0' * 1000)
+        mock_memory.return_value = 1024 ** 5
+        widget = parameter.ParametersWidget()
+        widget.parameters = parameter_schema.defaults()
+        widget.update_input_files([{'raw_path': raw.as_posix(), 'ident_path': 'none'}])
+        assert not widget.estimate_label.isHidden()
+        assert widget.estimate_label.text().startswith('Needs about')
+        assert 'Largest grid: 350189 x 3601 points' in widget.estimate_label.toolTip()
+        mock_memory.return_value = 1024 ** 2
+        widget.parameter_model.set('num_samples_mz', 6)
+        assert 'only 1 MB of memory is free' in widget.estimate_label.text()
+        widget.parameter_model.set('num_samples_mz', 0)
+        assert widget.estimate_label.isHidden()
+
+    # T4.20
+    # test to see if the automatic number of samples keeps the grid within the budget as the parameters change
+    def test_auto_samples(self):
+        widget = parameter.ParametersWidget()
+        widget.parameters = parameter_schema.defaults()
+        widget.nav.setCurrentRow(2)
+        assert widget.num_samples_mz.isEnabled()
+        assert widget.grid_label.text().startswith('Grid of a raw file: 350189 x 3601 points')
+        widget.num_samples_auto.setChecked(True)
+        assert not widget.num_samples_mz.isEnabled()
+        assert widget.parameters['num_samples_mz'] == widget.parameters['num_samples_rt'] == 4
+        assert widget.num_samples_rt.value() == 4
+        widget.parameter_model.set('resolution_ms1', 17500)
+        assert widget.parameters['num_samples_mz'] == 9
+        widget.parameter_model.set('grid_memory_budget', 0.1)
+        assert widget.parameters['num_samples_mz'] == 1
+        assert 'over the budget' in widget.grid_label.text()
+
+    # T4.21
+    # test to see if the window is set to the range of the data once all raw files are scanned
+    def test_data_range(self, tmp_path):
+        widget = parameter.ParametersWidget()
+        widget.parameters = parameter_schema.defaults()
+        widget.nav.setCurrentRow(1)
+        raws = [(tmp_path / name).as_posix() for name in ('a.mzML', 'b.mzML')]
+        widget.input_files = [{'raw_path': raw, 'ident_path': 'none'} for raw in raws]
+        widget.file_catalog.put(raws[0], catalog.FileEntry(True, 10, 1, None, {'bounds': [400.2, 1500.5, 30, 3000]}))
+        widget.show_input_files()
+        assert widget.data_range_label.text() == \
+            'Data of the raw files: m/z 400 to 1501, retention time 30 to 3000 s (1 of 2 raw files scanned)'
+        assert not widget.data_range_btn.isEnabled()
+        widget.file_catalog.put(raws[1], catalog.FileEntry(True, 10, 1, None, {'bounds': [350, 1200, 0.5, 3600]}))
+        widget.show_input_files()
+        assert widget.data_range_btn.isEnabled()
+        widget.data_range_btn.click()
+        assert [widget.parameters[key] for key in ('min_mz', 'max_mz', 'min_rt', 'max_rt')] == [350, 1501, 0, 3600]
+        assert widget.max_rt.value() == 3600
+        assert widget.data_range_label.text().endswith('the window is set to it')
+        assert widget.estimate().grids[1] == estimator.grid_size(widget.parameters, (350, 1200, 0.5, 3600))
+
+    # T4.22
+    # test to see if the automatic number of samples follows the range of the data of the scanned raw files
+    def test_auto_samples_data_range(self, tmp_path):
+        widget = parameter.ParametersWidget()
+        widget.parameters = dict(parameter_schema.defaults(), num_samples_auto=True)
+        widget.nav.setCurrentRow(2)
+        raws = [(tmp_path / name).as_posix() for name in ('a.mzML', 'b.mzML')]
+        widget.input_files = [{'raw_path': raw, 'ident_path': 'none'} for raw in raws]
+        widget.show_input_files()
+        assert widget.parameters['num_samples_mz'] == 4
+        narrow, wide = (400, 1600, 60, 300), (300, 1800, 0, 1200)
+        widget.file_catalog.put(raws[0], catalog.FileEntry(True, 10, 1, None, {'bounds': list(narrow)}))
+        widget.show_input_files()
+        # the file that was not scanned yet is assumed to have data over the whole assumed range
+        assert widget.parameters['num_samples_mz'] == 4
+        widget.file_catalog.put(raws[1], catalog.FileEntry(True, 10, 1, None, {'bounds': list(wide)}))
+        widget.show_input_files()
+        params = parameter_schema.complete(widget.parameters)
+        samples = estimator.tune_samples(params, params['grid_memory_budget'] * 1024 ** 3, wide)
+        assert samples > 4
+        assert widget.parameters['num_samples_mz'] == widget.parameters['num_samples_rt'] == samples
+        mz, rt = estimator.grid_size(params, wide)
+        assert widget.grid_label.text().startswith('Grid of a raw file: {} x {} points'.format(mz, rt))
+        assert 'with data from m/z 300 to 1800' in widget.grid_label.toolTip()
+
+    # T4.12
+    # test to see if .mgf files that can not be searched are rejected when added
+    @mock.patch('files.popup_window')
+    def test_edit_files_reject_mgf(self, mock_popup, tmp_path):
+        good = tmp_path / 'good.mgf'
+        good.write_text('BEGIN IONS\nCHARGE=2+\n100.1 20\nEND IONS\n')
+        empty = tmp_path / 'empty.mgf'
+        empty.write_text('')
+        efd = EditFileDialog()
+        efd.set_files([good.as_posix(), empty.as_posix(), mzID])
+        # the files are scanned in the background, they can be confirmed once the scan is done
+        assert efd.files_list.item(0).text() == '{} (scanning...)'.format(good.as_posix())
+        assert not efd.ok_button.isEnabled()
+        efd.mgf_scanners[-1].wait()
+        QApplication.processEvents()
+        assert efd.ok_button.isEnabled()
+        assert efd.mzid_paths == [good.as_posix(), mzID]
+        assert 'empty.mgf contains no spectra' in mock_popup.call_args.args[2]
+        assert efd.files_list.item(0).text() == '{} (1 spectra, charge 2+: 100%)'.format(good.as_posix())
+
+    # T4.13
+    # test to see if all edited files are paired at once and the others keep their identification file
+    def test_examine_edit_files_pairing(self, tmp_path):
+        efd = EditFileDialog()
+        efd.group = ''
+        efd.mzid_paths = [(tmp_path / name).as_posix() for name in ['1_3.mzid', '1_4_interact.mzid', 'other.mzid']]
+        widget = parameter.ParametersWidget()
+        input_files = [{'raw_path': mzXML, 'reference': False, 'ident_path': mzID},
+                       {'raw_path': 'C:/Users/Downloads/1_4.mzXML', 'reference': False},
+                       {'raw_path': 'C:/Users/Downloads/1_5.mzXML', 'reference': False, 'ident_path': mzID}]
+        new_list = widget.examine_edit_files(input_files, efd, [0, 1, 2])
+        assert new_list[0]['ident_path'] == efd.mzid_paths[0]
+        assert new_list[1]['ident_path'] == efd.mzid_paths[1]
+        assert new_list[2]['ident_path'] == mzID
+        assert widget.pairing.unmatched_ident == [efd.mzid_paths[2]]
+
+    # T4.14
+    # test to see if files found in folders are added and paired at the end of the scan
+    @mock.patch('parameter.files.popup_window')
+    @mock.patch('parameter.catalog.FileCatalog.exists')
+    @mock.patch('parameter.ParametersWidget.check_run_btn')
+    def test_add_found_files(self, mock_check, mock_exists, mock_popup, tmp_path):
+        mock_exists.return_value = True
+        widget = parameter.ParametersWidget()
+        study = tmp_path.as_posix()
+        widget.input_files = []
+        widget.add_found_files([study + '/a.mzML', study + '/a.mgf', study + '/b.mzXML'])
+        widget.add_found_files([study + '/c.mzID'])
+        assert [file['raw_path'] for file in widget.input_files] == [study + '/a.mzML', study + '/b.mzXML']
+        widget.pair_found_files()
+        assert widget.input_files[0]['ident_path'] == study + '/a.mgf'
+        assert 'ident_path' not in widget.input_files[1]
+        mock_popup.assert_called_once()
@@ -1,10 +1,13 @@
 import pytest
+import contextlib
 import os
 import mock
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import QDialog, QTextEdit, QDialogButtonBox, QVBoxLayout
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import estimator
 import pipeline
 
 ml_path = 'some_ml_path.mzML'
@@ -13,7 +16,7 @@ ident_path_mzid = 'identification_file_path.mzid'
 
 
 @mock.patch('pipeline.files')
-@mock.patch('pipeline.pastaq.dda_pipeline')
+@mock.patch('pipeline.StageRunner')
 class TestRun:
     input = [{'raw_path': ml_path, 'reference': False, 'group': '', 'ident_path': ident_path_mgf}]
     output = [{'raw_path': ml_path, 'reference': False, 'group': '', 'ident_path': ident_path_mzid}]
@@ -53,3 +56,383 @@ class TestRun:
         mock_files.process.return_value = True
         pipe.run()
         assert mock_print.getvalue().startswith('ERROR:')
+
+
+@mock.patch('pipeline.StageRunner')
+class TestIdentify:
+    raw = [{'raw_path': 'a.mzML', 'reference': False, 'group': '', 'ident_path': 'a.mgf'},
+           {'raw_path': 'b.mzML', 'reference': False, 'group': '', 'ident_path': 'b.mgf'},
+           {'raw_path': 'c.mzML', 'reference': False, 'group': '', 'ident_path': 'c.mzID'}]
+
+    def make_runner(self, all_or_nothing):
+        file_processor = mock.Mock()
+        file_processor.process.side_effect = lambda mgf, queue=None: mgf.replace('.mgf', '.mzID') if mgf == 'a.mgf' else False
+        pipe = pipeline.PipelineRunner(file_processor)
+        pipe.input_files = [dict(entry) for entry in self.raw]
+        pipe.ident_workers = 2
+        pipe.all_or_nothing = all_or_nothing
+        return pipe
+
+    # every .mgf is processed, files that are already identified are not
+    # T5.5
+    def test_identify_calls(self, mock_pipeline):
+        pipe = self.make_runner(False)
+        pipe.identify()
+        processed = sorted(call.args[0] for call in pipe.file_processor.process.call_args_list)
+        assert processed == ['a.mgf', 'b.mgf']
+
+    # with all or nothing a failed identification stops the run
+    # T5.6
+    def test_identify_all_or_nothing(self, mock_pipeline):
+        pipe = self.make_runner(True)
+        pipe.run()
+        mock_pipeline.assert_not_called()
+        assert pipe.input_files[0]['ident_path'] == 'a.mzID'
+
+    # without all or nothing the failed file is quantified without identifications
+    # T5.7
+    def test_identify_partial(self, mock_pipeline):
+        pipe = self.make_runner(False)
+        pipe.run()
+        input_files = mock_pipeline.call_args.args[1]
+        assert [entry['ident_path'] for entry in input_files] == ['a.mzID', 'none', 'c.mzID']
+        # the project keeps the .mgf so it can be retried
+        assert pipe.input_files[1]['ident_path'] == 'b.mgf'
+
+    # batched identification hands all .mgf files to the file processor at once
+    # T5.24
+    def test_identify_batch(self, mock_pipeline):
+        pipe = self.make_runner(False)
+        pipe.ident_batched = True
+        pipe.file_processor.process_batch.return_value = {'a.mgf': 'a.mzID', 'b.mgf': False}
+        input_files = pipe.identify()
+        assert pipe.file_processor.process_batch.call_args.args[0] == ['a.mgf', 'b.mgf']
+        pipe.file_processor.process.assert_not_called()
+        assert [entry['ident_path'] for entry in input_files] == ['a.mzID', 'none', 'c.mzID']
+
+    # conversions handed to the queue are waited for before the pipeline starts
+    # T5.25
+    def test_identify_queue(self, mock_pipeline):
+        pipe = self.make_runner(False)
+        pipe.file_processor.process.side_effect = lambda mgf, queue: queue.submit(mgf)
+        pipe.file_processor.convert.side_effect = lambda mgf: mgf.replace('.mgf', '.mzID')
+        input_files = pipe.identify()
+        assert [entry['ident_path'] for entry in input_files] == ['a.mzID', 'b.mzID', 'c.mzID']
+
+    # after a cancel no further searches start and the pipeline does not run
+    # T5.31
+    def test_identify_cancel(self, mock_pipeline):
+        pipe = self.make_runner(False)
+        pipe.ident_workers = 1
+        pipe.input_files = [{'raw_path': '{}.mzML'.format(i), 'ident_path': '{}.mgf'.format(i)} for i in range(5)]
+
+        def process(mgf, queue):
+            pipe.cancel()
+            return mgf.replace('.mgf', '.mzID')
+        pipe.file_processor.process.side_effect = process
+        with mock.patch('builtins.print'):
+            pipe.run()
+        assert pipe.file_processor.process.call_count == 1
+        mock_pipeline.assert_not_called()
+
+
+class TestIsolated:
+
+    def make_runner(self, tmp_path):
+        pipe = pipeline.PipelineRunner(mock.Mock())
+        pipe.isolated = True
+        pipe.output_dir = str(tmp_path)
+        return pipe
+
+    # the output of the worker process is streamed into the log
+    # T5.8
+    @mock.patch('builtins.print')
+    @mock.patch('pipeline.worker_command')
+    def test_run_isolated_output(self, mock_command, mock_print, tmp_path):
+        mock_command.return_value = [sys.executable, '-c', 'print("pipeline output")']
+        pipe = self.make_runner(tmp_path)
+        pipe.run_isolated([])
+        mock_print.assert_any_call('pipeline output\n', end='')
+        assert pipe.succeeded
+
+    # a failing worker process is reported
+    # T5.9
+    @mock.patch('builtins.print')
+    @mock.patch('pipeline.worker_command')
+    def test_run_isolated_failure(self, mock_command, mock_print, tmp_path):
+        mock_command.return_value = [sys.executable, '-c', 'import sys; sys.exit(3)']
+        pipe = self.make_runner(tmp_path)
+        pipe.run_isolated([])
+        assert mock_print.call_args.args[0].startswith('ERROR:')
+        assert not pipe.succeeded
+
+    # cancelling kills the worker process right away
+    # T5.10
+    @mock.patch('builtins.print')
+    @mock.patch('pipeline.worker_command')
+    def test_cancel(self, mock_command, mock_print, tmp_path):
+        mock_command.return_value = [sys.executable, '-c', 'import time; print("started", flush=True); time.sleep(60)']
+        pipe = self.make_runner(tmp_path)
+        mock_print.side_effect = lambda *args, **kwargs: pipe.cancel()
+        pipe.run_isolated([])
+        assert pipe.process.returncode != 0
+        mock_print.assert_called_with('Pipeline cancelled')
+
+    # the job is handed to the worker through a file
+    # T5.11
+    @mock.patch('pipeline.run_dda')
+    def test_run_job(self, mock_run, tmp_path):
+        job = tmp_path / 'job.json'
+        job.write_text('{"params": {"a": 1}, "input_files": [], "output_dir": "out"}')
+        assert pipeline.run_job(str(job)) == 0
+        mock_run.assert_called_with({'a': 1}, [], 'out', 0, True, None, None)
+
+    # a sweep that raised in the thread did not succeed, so there are no results to compare
+    # T5.32
+    @mock.patch('builtins.print')
+    @mock.patch('pipeline.SweepRunner')
+    def test_run_in_thread_failure(self, mock_sweep, mock_print, tmp_path):
+        pipe = self.make_runner(tmp_path)
+        pipe.variants = [{'warp2d_slack': 10}, {'warp2d_slack': 20}]
+        mock_sweep.return_value.run.side_effect = ValueError('no peaks')
+        pipe.run_in_thread([])
+        mock_print.assert_called_with('ERROR:', mock_sweep.return_value.run.side_effect)
+        assert not pipe.succeeded
+        mock_sweep.return_value.run.side_effect = None
+        pipe.run_in_thread([])
+        assert pipe.succeeded
+
+
+class TestTextStream:
+
+    # writes are collected and handed over in a single batch
+    # T5.12
+    def test_drain(self):
+        stream = pipeline.TextStream()
+        stream.write('a')
+        stream.write(1)
+        stream.write('\n')
+        assert stream.drain() == 'a1\n'
+        assert stream.drain() == ''
+
+    # the complete log ends up on disk
+    # T5.13
+    def test_log_file(self, tmp_path):
+        log_path = tmp_path / 'pipeline.log'
+        stream = pipeline.TextStream(str(log_path))
+        stream.write('first\n')
+        stream.drain()
+        stream.write('second\n')
+        stream.close()
+        assert log_path.read_text() == 'first\nsecond\n'
+
+    # text waiting for the view is bounded, the oldest text is dropped
+    # T5.14
+    @mock.patch('pipeline.LOG_MAX_PENDING', 10)
+    def test_bounded(self):
+        stream = pipeline.TextStream()
+        for i in range(10):
+            stream.write('line {}\n'.format(i))
+        assert stream.drain() == 'line 9\n'
+
+
+class TestStages:
+    input_files = [{'raw_path': 'a.mzML', 'stem': 'a'}, {'raw_path': 'b.mzML', 'stem': 'b'}]
+
+    # per file stages depend on the same file, other stages on all files
+    # T5.15
+    def test_tasks(self):
+        tasks = pipeline.StageRunner({}, self.input_files, '').tasks()
+        assert tasks['peaks:a'].deps == {'raw:a'}
+        assert tasks['warp'].deps == {'peaks:a', 'peaks:b'}
+        assert tasks['features:b'].deps == {'warp'}
+        assert tasks['link:a'].deps == {'raw:a', 'warp', 'ident:a'}
+        assert set(tasks) >= {stage.name for stage in pipeline.STAGES if not stage.per_file}
+
+    # every stage depends on stages that come before it
+    # T5.16
+    def test_stage_order(self):
+        names = [stage.name for stage in pipeline.STAGES]
+        for i, stage in enumerate(pipeline.STAGES):
+            assert all(name in names[:i] for name in stage.inputs)
+
+    # per file tasks only see their own file
+    # T5.17
+    def test_task_params(self):
+        runner = pipeline.StageRunner({'max_peaks': 10}, self.input_files, '')
+        tasks = runner.tasks()
+        assert runner.task_params(tasks['raw:b'])['input_files'] == [self.input_files[1]]
+        assert runner.task_params(tasks['warp']) is runner.params
+
+    # the output directory and input files are prepared like pastaq.dda_pipeline does
+    # T5.18
+    def test_prepare(self, tmp_path):
+        input_files = [{'raw_path': '/data/sample.mzML'}]
+        runner = pipeline.StageRunner({}, input_files, str(tmp_path))
+        runner.prepare()
+        assert input_files[0] == {'raw_path': '/data/sample.mzML', 'ident_path': 'none', 'stem': 'sample',
+                                  'group': 'none'}
+        assert (tmp_path / 'warped_peaks').is_dir()
+        assert (tmp_path / 'parameters.json').is_file()
+
+    # a failing stage reports what it printed
+    # T5.19
+    def test_run_stage_task_error(self, tmp_path):
+        with mock.patch.object(pipeline.STAGE_INDEX['raw'], 'function', side_effect=ValueError('bad')):
+            with pytest.raises(pipeline.StageError) as error:
+                pipeline.run_stage_task('raw', {}, str(tmp_path))
+        assert 'bad' in str(error.value)
+
+    # with an estimate, the automatic workers fit in the free memory and the run is recorded next to it
+    # T5.27
+    @mock.patch('pipeline.files.available_memory')
+    @mock.patch('pipeline.children_peak_memory')
+    def test_record(self, mock_peak, mock_memory, tmp_path):
+        prediction = estimator.Estimate([(1, 1)] * 2, [100, 100], 10, [5, 5]).to_dict()
+        runner = pipeline.StageRunner({}, self.input_files, str(tmp_path), prediction=prediction)
+        mock_memory.return_value = 150
+        assert runner.get_workers() == 1
+        runner.prepare()
+        (tmp_path / 'peaks' / 'a.peaks').write_bytes(b'0' * 42)
+        mock_peak.return_value = 300
+        runner.record(2, 20.0, 200)
+        mock_peak.return_value = 200
+        runner.record(2, 20.0, 200)
+        runs = estimator.read_runs(str(tmp_path))
+        assert runs[0]['predicted'] == {'memory': 100, 'disk': 10, 'time': 5}
+        assert runs[0]['observed'] == {'memory': 300, 'disk': 42, 'time': 20.0}
+        assert runs[1]['observed']['memory'] is None
+
+
+class TestStageCache:
+    input_file = {'raw_path': 'a.mzML', 'stem': 'a', 'ident_path': 'none'}
+
+    def task(self, name):
+        return pipeline.StageTask(pipeline.STAGE_INDEX[name], self.input_file)
+
+    # only the parameters a stage reads change its key
+    # T5.20
+    def test_key_params(self):
+        task = self.task('peaks')
+        key = pipeline.StageCache.key(task, {'max_peaks': 10}, [self.input_file], [])
+        assert key == pipeline.StageCache.key(task, {'max_peaks': 10, 'quant_isotopes': 'height'},
+                                              [self.input_file], [])
+        assert key != pipeline.StageCache.key(task, {'max_peaks': 20}, [self.input_file], [])
+
+    # a change upstream or in the input file invalidates the stage
+    # T5.21
+    def test_key_inputs(self, tmp_path):
+        raw_path = tmp_path / 'a.mzML'
+        raw_path.write_text('spectra')
+        input_file = dict(self.input_file, raw_path=str(raw_path))
+        task = self.task('raw')
+        key = pipeline.StageCache.key(task, {}, [input_file], [])
+        assert key != pipeline.StageCache.key(task, {}, [input_file], ['upstream'])
+        raw_path.write_text('other spectra')
+        assert key != pipeline.StageCache.key(task, {}, [input_file], [])
+
+    # a cached task is only reused while its outputs exist
+    # T5.22
+    def test_hit(self, tmp_path):
+        task = self.task('peaks')
+        (tmp_path / 'peaks').mkdir()
+        (tmp_path / 'peaks' / 'a.peaks').write_text('')
+        cache = pipeline.StageCache(str(tmp_path))
+        cache.store(task, 'key')
+        cache.load()
+        assert cache.hit(task, 'key')
+        assert not cache.hit(task, 'other key')
+        (tmp_path / 'peaks' / 'a.peaks').unlink()
+        assert not cache.hit(task, 'key')
+
+    # a parameter makes the stages reading it stale, and everything downstream of them
+    # T5.26
+    def test_stale_stages(self):
+        assert pipeline.stale_stages(['qc_plot_dpi']) == ['qc_plots']
+        assert pipeline.stale_stages(['metamatch_fraction']) == ['metamatch', 'quant', 'qc_plots', 'summary']
+        assert pipeline.stale_stages(['ident_ignore_decoy'])[:2] == ['ident', 'link']
+        assert pipeline.stale_stages(['project_name']) == []
+
+    # cached tasks are not submitted, all others are forced to recompute
+    # T5.23
+    def test_submit(self, tmp_path):
+        runner = pipeline.StageRunner({}, [self.input_file], str(tmp_path))
+        runner.executor = mock.MagicMock()
+        task = self.task('ident')
+        runner.cache.store(task, runner.cache.key(task, {}, [self.input_file], []))
+        assert runner.submit(task) is None
+        runner.submit(self.task('raw'))
+        assert runner.executor.submit.call_args.args[-1] is True
+
+    # without the cache pastaq keeps the outputs that exist, as it did before the cache
+    # T5.30
+    def test_submit_without_cache(self, tmp_path):
+        (tmp_path / 'raw').mkdir()
+        (tmp_path / 'raw' / 'a.ms1').write_text('ms1')
+        runner = pipeline.StageRunner({}, [self.input_file], str(tmp_path), cache=False)
+        runner.executor = mock.MagicMock()
+        runner.submit(self.task('raw'))
+        assert runner.executor.submit.call_args.args == (pipeline.run_stage_task, 'raw', runner.task_params(
+            self.task('raw')), str(tmp_path))
+        assert (tmp_path / 'raw' / 'a.ms1').read_text() == 'ms1'
+
+
+# Stage function that only writes the outputs the stage declares
+def fake_stage(stage, calls):
+    def function(params, output_dir, logger, force_override):
+        calls.append((stage.name, os.path.basename(output_dir)))
+        outputs = {output.format(stem=input_file['stem']) for input_file in params['input_files']
+                   for output in stage.outputs}
+        for output in outputs:
+            path = os.path.join(output_dir, output)
+            if '.' not in os.path.basename(path):
+                path = os.path.join(path, 'plot.png')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as output_file:
+                output_file.write('{} {}'.format(stage.name, params.get('warp2d_slack')))
+    return function
+
+
+class TestSweep:
+
+    def run_sweep(self, tmp_path, variants, calls):
+        input_files = [{'raw_path': 'a.mzML', 'stem': 'a', 'ident_path': 'none'}]
+        with contextlib.ExitStack() as stack:
+            for stage in pipeline.STAGES:
+                stack.enter_context(mock.patch.object(stage, 'function', fake_stage(stage, calls)))
+            stack.enter_context(mock.patch('pipeline.ProcessPoolExecutor',
+                                           lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)))
+            stack.enter_context(mock.patch('builtins.print'))
+            pipeline.SweepRunner({'warp2d_slack': 30}, input_files, str(tmp_path), variants, workers=2).run()
+
+    # tasks the variants have in common run once and are linked into the other variants
+    # T5.28
+    def test_shared_tasks(self, tmp_path):
+        calls = []
+        self.run_sweep(tmp_path, [{'warp2d_slack': 10}, {'warp2d_slack': 20}], calls)
+        names = [name for name, _ in calls]
+        assert names.count('raw') == names.count('peaks') == names.count('ident') == 1
+        assert names.count('warp') == names.count('quant') == 2
+        first, second = pipeline.variant_dir(str(tmp_path), 0), pipeline.variant_dir(str(tmp_path), 1)
+        assert os.path.samefile(os.path.join(first, 'raw', 'a.ms1'), os.path.join(second, 'raw', 'a.ms1'))
+        with open(os.path.join(second, 'warped_peaks', 'a.peaks')) as peaks:
+            assert peaks.read() == 'warp 20'
+
+        # a second sweep only runs the variant that is new
+        calls.clear()
+        self.run_sweep(tmp_path, [{'warp2d_slack': 20}, {'warp2d_slack': 10}, {'warp2d_slack': 5}], calls)
+        assert {directory for _, directory in calls} == {'variant_03'}
+        assert 'raw' not in [name for name, _ in calls]
+        with open(os.path.join(first, 'warped_peaks', 'a.peaks')) as peaks:
+            assert peaks.read() == 'warp 20'
+
+    # a task computed again does not write into the files it shares with other directories
+    # T5.29
+    def test_detach_outputs(self, tmp_path):
+        task = pipeline.StageTask(pipeline.STAGE_INDEX['qc_plots'])
+        (tmp_path / 'a' / 'quality').mkdir(parents=True)
+        (tmp_path / 'a' / 'quality' / 'plot.png').write_text('a')
+        pipeline.link_outputs(str(tmp_path / 'a'), str(tmp_path / 'b'), ['quality'])
+        pipeline.detach_outputs(str(tmp_path / 'b'), task)
+        (tmp_path / 'b' / 'quality' / 'plot.png').write_text('b')
+        assert (tmp_path / 'a' / 'quality' / 'plot.png').read_text() == 'a'
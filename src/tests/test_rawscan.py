@@ -0,0 +1,100 @@
+import base64
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rawscan
+
+# level, polarity, retention time in minutes and observed m/z range of the spectra of the test files
+SPECTRA = [(1, 'MS:1000130', 1.0, 400.5, 1500.25), (2, 'MS:1000130', 1.1, 150.0, 1900.0),
+           (1, 'MS:1000130', 2.5, 350.0, 1200.0), (2, 'MS:1000130', 2.6, 120.0, 900.0)]
+# peak arrays, which a scan of the headers never decodes
+PEAKS = base64.b64encode(bytes(range(64))).decode()
+
+
+def mzml_spectrum(i, level, polarity, rt, low, high):
+    return '''<spectrum index="{0}" id="scan={0}" defaultArrayLength="2">
+<cvParam cvRef="MS" accession="MS:1000511" name="ms level" value="{1}"/>
+<cvParam cvRef="MS" accession="{2}" name="scan polarity" value=""/>
+<cvParam cvRef="MS" accession="MS:1000528" name="lowest observed m/z" value="{4}"/>
+<cvParam cvRef="MS" accession="MS:1000527" name="highest observed m/z" value="{5}"/>
+<scanList count="1"><scan>
+<cvParam cvRef="MS" accession="MS:1000016" name="scan start time" value="{3}" unitAccession="UO:0000031"/>
+</scan></scanList>
+<binaryDataArrayList count="1"><binaryDataArray><binary>{6}</binary></binaryDataArray></binaryDataArrayList>
+</spectrum>
+'''.format(i, level, polarity, rt, low, high, PEAKS)
+
+
+# an mzML file with the test spectra, with an index of the spectra at its end if indexed
+def write_mzml(path, indexed=True, index_shift=0):
+    content = '<?xml version="1.0"?>\n<indexedmzML><mzML><run><spectrumList count="{}">\n'.format(len(SPECTRA))
+    offsets = []
+    for i, spectrum in enumerate(SPECTRA):
+        offsets.append(len(content))
+        content += mzml_spectrum(i, *spectrum)
+    content += '</spectrumList></run></mzML>\n'
+    if indexed:
+        index_offset = len(content)
+        content += '<indexList count="1"><index name="spectrum">\n'
+        content += ''.join('<offset idRef="scan={}">{}</offset>\n'.format(i, offset + index_shift)
+                           for i, offset in enumerate(offsets))
+        content += '</index></indexList>\n<indexListOffset>{}</indexListOffset>\n'.format(index_offset)
+    content += '</indexedmzML>\n'
+    with open(path, 'w', newline='') as mzml:
+        mzml.write(content)
+    return str(path)
+
+
+class TestRawScan:
+
+    # the headers of an indexed mzML give the counts and the range of the MS1 data in seconds
+    # T13.1
+    def test_mzml(self, tmp_path):
+        scan = rawscan.scan_raw(write_mzml(tmp_path / 'a.mzML'))
+        assert scan.error is None
+        assert scan.indexed
+        assert scan.spectra == 4
+        assert scan.ms_levels == {1: 2, 2: 2}
+        assert scan.polarities == {'positive': 4}
+        assert (scan.min_mz, scan.max_mz, scan.min_rt, scan.max_rt) == (350.0, 1500.25, 60.0, 150.0)
+        metadata = scan.metadata()
+        assert metadata['ms_levels'] == {'1': 2, '2': 2}
+        assert rawscan.data_bounds(metadata) == (350.0, 1500.25, 60.0, 150.0)
+        assert rawscan.describe(metadata) == \
+            '4 spectra (MS1 2, MS2 2), positive, m/z 350.0-1500.2, RT 60.0-150.0 s'
+
+    # without an index, or with one that does not point at the spectra, the spectra are found in the file
+    # T13.2
+    def test_mzml_without_index(self, tmp_path):
+        indexed = rawscan.scan_raw(write_mzml(tmp_path / 'a.mzML')).metadata()
+        for path in (write_mzml(tmp_path / 'b.mzML', indexed=False), write_mzml(tmp_path / 'c.mzML', index_shift=3)):
+            scan = rawscan.scan_raw(path)
+            assert not scan.indexed
+            assert dict(scan.metadata(), indexed=True) == indexed
+
+    # mzXML scans hold their details as attributes, the retention time as a duration
+    # T13.3
+    def test_mzxml(self, tmp_path):
+        path = tmp_path / 'a.mzXML'
+        path.write_text('''<mzXML><msRun scanCount="2">
+<scan num="1" msLevel="1" polarity="-" retentionTime="PT30.5S" lowMz="300" highMz="1600" peaksCount="1">
+<peaks>{0}</peaks>
+<scan num="2" msLevel="2" polarity="-" retentionTime="PT1M1S" lowMz="100" highMz="2000" peaksCount="1">
+<peaks>{0}</peaks></scan></scan>
+</msRun></mzXML>'''.format(PEAKS))
+        scan = rawscan.scan_raw(str(path))
+        assert (scan.spectra, scan.polarities) == (2, {'negative': 2})
+        assert (scan.min_mz, scan.max_mz, scan.min_rt, scan.max_rt) == (300.0, 1600.0, 30.5, 30.5)
+        assert rawscan.duration_seconds('PT1H2M3.5S') == 3723.5
+        assert rawscan.duration_seconds('12.5') == 12.5
+
+    # the window holds the data of all files in whole numbers, files that were not scanned are left out
+    # T13.4
+    def test_window(self, tmp_path):
+        assert rawscan.window([None]) is None
+        assert rawscan.window([(350.2, 1500.25, 60.5, 150.0), None, (400.0, 1800.5, 0.2, 120.0)]) == \
+            (350.0, 1801.0, 0.0, 150.0)
+        scans = rawscan.scan_raws([write_mzml(tmp_path / 'a.mzML'), str(tmp_path / 'missing.mzML')])
+        assert scans[str(tmp_path / 'a.mzML')].spectra == 4
+        assert scans[str(tmp_path / 'missing.mzML')].error
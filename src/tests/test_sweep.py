@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+from PyQt5.QtWidgets import QApplication
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import parameter_schema
+import pipeline
+import sweep
+
+
+# the dialogs need an application, which may already exist when other test files ran first
+@pytest.fixture(scope='module', autouse=True)
+def application():
+    return QApplication.instance() or QApplication(sys.argv)
+
+
+class TestSweep:
+
+    # values are listed or given as ranges with the stop included
+    # T12.1
+    def test_parse_values(self):
+        assert sweep.parse_values('10, 20,30', 'int') == [10, 20, 30]
+        assert sweep.parse_values('10:30:10, 5, 20', 'int') == [10, 20, 30, 5]
+        assert sweep.parse_values('0.1:0.3:0.1', 'float') == [0.1, 0.2, 0.3]
+        for text in ['', '5:1:1', '1:5:0', '1:5', 'a']:
+            with pytest.raises(ValueError):
+                sweep.parse_values(text, 'int')
+
+    # every combination of the values is a variant
+    # T12.2
+    def test_make_variants(self):
+        variants = sweep.make_variants({'warp2d_slack': [10, 20], 'link_n_sig_mz': [1.0, 2.0, 3.0]})
+        assert len(variants) == 6
+        assert variants[0] == {'warp2d_slack': 10, 'link_n_sig_mz': 1.0}
+        assert variants[-1] == {'warp2d_slack': 20, 'link_n_sig_mz': 3.0}
+
+    # the metrics of each variant come from its outputs, missing outputs have none
+    # T12.3
+    def test_compare(self, tmp_path):
+        variants = [{'metamatch_fraction': 0.5}, {'metamatch_fraction': 0.7}]
+        first = pipeline.variant_dir(str(tmp_path), 0)
+        os.makedirs(os.path.join(first, 'quant'))
+        os.makedirs(os.path.join(first, 'quality'))
+        with open(os.path.join(first, 'quant', 'feature_clusters_metadata.csv'), 'w') as metadata:
+            metadata.write('cluster_id,mz,psm_sequence\n0,400.1,PEPTIDE\n1,500.2,\n2,600.3,PEPTIDES\n')
+        with open(os.path.join(first, 'quality', 'similarity_warped_peaks.csv'), 'w') as similarity:
+            similarity.write(',a,b\na,1.0,0.5\nb,0.5,1.0\n')
+        header, rows = sweep.compare(str(tmp_path), variants)
+        assert header[:4] == ['Variant', 'Fraction of samples', 'Feature clusters', 'Identified feature clusters']
+        assert rows[0][:4] == ['variant_01', 0.5, 3, 2]
+        assert rows[0][-1] == 0.5
+        assert rows[1][2:] == [None] * len(sweep.METRICS)
+        assert (tmp_path / pipeline.SWEEP_DIR / sweep.COMPARISON_FILE).is_file()
+
+    # the sweep only runs with at least two variants that all have valid parameters
+    # T12.4
+    def test_dialog(self):
+        dialog = sweep.SweepDialog(parameter_schema.defaults())
+        ok = dialog.buttons.button(dialog.buttons.Ok)
+        assert not ok.isEnabled()
+        dialog.rows[0][1].setText('10, 20')
+        assert ok.isEnabled()
+        assert dialog.variants == [{'warp2d_slack': 10}, {'warp2d_slack': 20}]
+        dialog.rows[0][1].setText('-10, 20')
+        assert not ok.isEnabled()
+        assert 'Slack has to be at least 0' in dialog.status.text()
+        dialog.add_row('warp2d_window_size')
+        dialog.rows[0][1].setText('10, 20')
+        dialog.rows[1][1].setText('50:150:50')
+        assert len(dialog.variants) == 6
@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import parameter_schema
+import validation
+
+
+class TestValidator:
+
+    # the defaults meet every rule, missing parameters are checked with them
+    # T10.1
+    def test_defaults(self):
+        validator = validation.Validator()
+        assert validator.validate(parameter_schema.defaults()) == []
+        assert validator.validate({}) == []
+
+    # a rule over several parameters is shown at each of them and clears once it is met
+    # T10.2
+    def test_cross_field(self):
+        validator = validation.Validator()
+        assert validator.validate({'min_mz': 500, 'max_mz': 400}) == ['Min m/z has to be below max m/z.']
+        assert validator.key_errors('max_mz') == validator.key_errors('min_mz') == ['Min m/z has to be below max m/z.']
+        assert validator.validate({'min_mz': 500, 'max_mz': 400, 'num_samples_rt': 0}, ['num_samples_rt']) == [
+            'Min m/z has to be below max m/z.', 'Number of samples rt has to be at least 1.']
+        assert validator.validate({'min_mz': 300, 'max_mz': 400, 'num_samples_rt': 0}, ['min_mz']) == [
+            'Number of samples rt has to be at least 1.']
+
+    # values of the wrong type or out of the choices do not meet the rules
+    # T10.3
+    def test_wrong_values(self):
+        validator = validation.Validator()
+        errors = validator.validate({'resolution_ms1': 'high', 'polarity': 'any',
+                                     'feature_detection_charge_states': []})
+        assert errors == ['Resolution MS1 has to be above 0.',
+                          'Feature detection charge states are empty, set the min and max charge again.',
+                          'Polarity has to be one of positive, negative, both.']
+
+    # min and max charge are checked as their widgets show them, the charge states on their own
+    # T10.4
+    def test_charge_states(self):
+        validator = validation.Validator()
+        parts = {'feature_detection_charge_state_min': 3, 'feature_detection_charge_state_max': 2}
+        assert validator.validate({'feature_detection_charge_states': []}, parts=parts) == [
+            'Feature detection min charge has to be at most the max charge.']
+        assert validator.key_errors('feature_detection_charge_states') == [
+            'Feature detection min charge has to be at most the max charge.']
+        assert validator.validate({'feature_detection_charge_states': [3, 2]}) == []
+        assert validator.validate({'feature_detection_charge_states': [2, 1, 0]}) == [
+            'Feature detection charge states have to be at least 1.']
@@ -0,0 +1,136 @@
+import collections
+import parameter_schema
+
+
+class Rule:
+    """
+    A condition the parameters have to meet before the pipeline is worth running.
+    Values of the wrong type, like text in a hand edited parameters.json, do not meet any rule.
+
+    Arguments:
+    - keys of the parameters it reads, or the attribute names of the widgets of the parts of a parameter,
+      its error is shown at each of the parameters
+    - check, called with the values of the keys
+    - message when the check fails
+    """
+    def __init__(self, keys, check, message):
+        self.keys = keys
+        self.check = check
+        self.message = message
+
+    # message if the parameters do not meet the rule, None if they do
+    def error(self, parameters):
+        try:
+            valid = self.check(*(parameters.get(key) for key in self.keys))
+        except (TypeError, ValueError):
+            valid = False
+        return None if valid else self.message
+
+
+def label(key):
+    return next(field.label for field in parameter_schema.FIELDS if key in (field.key, field.name))
+
+
+def above(key, bound):
+    return Rule([key], lambda value: value > bound, '{} has to be above {}.'.format(label(key), bound))
+
+
+def at_least(key, bound):
+    return Rule([key], lambda value: value >= bound, '{} has to be at least {}.'.format(label(key), bound))
+
+
+def between(key, low, high):
+    return Rule([key], lambda value: low <= value <= high,
+                '{} has to be between {} and {}.'.format(label(key), low, high))
+
+
+def below(low, high):
+    return Rule([low, high], lambda low_value, high_value: low_value < high_value,
+                '{} has to be below {}.'.format(label(low), label(high).lower()))
+
+
+def one_of(field):
+    return Rule([field.key], lambda value: value in field.values,
+                '{} has to be one of {}.'.format(field.label, ', '.join(field.values)))
+
+
+RULES = [
+    above('resolution_ms1', 0),
+    above('resolution_msn', 0),
+    above('reference_mz', 0),
+    above('avg_fwhm_rt', 0),
+    at_least('min_mz', 0),
+    below('min_mz', 'max_mz'),
+    at_least('min_rt', 0),
+    below('min_rt', 'max_rt'),
+    at_least('num_samples_mz', 1),
+    at_least('num_samples_rt', 1),
+    above('smoothing_coefficient_mz', 0),
+    above('smoothing_coefficient_rt', 0),
+    at_least('max_peaks', 1),
+    above('grid_memory_budget', 0),
+    # min and max charge are checked as the widgets show them, their charge states are empty when min is above max
+    Rule(['feature_detection_charge_state_min', 'feature_detection_charge_state_max'], lambda low, high: low <= high,
+         'Feature detection min charge has to be at most the max charge.'),
+    Rule(['feature_detection_charge_states'], lambda states: all(state >= 1 for state in states),
+         'Feature detection charge states have to be at least 1.'),
+    Rule(['feature_detection_charge_states', 'feature_detection_charge_state_min',
+          'feature_detection_charge_state_max'], lambda states, low, high: len(states) > 0 or low > high,
+         'Feature detection charge states are empty, set the min and max charge again.'),
+    at_least('warp2d_slack', 0),
+    at_least('warp2d_window_size', 1),
+    at_least('warp2d_num_points', 1),
+    Rule(['warp2d_window_size', 'warp2d_num_points'], lambda window, points: window <= points,
+         'Window Size can not be larger than the number of points.'),
+    at_least('warp2d_rt_expand_factor', 0),
+    at_least('warp2d_peaks_per_window', 1),
+    between('metamatch_fraction', 0, 1),
+    above('metamatch_n_sig_mz', 0),
+    above('metamatch_n_sig_rt', 0),
+    above('link_n_sig_mz', 0),
+    above('link_n_sig_rt', 0),
+    at_least('similarity_num_peaks', 1),
+    at_least('quant_consensus_min_ident', 1),
+] + [one_of(field) for field in parameter_schema.FIELDS if field.kind == 'choice']
+
+# Rules that read each parameter, a change only checks these again
+RULES_BY_KEY = collections.defaultdict(list)
+PARAMETER_KEYS = {field.name: field.key for field in parameter_schema.PART_FIELDS}
+for index, rule in enumerate(RULES):
+    for key in dict.fromkeys(PARAMETER_KEYS.get(key, key) for key in rule.keys):
+        RULES_BY_KEY[key].append(index)
+
+
+class Validator:
+    """
+    Keeps the errors of the parameters up to date with the rules.
+    A change only checks the rules that read the changed parameters, so the errors can
+    follow every keystroke. Missing parameters are checked with their defaults.
+    The parts of a parameter are checked as their widgets show them, from the parameter where there are no widgets.
+    """
+    def __init__(self):
+        self.errors = {}
+
+    # checks the rules of the given keys again, all rules by default, returns the messages of all errors
+    # parts holds the values of the widgets of the parts of parameters that are built
+    def validate(self, parameters, keys=None, parts=None):
+        parameters = parameter_schema.complete(parameters)
+        parameters.update(parameter_schema.part_values(parameters), **(parts or {}))
+        if keys is None:
+            indexes = range(len(RULES))
+        else:
+            indexes = {index for key in keys for index in RULES_BY_KEY.get(key, [])}
+        for index in indexes:
+            error = RULES[index].error(parameters)
+            if error:
+                self.errors[index] = error
+            else:
+                self.errors.pop(index, None)
+        return self.messages()
+
+    def messages(self):
+        return [self.errors[index] for index in sorted(self.errors)]
+
+    # messages of the errors shown at the parameter
+    def key_errors(self, key):
+        return [self.errors[index] for index in RULES_BY_KEY.get(key, []) if index in self.errors]